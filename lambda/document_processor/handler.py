@@ -7,7 +7,13 @@ import json
 import boto3
 import os
 from datetime import datetime
-from decimal import Decimal
+
+from helmstream_common.answer_cache import ANSWER_CACHE_ENABLED, ANSWER_CACHE_TABLE, bump_generation
+from helmstream_common.batch_write import BatchWriter
+from helmstream_common.chunking import chunk_text
+from helmstream_common.embedding_codec import embedding_attributes
+from helmstream_common.lexical import lexical_attributes
+from helmstream_common.rate_control import run_adaptive
 
 # Initialize AWS clients
 bedrock = boto3.client('bedrock-runtime', region_name=os.environ.get('AWS_REGION', 'us-east-1'))
@@ -24,6 +30,10 @@ def lambda_handler(event, context):
     """
     Main handler for document processing
 
+    The document is stored once in S3 and indexed as overlapping chunks:
+    one DynamoDB item per chunk (document_id '<doc_id>#<chunk>'), each
+    with its own embedding and the byte range of its text in the object.
+
     Expected input:
     {
         "text": "document content...",
@@ -58,7 +68,14 @@ def lambda_handler(event, context):
         # Generate unique document ID
         doc_id = f"doc_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"
 
-        # Step 1: Store document text in S3
+        # Step 1: Split into overlapping chunks (byte offsets into the S3 object),
+        # before anything is written so an empty document leaves nothing behind
+        chunks = chunk_text(document_text)
+        if not chunks:
+            return error_response(400, "Document text is empty")
+        print(f"✓ Split into {len(chunks)} chunks")
+
+        # Step 2: Store document text in S3
         s3_key = f"documents/{document_type}/{doc_id}.txt"
         s3.put_object(
             Bucket=BUCKET_NAME,
@@ -74,29 +91,51 @@ def lambda_handler(event, context):
         s3_uri = f"s3://{BUCKET_NAME}/{s3_key}"
         print(f"✓ Document stored in S3: {s3_uri}")
 
-        # Step 2: Generate embedding using Bedrock Titan
-        print("Generating embedding...")
-        embedding = generate_embedding(document_text)
-        print(f"✓ Embedding generated ({len(embedding)} dimensions)")
-
-        # Step 3: Create text preview
-        text_preview = document_text[:500] if len(document_text) > 500 else document_text
-
-        # Step 4: Store in DynamoDB
-        table = dynamodb.Table(TABLE_NAME)
-        item = {
-            'document_id': doc_id,
-            'type': document_type,
-            'title': title,
-            's3_uri': s3_uri,
-            'metadata': metadata,
-            'embedding': [Decimal(str(x)) for x in embedding],  # Convert to Decimal for DynamoDB
-            'created_at': datetime.now().isoformat(),
-            'text_preview': text_preview
-        }
-
-        table.put_item(Item=item)
-        print(f"✓ Document metadata stored in DynamoDB: {doc_id}")
+        # Step 3: Generate one embedding per chunk using Bedrock Titan, on the
+        # adaptive ingest pool (backs off and retries when Bedrock throttles)
+        print("Generating embeddings...")
+        embeddings, controller = run_adaptive(lambda chunk: generate_embedding(f"{title}\n\n{chunk['text']}"), chunks)
+        print(f"[INGEST] {len(chunks)} chunk embeddings, {controller.summary()}")
+        # All or nothing: one failed chunk fails the document before any chunk is written
+        failures = [embedding for embedding in embeddings if isinstance(embedding, Exception)]
+        if failures:
+            raise RuntimeError(f"{len(failures)} of {len(chunks)} chunks could not be embedded: {failures[0]}")
+        created_at = datetime.now().isoformat()
+        items = []
+        for chunk, embedding in zip(chunks, embeddings):
+            items.append({
+                'document_id': f"{doc_id}#{chunk['index']:04d}",
+                'source_document_id': doc_id,
+                'chunk_index': chunk['index'],
+                'chunk_count': len(chunks),
+                'byte_start': chunk['byte_start'],
+                'byte_end': chunk['byte_end'],
+                'type': document_type,
+                'title': title,
+                's3_uri': s3_uri,
+                'metadata': metadata,
+                **embedding_attributes(embedding),  # Packed unit vector + embedding_norm (see embedding_codec)
+                'created_at': created_at,
+                'text_preview': chunk['text'][:500],
+                **lexical_attributes(f"{title}\n{chunk['text']}")  # BM25 term counts over the whole chunk
+            })
+        print(f"✓ Embeddings generated ({len(chunks)} x {len(embedding)} dimensions)")
+
+        # Step 4: Store the chunks in DynamoDB (BatchWriteItem, 25 per request)
+        with BatchWriter(dynamodb.Table(TABLE_NAME), ['document_id']) as writer:
+            for item in items:
+                writer.put(item)
+        print(f"[WRITE] {writer}")
+        if writer.failed:
+            raise RuntimeError(f"{len(writer.failed)} of {len(items)} chunks could not be stored: {writer.failed[0][1]}")
+        print(f"✓ {len(items)} chunks stored in DynamoDB: {doc_id}")
+
+        # Retire cached RAG answers computed without this document
+        if ANSWER_CACHE_ENABLED and ANSWER_CACHE_TABLE:
+            try:
+                bump_generation(dynamodb.Table(ANSWER_CACHE_TABLE), 'documents')
+            except Exception as e:
+                print(f"⚠️  Could not invalidate cached answers: {str(e)}")
 
         # Return success response
         return {
@@ -111,8 +150,9 @@ def lambda_handler(event, context):
                 's3_uri': s3_uri,
                 'type': document_type,
                 'title': title,
+                'chunks': len(chunks),
                 'embedding_dimensions': len(embedding),
-                'created_at': item['created_at']
+                'created_at': created_at
             })
         }
 
@@ -4,11 +4,22 @@ HelmStream - Email Processor Lambda Function
 Processes shipyard emails with stakeholder metadata and generates embeddings
 """
 
+import hashlib
 import json
 import boto3
 import os
+import time as clock
 from datetime import datetime
-from decimal import Decimal
+
+from botocore.exceptions import ClientError
+
+from helmstream_common.answer_cache import ANSWER_CACHE_ENABLED, ANSWER_CACHE_TABLE, bump_generation
+from helmstream_common.batch_write import BatchWriter
+from helmstream_common.embedding_codec import embedding_attributes
+from helmstream_common.lexical import lexical_attributes
+from helmstream_common.planner import PLANNER_ENABLED, PLANNER_STATS_TABLE, record_ingest
+from helmstream_common.rate_control import is_throttle, run_adaptive
+from helmstream_common.tombstones import TOMBSTONE_TABLE, record_deletion
 
 # AWS clients
 bedrock_runtime = boto3.client('bedrock-runtime', region_name=os.environ.get('AWS_REGION', 'us-east-1'))
@@ -20,6 +31,14 @@ DYNAMODB_TABLE_NAME = os.environ.get('DYNAMODB_TABLE_NAME', 'helmstream-emails')
 S3_BUCKET_NAME = os.environ.get('S3_BUCKET_NAME')
 BEDROCK_TITAN_EMBED_MODEL_ID = os.environ.get('BEDROCK_TITAN_EMBED_MODEL_ID', 'amazon.titan-embed-text-v1')
 
+# Query filter name -> email attribute counted for the retrieval planner
+STAT_DIMENSIONS = {
+    'vessel': 'vessel_involved',
+    'sender_role': 'sender_role',
+    'month': 'month',
+    'event_category': 'event_category'
+}
+
 
 def generate_embedding(text):
     """Generate embedding using Amazon Titan"""
@@ -35,8 +54,57 @@ def generate_embedding(text):
         raise
 
 
-def process_single_email(email_data):
-    """Process a single email and store in DynamoDB"""
+def identity_hash(date, time, sender, subject):
+    """SHA-256 of what identifies an email (not its body), so a corrected email keeps its ID"""
+    identity = '\n'.join(field.strip() for field in (date, time, sender, subject))
+    return hashlib.sha256(identity.encode('utf-8')).hexdigest()
+
+
+def content_hash(rich_text):
+    """SHA-256 of an email's rich text with line endings and trailing whitespace canonicalized"""
+    canonical = '\n'.join(line.rstrip() for line in rich_text.strip().splitlines())
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def retire_legacy_email(client, legacy_id, item):
+    """
+    Delete the pre-hash copy of an email (keyed by date and time alone)
+
+    Only an item without a content_hash and with the same sender and
+    subject is removed, so a different email that collided on the old
+    key is left alone. Returns the deleted item, or None.
+    """
+    try:
+        response = client.delete_item(
+            TableName=DYNAMODB_TABLE_NAME,
+            Key={'email_id': legacy_id},
+            ConditionExpression='attribute_not_exists(content_hash) AND sender = :sender AND subject = :subject',
+            ExpressionAttributeValues={':sender': item['sender'], ':subject': item['subject']},
+            ReturnValues='ALL_OLD'
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return None
+        raise
+    return response.get('Attributes')
+
+
+def process_single_email(email_data, writer=None):
+    """
+    Process a single email and store in DynamoDB
+
+    The email_id is derived from the email's identity (date, time, sender
+    and subject), so a corrected body overwrites the earlier version and
+    moves its planner counts. The stored content_hash lets re-ingesting
+    an unchanged email stop after one GetItem, skipping both the Titan
+    call and the write.
+
+    Returns (result, pending). Without a writer the item is put and its
+    follow-up (legacy retirement, planner counts) applied here, and
+    pending is None. With a BatchWriter the item is only buffered, so
+    pending carries that follow-up for apply_email_write once the caller
+    has flushed the writer and knows the item was written.
+    """
     date = email_data.get('date', '')
     time = email_data.get('time', '')
     sender = email_data.get('sender', '')
@@ -44,13 +112,12 @@ def process_single_email(email_data):
     recipients = email_data.get('recipients', [])
     subject = email_data.get('subject', '')
     body = email_data.get('body', '')
-    email_type = email_data.get('email_type', 'operational')
+    email_type = email_data.get('email_type') or 'operational'  # email-type-created-index key: never empty
     month = email_data.get('month', '')
     vessel_involved = email_data.get('vessel_involved', '')
     event_category = email_data.get('event_category', 'operational')
 
     timestamp = f"{date}T{time}" if date and time else datetime.utcnow().isoformat()
-    email_id = f"email_{date.replace('-', '')}_{time.replace(':', '')}" if date and time else f"email_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}"
 
     rich_text = f"""
 Sender: {sender} ({sender_role})
@@ -63,12 +130,37 @@ Category: {event_category}
 {body}
     """.strip()
 
+    # Stable, collision-free ID: same-minute emails differ in sender or subject
+    digest = content_hash(rich_text)
+    identity = identity_hash(date, time, sender, subject)
+    legacy_id = f"email_{date.replace('-', '')}_{time.replace(':', '')}" if date and time else None
+    email_id = f"{legacy_id}_{identity[:12]}" if legacy_id else f"email_{identity[:16]}"
+    summary = {
+        'email_id': email_id,
+        'sender': sender,
+        'subject': subject,
+        'vessel': vessel_involved
+    }
+
+    # Runs on run_adaptive workers: the resource's low-level client is safe to share, the resource is not
+    client = dynamodb.meta.client
+    # The planner attributes come along so a rewrite can move its counts without ReturnValues
+    existing = client.get_item(
+        TableName=DYNAMODB_TABLE_NAME,
+        Key={'email_id': email_id},
+        ProjectionExpression=', '.join(['content_hash'] + [f'#{name}' for name in STAT_DIMENSIONS]),
+        ExpressionAttributeNames={f'#{name}': attribute for name, attribute in STAT_DIMENSIONS.items()}
+    ).get('Item')
+    if existing and existing.get('content_hash') == digest:
+        print(f"Unchanged, skipping: {email_id}")
+        return dict(summary, status='unchanged'), None
+
     print(f"Generating embedding for email: {email_id}")
     embedding = generate_embedding(rich_text)
 
-    table = dynamodb.Table(DYNAMODB_TABLE_NAME)
     item = {
         'email_id': email_id,
+        'content_hash': digest,
         'timestamp': timestamp,
         'date': date,
         'time': time,
@@ -82,23 +174,67 @@ Category: {event_category}
         'vessel_involved': vessel_involved,
         'event_category': event_category,
         'month': month,
-        'embedding': [Decimal(str(x)) for x in embedding],
+        **embedding_attributes(embedding),  # Unit vector + embedding_norm
+        **lexical_attributes(f"{subject}\n{body}"),  # BM25 term counts over the full body
         'created_at': datetime.utcnow().isoformat()
     }
+    # GSI key attributes cannot be empty strings; vessel-less emails stay out of that index
+    if not vessel_involved:
+        del item['vessel_involved']
+
+    result = dict(summary, status='updated' if existing else 'created')
+    pending = {'item': item, 'existing': existing, 'legacy_id': legacy_id}
+    if writer is not None:
+        writer.put(item)
+        return result, pending
 
     print(f"Storing email in DynamoDB: {email_id}")
-    table.put_item(Item=item)
+    client.put_item(TableName=DYNAMODB_TABLE_NAME, Item=item)
+    apply_email_write(pending)
+    return result, None
 
-    return {
-        'email_id': email_id,
-        'sender': sender,
-        'subject': subject,
-        'vessel': vessel_involved
-    }
+
+def apply_email_write(pending):
+    """
+    Follow-up of a stored email: retire its legacy copy and move the planner counts
+
+    Only run once the item is known to be in the table, so a failed write
+    never loses the legacy copy or skews the statistics.
+    """
+    item, legacy_id = pending['item'], pending['legacy_id']
+    retired = retire_legacy_email(dynamodb.meta.client, legacy_id, item) if legacy_id else None
+    if retired:
+        print(f"Replaced legacy item: {legacy_id}")
+        # Warm RAG indexes only learn about deletes from the tombstone
+        try:
+            record_deletion(dynamodb.Table(TOMBSTONE_TABLE), 'emails', legacy_id)
+        except Exception as e:
+            print(f"⚠️  Could not record the deletion of {legacy_id}; it stays in warm indexes "
+                  f"until their next full load: {str(e)}")
+
+    # Keep the planner's per-value counts in step (a re-ingest moves counts, not adds)
+    if PLANNER_ENABLED:
+        try:
+            stats_table = dynamodb.Table(PLANNER_STATS_TABLE)
+            record_ingest(stats_table, pending['existing'], item, STAT_DIMENSIONS)
+            if retired:
+                record_ingest(stats_table, retired, None, STAT_DIMENSIONS)
+        except Exception as e:
+            print(f"⚠️  Could not update planner statistics: {str(e)}")
 
 
 def lambda_handler(event, context):
-    """Lambda handler for processing emails"""
+    """
+    Lambda handler for processing emails
+
+    Emails are processed on a bounded pool whose concurrency backs off when
+    Bedrock throttles and ramps up while calls succeed; throttled emails
+    are retried, and each email still reports its own result or error.
+    Items are written with BatchWriteItem, 25 per request, and flushed
+    before the handler returns; an email whose write failed reports it,
+    and only written emails retire their legacy copy and move the
+    planner counts.
+    """
     try:
         if 'emails' in event:
             emails = event['emails']
@@ -107,20 +243,52 @@ def lambda_handler(event, context):
         else:
             emails = [event]
 
+        started = clock.perf_counter()
+        writer = BatchWriter(dynamodb.Table(DYNAMODB_TABLE_NAME), ['email_id'])
+        try:
+            outcomes, controller = run_adaptive(lambda email_data: process_single_email(email_data, writer), emails)
+        finally:
+            writer.flush()
+        unwritten = {item['email_id']: error for item, error in writer.failed}
         results = []
-        for email_data in emails:
-            try:
-                result = process_single_email(email_data)
+        for email_data, outcome in zip(emails, outcomes):
+            if not isinstance(outcome, Exception):
+                result, pending = outcome
+                if result['email_id'] in unwritten:
+                    outcome = RuntimeError(f"Write failed: {unwritten[result['email_id']]}")
+                elif pending is not None:
+                    try:
+                        apply_email_write(pending)
+                    except Exception as e:
+                        print(f"⚠️  Stored {result['email_id']} but could not retire its legacy copy: {str(e)}")
+            if isinstance(outcome, Exception):
+                print(f"Error processing email{' (throttled)' if is_throttle(outcome) else ''}: {str(outcome)}")
+                results.append({'error': str(outcome), 'email_data': email_data})
+            else:
                 results.append(result)
+        elapsed = clock.perf_counter() - started
+
+        unchanged = sum(1 for result in results if result.get('status') == 'unchanged')
+        print(f"Processed {len(results)} emails: {unchanged} unchanged (no embedding, no write)")
+        print(f"[INGEST] {len(results)} emails in {elapsed:.2f} s "
+              f"({len(results) / elapsed if elapsed > 0 else 0:.1f} emails/sec), {controller.summary()}")
+        print(f"[WRITE] {writer}")
+
+        # Retire cached RAG answers once per batch that changed the corpus
+        if ANSWER_CACHE_ENABLED and ANSWER_CACHE_TABLE and any(result.get('status') in ('created', 'updated') for result in results):
+            try:
+                bump_generation(dynamodb.Table(ANSWER_CACHE_TABLE), 'emails')
             except Exception as e:
-                print(f"Error processing email: {str(e)}")
-                results.append({'error': str(e), 'email_data': email_data})
+                print(f"⚠️  Could not invalidate cached answers: {str(e)}")
 
         return {
             'statusCode': 200,
             'body': json.dumps({
                 'message': f'Processed {len(results)} emails',
                 'emails_processed': len(results),
+                'emails_unchanged': unchanged,
+                'emails_per_second': round(len(results) / elapsed, 2) if elapsed > 0 else None,
+                'throttles': controller.throttles,
                 'results': results
             })
         }
@@ -0,0 +1,5 @@
+"""
+HelmStream - Shared Lambda code
+Retrieval and ingestion helpers bundled into every function package by
+setup/02_deploy_lambda_functions.sh
+"""
@@ -0,0 +1,215 @@
+"""
+HelmStream - Approximate Nearest-Neighbour Index
+Inverted-file (IVF) index over an embedding matrix: rows are bucketed by
+their nearest k-means centroid, and a query scores only the rows in its
+nprobe closest buckets (exactly) before taking the top-k.
+approximate_index() picks it or the quantized index from ANN_METHOD
+"""
+
+import math
+import os
+import time
+from itertools import chain
+
+from helmstream_common.quantized import QuantizedIndex
+from helmstream_common.scan import TopK
+
+try:
+    import numpy as np
+except ImportError:  # The IVF index needs NumPy; without it search stays exact
+    np = None
+
+ANN_ENABLED = os.environ.get('ANN_ENABLED', 'false').lower() == 'true'
+# 'ivf' (bucketed float rows) or 'quantized' (int8 + sign-bit codes)
+ANN_METHOD = os.environ.get('ANN_METHOD', 'ivf')
+# Number of buckets; 0 picks about sqrt(rows)
+ANN_NLIST = int(os.environ.get('ANN_NLIST', '0'))
+# Buckets scored per query: higher means better recall and slower queries
+ANN_NPROBE = int(os.environ.get('ANN_NPROBE', '16'))
+# Corpora, or filtered row sets, smaller than this are searched exactly
+ANN_MIN_ROWS = int(os.environ.get('ANN_MIN_ROWS', '20000'))
+
+# k-means training budget: points per bucket and Lloyd iterations
+TRAIN_POINTS_PER_LIST = 64
+TRAIN_ITERATIONS = 8
+ASSIGN_CHUNK_ROWS = 8192
+
+
+def train_centroids(vectors, nlist, seed=0):
+    """Spherical k-means centroids (unit length) for an (n, dim) float array"""
+    rng = np.random.default_rng(seed)
+    if len(vectors) > nlist * TRAIN_POINTS_PER_LIST:
+        vectors = vectors[rng.choice(len(vectors), nlist * TRAIN_POINTS_PER_LIST, replace=False)]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    train = (vectors / np.where(norms > 0, norms, 1.0)).astype(np.float32)
+
+    centroids = train[rng.choice(len(train), nlist, replace=False)].copy()
+    for _ in range(TRAIN_ITERATIONS):
+        assignment = np.argmax(train @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, train)
+        empty = np.bincount(assignment, minlength=nlist) == 0
+        if empty.any():
+            # Reseed empty buckets from random training points
+            sums[empty] = train[rng.choice(len(train), int(empty.sum()))]
+        lengths = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = (sums / np.where(lengths > 0, lengths, 1.0)).astype(np.float32)
+    return centroids
+
+
+class IVFIndex:
+    """
+    Inverted-file index over the rows of a NumpyMatrix
+
+    Buckets hold row numbers only; candidates are always re-scored against
+    the full-precision matrix, so scores match exact search and only recall
+    is approximate. Rows are added and removed incrementally as the
+    embedding index changes; centroids are retrained once the corpus has
+    doubled (or halved) since they were fitted. Zero-norm and irregular
+    rows never land in a bucket and are always scored.
+    """
+
+    def __init__(self, nlist=None, nprobe=None, min_rows=None, seed=0):
+        self.nlist = ANN_NLIST if nlist is None else nlist
+        self.nprobe = ANN_NPROBE if nprobe is None else nprobe
+        self.min_rows = ANN_MIN_ROWS if min_rows is None else min_rows
+        self.seed = seed
+        self.centroids = None
+        self.trained_rows = 0
+        self.lists = []
+        self.assignment = {}
+        self.counters = {
+            'ann_searches': 0,
+            'exact_searches': 0,
+            'candidates_total': 0,
+            'builds': 0,
+            'trainings': 0,
+            'last_build_ms': 0.0
+        }
+        if np is None and ANN_ENABLED:
+            print("⚠️  ANN_ENABLED is set but NumPy is not installed; using exact search")
+
+    @property
+    def trained(self):
+        return self.centroids is not None
+
+    def __len__(self):
+        return len(self.assignment)
+
+    def _nearest(self, vectors):
+        """Nearest centroid per row; argmax of the raw dot product needs no row normalization"""
+        buckets = [np.argmax(vectors[i:i + ASSIGN_CHUNK_ROWS] @ self.centroids.T, axis=1)
+                   for i in range(0, len(vectors), ASSIGN_CHUNK_ROWS)]
+        return np.concatenate(buckets) if buckets else np.zeros(0, dtype=np.intp)
+
+    def build(self, matrix):
+        """(Re)bucket every row of matrix, retraining centroids when the corpus size has drifted"""
+        self.lists = []
+        self.assignment = {}
+        if np is None or getattr(matrix, 'backend', None) != 'numpy':
+            self.centroids = None
+            return
+
+        live = np.flatnonzero(matrix.norms > 0)
+        if len(live) < self.min_rows:
+            self.centroids = None
+            return
+
+        started = time.perf_counter()
+        nlist = self.nlist or int(min(4096, max(16, math.sqrt(len(live)))))
+        vectors = matrix.rows[live]
+        if (self.centroids is None or len(self.centroids) != nlist
+                or len(live) > 2 * self.trained_rows or 2 * len(live) < self.trained_rows):
+            self.centroids = train_centroids(vectors, nlist, self.seed)
+            self.trained_rows = len(live)
+            self.counters['trainings'] += 1
+
+        buckets = self._nearest(vectors)
+        self.lists = [[] for _ in range(nlist)]
+        for row, bucket in zip(live.tolist(), buckets.tolist()):
+            self.lists[bucket].append(row)
+            self.assignment[row] = bucket
+
+        elapsed = (time.perf_counter() - started) * 1000
+        self.counters['builds'] += 1
+        self.counters['last_build_ms'] = round(elapsed, 1)
+        print(f"[ANN] Bucketed {len(live)} rows into {nlist} lists in {elapsed:.0f} ms")
+
+    def needs_build(self, matrix):
+        """True once an untrained index has enough rows, or the corpus doubled since training"""
+        if np is None or getattr(matrix, 'backend', None) != 'numpy':
+            return False
+        if not self.trained:
+            return len(matrix) - len(matrix.irregular) >= self.min_rows
+        return len(self.assignment) > 2 * self.trained_rows
+
+    def add(self, matrix, row):
+        """Bucket (or re-bucket) one row after it was appended or replaced"""
+        if not self.trained:
+            return
+        self.remove(row)
+        if matrix.norms[row] > 0:
+            bucket = int(np.argmax(self.centroids @ matrix.vector(row)))
+            self.lists[bucket].append(row)
+            self.assignment[row] = bucket
+
+    def remove(self, row):
+        bucket = self.assignment.pop(row, None)
+        if bucket is not None:
+            self.lists[bucket].remove(row)
+
+    def candidates(self, matrix, query, rows=None):
+        """
+        Sorted candidate rows for query, or None when exact search is the better plan
+
+        Exact search wins when the index is untrained or rows (a filter's
+        survivors) is already smaller than min_rows.
+        """
+        if not self.trained or len(query) != matrix.dim:
+            return None
+        if rows is not None and len(rows) < self.min_rows:
+            return None
+
+        q = np.asarray(query, dtype=np.float32)
+        closeness = self.centroids @ q
+        nprobe = min(self.nprobe, len(self.lists))
+        probe = np.argpartition(-closeness, nprobe - 1)[:nprobe]
+        found = np.fromiter(chain.from_iterable(self.lists[b] for b in probe.tolist()), dtype=np.intp)
+        if matrix.irregular:
+            found = np.concatenate([found, np.fromiter(matrix.irregular, dtype=np.intp)])
+        if rows is not None:
+            found = found[np.isin(found, np.asarray(rows, dtype=np.intp))]
+        found.sort()
+        return found.tolist()
+
+    def search(self, matrix, query, top_k, rows=None):
+        """(score, row) pairs from the probed buckets, or None to signal a fall back to exact search"""
+        candidates = self.candidates(matrix, query, rows)
+        if candidates is None or len(candidates) < top_k:
+            self.counters['exact_searches'] += 1
+            return None
+        self.counters['ann_searches'] += 1
+        self.counters['candidates_total'] += len(candidates)
+        top = TopK(top_k)
+        top.extend(matrix.scores_for(query, candidates), candidates)
+        return top.results()
+
+    def stats(self):
+        return dict(
+            self.counters,
+            lists=len(self.lists),
+            nprobe=self.nprobe,
+            indexed_rows=len(self.assignment),
+            mean_candidates=round(self.counters['candidates_total'] / self.counters['ann_searches'], 1)
+            if self.counters['ann_searches'] else 0.0
+        )
+
+
+def approximate_index(method=None):
+    """The approximate index selected by ANN_METHOD, for EmbeddingIndex(ann=...)"""
+    method = method or ANN_METHOD
+    if method == 'quantized':
+        return QuantizedIndex(min_rows=ANN_MIN_ROWS)
+    if method == 'ivf':
+        return IVFIndex()
+    raise ValueError(f"Unknown ANN_METHOD: {method}")
@@ -0,0 +1,174 @@
+"""
+HelmStream - Answer Cache
+Complete RAG responses cached per corpus generation: an in-process LRU and
+a shared DynamoDB table for exact repeats, plus an optional in-process
+semantic tier for near-identical questions. Ingestion bumps the corpus
+generation, which retires every answer computed before it.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from helmstream_common.embedding_cache import normalize_query
+from helmstream_common.similarity import score_corpus
+
+ANSWER_CACHE_ENABLED = os.environ.get('ANSWER_CACHE_ENABLED', 'true').lower() == 'true'
+ANSWER_CACHE_TABLE = os.environ.get('ANSWER_CACHE_TABLE', 'helmstream-answer-cache')
+# Answers kept in memory per container
+ANSWER_CACHE_SIZE = int(os.environ.get('ANSWER_CACHE_SIZE', '256'))
+ANSWER_CACHE_TTL_SECONDS = int(os.environ.get('ANSWER_CACHE_TTL_SECONDS', '86400'))
+# Serve a cached answer to a differently worded question whose embedding is this close
+ANSWER_CACHE_SEMANTIC = os.environ.get('ANSWER_CACHE_SEMANTIC', 'false').lower() == 'true'
+ANSWER_CACHE_SEMANTIC_THRESHOLD = float(os.environ.get('ANSWER_CACHE_SEMANTIC_THRESHOLD', '0.97'))
+
+
+def _digest(payload):
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def answer_scope(corpus, filters, top_k, model_ids, context_tokens=None):
+    """Everything but the question that shapes an answer; semantic matches stay within one scope"""
+    return _digest([corpus, filters or {}, int(top_k), list(model_ids), context_tokens])
+
+
+def answer_key(scope, query):
+    return _digest([scope, normalize_query(query)])
+
+
+def generation_key(corpus):
+    return f"generation#{corpus}"
+
+
+def bump_generation(table, corpus):
+    """Retire every cached answer for corpus (called by ingestion after a write)"""
+    table.update_item(
+        Key={'cache_key': generation_key(corpus)},
+        UpdateExpression='ADD generation :one',
+        ExpressionAttributeValues={':one': 1}
+    )
+
+
+class AnswerCache:
+    """
+    Cached responses for one corpus, valid only for the generation they were computed at
+
+    Read generation() before retrieval and store the answer under that
+    value, so an ingest that lands mid-request retires it. Entries from
+    older generations are never served and age out of the LRU and the
+    table (DynamoDB TTL on expires_at). Without a readable generation
+    the cache is bypassed.
+    """
+
+    def __init__(self, corpus, table_factory, size=None, ttl_seconds=None):
+        self.corpus = corpus
+        self.table_factory = table_factory if ANSWER_CACHE_TABLE else None
+        self.size = ANSWER_CACHE_SIZE if size is None else size
+        self.ttl_seconds = ANSWER_CACHE_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._stats = {'lookups': 0, 'memory_hits': 0, 'table_hits': 0, 'semantic_hits': 0, 'stores': 0}
+
+    def generation(self):
+        """Current corpus generation, or None when the cache should be bypassed"""
+        if not ANSWER_CACHE_ENABLED:
+            return None
+        if self.table_factory is None:
+            return 0
+        try:
+            item = self.table_factory().get_item(Key={'cache_key': generation_key(self.corpus)}).get('Item')
+        except Exception as e:
+            print(f"⚠️  Answer cache generation unavailable: {str(e)}")
+            return None
+        return int(item.get('generation', 0)) if item else 0
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def _hit(self, tier, generation, similarity=None):
+        with self._lock:
+            self._stats[f'{tier}_hits'] += 1
+        match = '' if similarity is None else f" at similarity {similarity:.3f}"
+        print(f"[ANSWER CACHE] {tier} hit{match} (generation {generation}) | {self.summary()}")
+
+    def get(self, key, generation):
+        """Cached response for an exact repeat at this generation, or None"""
+        if generation is None:
+            return None
+        with self._lock:
+            self._stats['lookups'] += 1
+            entry = self._entries.get(key)
+        if entry is not None and entry['generation'] == generation:
+            self._hit('memory', generation)
+            return dict(entry['response'], cached=True, cache_tier='memory')
+
+        if self.table_factory is not None:
+            try:
+                item = self.table_factory().get_item(Key={'cache_key': key}).get('Item')
+            except Exception as e:
+                print(f"⚠️  Answer cache read failed: {str(e)}")
+                item = None
+            if item and int(item['generation']) == generation and int(item.get('expires_at', 0)) >= time.time():
+                response = json.loads(item['response'])
+                self._remember(key, {'scope': item['scope'], 'generation': generation,
+                                     'embedding': None, 'response': response})
+                self._hit('table', generation)
+                return dict(response, cached=True, cache_tier='table')
+        return None
+
+    def get_similar(self, scope, embedding, generation):
+        """Cached response for a near-identical question in the same scope, or None"""
+        if generation is None or not ANSWER_CACHE_SEMANTIC:
+            return None
+        with self._lock:
+            candidates = [entry for entry in self._entries.values()
+                          if entry['scope'] == scope and entry['generation'] == generation and entry['embedding']]
+        if candidates:
+            scores = score_corpus(embedding, [entry['embedding'] for entry in candidates])
+            best = max(range(len(candidates)), key=lambda i: scores[i])
+            if scores[best] >= ANSWER_CACHE_SEMANTIC_THRESHOLD:
+                self._hit('semantic', generation, float(scores[best]))
+                return dict(candidates[best]['response'], cached=True, cache_tier='semantic',
+                            cache_similarity=round(float(scores[best]), 4))
+        return None
+
+    def put(self, key, scope, generation, response, embedding=None):
+        """Store a freshly computed response under the generation read before computing it"""
+        if generation is None:
+            return
+        with self._lock:
+            self._stats['stores'] += 1
+        self._remember(key, {'scope': scope, 'generation': generation,
+                             'embedding': list(embedding) if ANSWER_CACHE_SEMANTIC and embedding is not None else None,
+                             'response': response})
+        if self.table_factory is not None:
+            try:
+                self.table_factory().put_item(Item={
+                    'cache_key': key,
+                    'scope': scope,
+                    'generation': generation,
+                    'response': json.dumps(response),
+                    'expires_at': int(time.time() + self.ttl_seconds)
+                })
+            except Exception as e:
+                print(f"⚠️  Answer cache write failed: {str(e)}")
+        print(f"[ANSWER CACHE] stored (generation {generation}) | {self.summary()}")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, entries=len(self._entries))
+        hits = stats['memory_hits'] + stats['table_hits'] + stats['semantic_hits']
+        stats['hit_rate'] = round(hits / stats['lookups'], 3) if stats['lookups'] else 0.0
+        return stats
+
+    def summary(self):
+        stats = self.stats()
+        return (f"hit rate {stats['hit_rate']:.0%} ({stats['memory_hits']} memory, {stats['table_hits']} table, "
+                f"{stats['semantic_hits']} semantic, {stats['stores']} stored)")
@@ -0,0 +1,63 @@
+"""
+HelmStream - Batch Queries
+Shared plumbing for {"queries": [...]} requests: validating the entries,
+running per-question work on a bounded pool, and totalling token usage
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+BATCH_MAX_QUERIES = int(os.environ.get('BATCH_MAX_QUERIES', '25'))
+# Concurrent Bedrock calls per batch (embeddings, then Claude generations)
+BATCH_MAX_WORKERS = int(os.environ.get('BATCH_MAX_WORKERS', '4'))
+
+
+def batch_items(body, defaults):
+    """
+    One dict per entry of body['queries'], with 'message' and every key of defaults
+
+    Entries are question strings or objects with a 'message' (or 'query')
+    and optional per-question overrides of defaults; batch-level values in
+    body override defaults too. Raises ValueError for a malformed batch.
+    """
+    queries = body.get('queries')
+    if not isinstance(queries, list) or not queries:
+        raise ValueError("'queries' must be a non-empty list")
+    if len(queries) > BATCH_MAX_QUERIES:
+        raise ValueError(f"At most {BATCH_MAX_QUERIES} queries per batch (got {len(queries)})")
+
+    shared = {key: body.get(key, value) for key, value in defaults.items()}
+    items = []
+    for number, entry in enumerate(queries):
+        entry = {'message': entry} if isinstance(entry, str) else dict(entry)
+        message = entry.pop('message', None) or entry.pop('query', None)
+        if not message:
+            raise ValueError(f"Query {number} has no 'message'")
+        items.append(dict(shared, **entry, message=message))
+    return items
+
+
+def run_bounded(fn, items, max_workers=None):
+    """fn(item) for every item on at most max_workers threads, in order; a failure yields its exception"""
+    def call(item):
+        try:
+            return fn(item)
+        except Exception as e:
+            return e
+
+    items = list(items)
+    if len(items) <= 1:
+        return [call(item) for item in items]
+    workers = min(max_workers or BATCH_MAX_WORKERS, len(items))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='batch') as executor:
+        return list(executor.map(call, items))
+
+
+def total_token_usage(responses):
+    """Summed input and output tokens over the responses that carry token_usage"""
+    totals = {'input_tokens': 0, 'output_tokens': 0}
+    for response in responses:
+        usage = response.get('token_usage') or {}
+        for key in totals:
+            totals[key] += int(usage.get(key, 0))
+    return totals
@@ -0,0 +1,123 @@
+"""
+HelmStream - Buffered Batch Writes
+Puts collected into BatchWriteItem requests of up to 25 items, flushed
+on size or age, with UnprocessedItems retried under jittered backoff
+"""
+
+import os
+import random
+import threading
+import time
+
+# BatchWriteItem accepts at most 25 put or delete requests
+BATCH_WRITE_LIMIT = 25
+# A put waits at most this long in the buffer before the next put flushes it
+BATCH_WRITE_FLUSH_SECONDS = float(os.environ.get('BATCH_WRITE_FLUSH_SECONDS', '1.0'))
+# UnprocessedItems retry budget and full-jitter backoff bounds (seconds)
+BATCH_WRITE_MAX_ATTEMPTS = 8
+BATCH_WRITE_BACKOFF_BASE = 0.05
+BATCH_WRITE_BACKOFF_CAP = 2.0
+
+
+class BatchWriter:
+    """
+    Buffered puts into one table, safe to share across threads
+
+    A put flushes once BATCH_WRITE_LIMIT items are waiting or the oldest
+    has waited max_wait_seconds; flush() sends whatever is left and must
+    run before the handler returns (or use the writer as a context
+    manager). A later put of the same key replaces the buffered one, as
+    BatchWriteItem rejects duplicate keys in a request.
+
+    Items still unprocessed after BATCH_WRITE_MAX_ATTEMPTS, or in a
+    request that failed outright, are kept in failed as (item, error) and
+    never raised, so callers can report them per record.
+    """
+
+    def __init__(self, table, key_names, max_items=None, max_wait_seconds=None):
+        self.table = table
+        self.key_names = list(key_names)
+        self.max_items = min(BATCH_WRITE_LIMIT, max_items or BATCH_WRITE_LIMIT)
+        self.max_wait_seconds = BATCH_WRITE_FLUSH_SECONDS if max_wait_seconds is None else max_wait_seconds
+        self.failed = []
+        self.requests = 0
+        self.items = 0
+        self.retries = 0
+        self.consumed_capacity = 0.0
+        self._buffer = {}
+        self._oldest = None
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+
+    def put(self, item):
+        key = tuple(item[name] for name in self.key_names)
+        with self._lock:
+            self._buffer[key] = item
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            due = (len(self._buffer) >= self.max_items
+                   or time.monotonic() - self._oldest >= self.max_wait_seconds)
+            batch = self._take() if due else None
+        if batch:
+            self._send(batch)
+
+    def _take(self):
+        batch = list(self._buffer.values())
+        self._buffer = {}
+        self._oldest = None
+        return batch
+
+    def flush(self):
+        """Write everything buffered; returns the items that could not be written so far"""
+        with self._lock:
+            batch = self._take()
+        while batch:
+            chunk, batch = batch[:self.max_items], batch[self.max_items:]
+            self._send(chunk)
+        return [item for item, _ in self.failed]
+
+    def _send(self, items):
+        client = self.table.meta.client
+        pending = [{'PutRequest': {'Item': item}} for item in items]
+        attempt = 0
+        while pending:
+            try:
+                response = client.batch_write_item(
+                    RequestItems={self.table.name: pending},
+                    ReturnConsumedCapacity='TOTAL'
+                )
+            except Exception as e:
+                print(f"❌ BatchWriteItem failed on {self.table.name}: {str(e)}")
+                self._fail(pending, str(e))
+                return
+            unprocessed = response.get('UnprocessedItems', {}).get(self.table.name, [])
+            with self._stats_lock:
+                self.requests += 1
+                self.items += len(pending) - len(unprocessed)
+                for capacity in response.get('ConsumedCapacity') or []:
+                    self.consumed_capacity += float(capacity.get('CapacityUnits', 0))
+            if not unprocessed:
+                return
+            attempt += 1
+            if attempt >= BATCH_WRITE_MAX_ATTEMPTS:
+                self._fail(unprocessed, f"BatchWriteItem left the item unprocessed after {attempt} attempts")
+                return
+            with self._stats_lock:
+                self.retries += 1
+            time.sleep(random.uniform(0, min(BATCH_WRITE_BACKOFF_CAP, BATCH_WRITE_BACKOFF_BASE * 2 ** attempt)))
+            pending = unprocessed
+
+    def _fail(self, requests, error):
+        with self._stats_lock:
+            self.failed.extend((request['PutRequest']['Item'], error) for request in requests)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.flush()
+        return False
+
+    def __str__(self):
+        return (f"{self.items} items in {self.requests} BatchWriteItem requests ({self.retries} retried, "
+                f"{len(self.failed)} failed), {self.consumed_capacity:.1f} WCU")
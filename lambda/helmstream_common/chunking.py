@@ -0,0 +1,75 @@
+"""
+HelmStream - Document Chunking
+Splits document text into overlapping, roughly token-sized chunks that
+record their UTF-8 byte range in the stored S3 object
+"""
+
+import os
+import re
+
+DOCUMENT_CHUNK_TOKENS = int(os.environ.get('DOCUMENT_CHUNK_TOKENS', '500'))
+DOCUMENT_CHUNK_OVERLAP_TOKENS = int(os.environ.get('DOCUMENT_CHUNK_OVERLAP_TOKENS', '50'))
+# Titan and Claude average about four characters of English per token
+CHARS_PER_TOKEN = 4
+
+# Fields carried by chunk items (whole-document items from before chunking have none)
+CHUNK_FIELDS = ('source_document_id', 'chunk_index', 'chunk_count', 'byte_start', 'byte_end')
+
+_WORD = re.compile(r'\S+')
+
+
+def estimate_tokens(text):
+    """Approximate token count of text"""
+    return max(1, -(-len(text) // CHARS_PER_TOKEN)) if text else 0
+
+
+def chunk_text(text, max_tokens=None, overlap_tokens=None):
+    """
+    [{'index', 'text', 'byte_start', 'byte_end'}, ...] covering text
+
+    Chunks break between words, hold at most max_tokens (estimated) unless
+    a single word is longer, and repeat about overlap_tokens of the
+    previous chunk so a passage split across a boundary stays retrievable.
+    byte_end is exclusive; text.encode('utf-8')[byte_start:byte_end] is
+    the chunk.
+    """
+    max_tokens = DOCUMENT_CHUNK_TOKENS if max_tokens is None else max_tokens
+    overlap_tokens = DOCUMENT_CHUNK_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens
+    overlap_tokens = min(overlap_tokens, max_tokens // 2)
+
+    # Word spans as (char start, char end, byte start, byte end, tokens incl. the preceding gap)
+    words = []
+    char_pos = byte_pos = 0
+    for match in _WORD.finditer(text):
+        byte_start = byte_pos + len(text[char_pos:match.start()].encode('utf-8'))
+        byte_end = byte_start + len(match.group().encode('utf-8'))
+        words.append((match.start(), match.end(), byte_start, byte_end,
+                      estimate_tokens(text[char_pos:match.end()]) if words else estimate_tokens(match.group())))
+        char_pos, byte_pos = match.end(), byte_end
+    if not words:
+        return []
+
+    chunks = []
+    start = 0
+    while True:
+        end = start
+        tokens = 0
+        while end < len(words) and (end == start or tokens + words[end][4] <= max_tokens):
+            tokens += words[end][4]
+            end += 1
+        first, last = words[start], words[end - 1]
+        chunks.append({
+            'index': len(chunks),
+            'text': text[first[0]:last[1]],
+            'byte_start': first[2],
+            'byte_end': last[3]
+        })
+        if end == len(words):
+            return chunks
+        # Step back over up to overlap_tokens words, always moving forward
+        next_start = end
+        carried = 0
+        while next_start - 1 > start and carried + words[next_start - 1][4] <= overlap_tokens:
+            next_start -= 1
+            carried += words[next_start][4]
+        start = next_start
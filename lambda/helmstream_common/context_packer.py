@@ -0,0 +1,98 @@
+"""
+HelmStream - Context Packer
+Chooses which retrieved passages go into a Claude prompt under a token
+budget, greedily by marginal relevance, and reports what it spent and
+what it left out
+"""
+
+import os
+
+from helmstream_common.chunking import CHARS_PER_TOKEN, estimate_tokens
+from helmstream_common.lexical import tokenize
+
+# Prompt tokens spent on retrieved context, unless a request sets its own
+CONTEXT_TOKEN_BUDGET = int(os.environ.get('CONTEXT_TOKEN_BUDGET', '3000'))
+# Relevance vs novelty trade-off (1.0 ranks by score alone)
+CONTEXT_MMR_LAMBDA = float(os.environ.get('CONTEXT_MMR_LAMBDA', '0.7'))
+# A passage is clipped to fit the remaining budget only if this much of it fits
+CONTEXT_MIN_PASSAGE_TOKENS = int(os.environ.get('CONTEXT_MIN_PASSAGE_TOKENS', '100'))
+
+
+def _overlap(a, b):
+    """Jaccard similarity of two term sets"""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _clip(text, max_tokens):
+    """Prefix of text estimated at max_tokens or fewer, cut at a word boundary"""
+    limit = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    cut = text.rfind(' ', 0, limit + 1)
+    return text[:cut if cut > 0 else limit].rstrip()
+
+
+def pack_context(candidates, budget_tokens=None, mmr_lambda=None, min_passage_tokens=None):
+    """
+    (packed, report) for candidates of {'text', 'score', 'header'?, ...}
+
+    Each step takes the candidate with the best marginal relevance: its
+    score (scaled to the best candidate's) less its term overlap with the
+    passages already taken. A candidate that no longer fits is clipped to
+    the remaining budget when at least min_passage_tokens of it would
+    survive, and skipped otherwise. The header (a title line) is charged
+    to the budget but never clipped.
+
+    packed keeps the candidates' other keys, in the order taken, with the
+    text as sent and its 'tokens'. report holds budget, used and dropped
+    token counts, where dropped is the estimated text left out.
+    """
+    budget = CONTEXT_TOKEN_BUDGET if budget_tokens is None else max(0, int(budget_tokens))
+    mmr_lambda = CONTEXT_MMR_LAMBDA if mmr_lambda is None else mmr_lambda
+    min_passage_tokens = CONTEXT_MIN_PASSAGE_TOKENS if min_passage_tokens is None else min_passage_tokens
+
+    best = max((float(candidate['score']) for candidate in candidates), default=0.0)
+    pending = [{
+        'candidate': candidate,
+        'relevance': float(candidate['score']) / best if best > 0 else 0.0,
+        'terms': set(tokenize(candidate['text'])),
+        'header_tokens': estimate_tokens(candidate.get('header', '')),
+        'text_tokens': estimate_tokens(candidate['text'])
+    } for candidate in candidates]
+
+    packed, taken_terms = [], []
+    used = dropped = clipped = 0
+    while pending:
+        def marginal(entry):
+            redundancy = max((_overlap(entry['terms'], terms) for terms in taken_terms), default=0.0)
+            return mmr_lambda * entry['relevance'] - (1 - mmr_lambda) * redundancy
+
+        entry = max(pending, key=marginal)
+        pending.remove(entry)
+        text = entry['candidate']['text']
+        room = budget - used - entry['header_tokens']
+        if entry['text_tokens'] > room:
+            if room < min(min_passage_tokens, entry['text_tokens']):
+                dropped += entry['text_tokens']
+                continue
+            text = _clip(text, room)
+            clipped += 1
+        tokens = entry['header_tokens'] + estimate_tokens(text)
+        used += tokens
+        dropped += entry['text_tokens'] - estimate_tokens(text)
+        packed.append(dict(entry['candidate'], text=text, tokens=tokens))
+        taken_terms.append(entry['terms'])
+
+    report = {
+        'budget_tokens': budget,
+        'used_tokens': used,
+        'dropped_tokens': dropped,
+        'passages': len(packed),
+        'clipped': clipped,
+        'skipped': len(candidates) - len(packed)
+    }
+    print(f"[CONTEXT] packed {len(packed)}/{len(candidates)} passages, {used}/{budget} tokens "
+          f"({dropped} dropped, {clipped} clipped)")
+    return packed, report
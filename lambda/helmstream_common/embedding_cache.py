@@ -0,0 +1,142 @@
+"""
+HelmStream - Query Embedding Cache
+Two-tier cache for query embeddings: an in-process LRU per warm container
+and a DynamoDB table with TTL shared by every container and function
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from decimal import Decimal
+
+from helmstream_common.embedding_codec import decode_embedding, encode_embedding
+
+EMBEDDING_CACHE_ENABLED = os.environ.get('EMBEDDING_CACHE_ENABLED', 'true').lower() == 'true'
+# Query embeddings kept in memory per container
+EMBEDDING_CACHE_SIZE = int(os.environ.get('EMBEDDING_CACHE_SIZE', '512'))
+# Shared tier; empty keeps the cache in-process only
+EMBEDDING_CACHE_TABLE = os.environ.get('EMBEDDING_CACHE_TABLE', 'helmstream-embedding-cache')
+EMBEDDING_CACHE_TTL_SECONDS = int(os.environ.get('EMBEDDING_CACHE_TTL_SECONDS', str(7 * 24 * 3600)))
+
+
+def normalize_query(text):
+    """Case- and whitespace-insensitive form of a query, as used for the cache key"""
+    return ' '.join(str(text).split()).casefold()
+
+
+def cache_key(text, model_id):
+    """Hex SHA-256 of the model id and the normalized query text"""
+    return hashlib.sha256(f"{model_id}\n{normalize_query(text)}".encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Query embeddings by cache_key(text, model_id), LRU in memory over a DynamoDB table
+
+    Each entry remembers how long the Bedrock call that produced it took,
+    so every hit adds that latency (less the lookup itself) to avoided_ms.
+    Table errors are logged and treated as misses; the cache never fails
+    a query.
+    """
+
+    def __init__(self, model_id, table_factory=None, size=None, ttl_seconds=None):
+        self.model_id = model_id
+        self.table_factory = table_factory if EMBEDDING_CACHE_TABLE else None
+        self.size = EMBEDDING_CACHE_SIZE if size is None else size
+        self.ttl_seconds = EMBEDDING_CACHE_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._stats = {'lookups': 0, 'memory_hits': 0, 'table_hits': 0, 'misses': 0,
+                       'embed_ms_total': 0.0, 'avoided_ms': 0.0}
+
+    def _remember(self, key, embedding, embed_ms):
+        with self._lock:
+            self._entries[key] = (embedding, embed_ms)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def _read_table(self, key):
+        if self.table_factory is None:
+            return None
+        try:
+            item = self.table_factory().get_item(Key={'query_hash': key}).get('Item')
+        except Exception as e:
+            print(f"⚠️  Embedding cache read failed: {str(e)}")
+            return None
+        # TTL deletion lags expiry by up to a couple of days
+        if not item or int(item.get('expires_at', 0)) < time.time():
+            return None
+        return list(decode_embedding(item['embedding'])), float(item.get('embed_ms', 0))
+
+    def _write_table(self, key, embedding, embed_ms):
+        if self.table_factory is None:
+            return
+        try:
+            self.table_factory().put_item(Item={
+                'query_hash': key,
+                'model_id': self.model_id,
+                'embedding': encode_embedding(embedding, 'float32'),
+                'embed_ms': Decimal(str(round(embed_ms, 1))),
+                'expires_at': int(time.time() + self.ttl_seconds)
+            })
+        except Exception as e:
+            print(f"⚠️  Embedding cache write failed: {str(e)}")
+
+    def get(self, text, compute):
+        """
+        (embedding, source) for text, where source is 'memory', 'table' or 'bedrock'
+
+        compute(text) produces the embedding on a miss.
+        """
+        if not EMBEDDING_CACHE_ENABLED:
+            return compute(text), 'bedrock'
+        started = time.perf_counter()
+        key = cache_key(text, self.model_id)
+        with self._lock:
+            self._stats['lookups'] += 1
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        source = 'memory'
+        if entry is None:
+            entry = self._read_table(key)
+            source = 'table'
+            if entry is not None:
+                self._remember(key, *entry)
+
+        if entry is not None:
+            embedding, embed_ms = entry
+            lookup_ms = (time.perf_counter() - started) * 1000
+            with self._lock:
+                self._stats[f'{source}_hits'] += 1
+                self._stats['avoided_ms'] += embed_ms - lookup_ms
+            print(f"[EMBED CACHE] {source} hit in {lookup_ms:.1f} ms (Bedrock took {embed_ms:.0f} ms) | {self.summary()}")
+            return embedding, source
+
+        started = time.perf_counter()
+        embedding = compute(text)
+        embed_ms = (time.perf_counter() - started) * 1000
+        self._remember(key, embedding, embed_ms)
+        self._write_table(key, embedding, embed_ms)
+        with self._lock:
+            self._stats['misses'] += 1
+            self._stats['embed_ms_total'] += embed_ms
+        print(f"[EMBED CACHE] miss, Bedrock {embed_ms:.0f} ms | {self.summary()}")
+        return embedding, 'bedrock'
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, entries=len(self._entries))
+        hits = stats['memory_hits'] + stats['table_hits']
+        stats['hit_rate'] = round(hits / stats['lookups'], 3) if stats['lookups'] else 0.0
+        stats['embed_ms_total'] = round(stats['embed_ms_total'], 1)
+        stats['avoided_ms'] = round(stats['avoided_ms'], 1)
+        return stats
+
+    def summary(self):
+        stats = self.stats()
+        return (f"hit rate {stats['hit_rate']:.0%} ({stats['memory_hits']} memory, {stats['table_hits']} table, "
+                f"{stats['misses']} miss), {stats['avoided_ms']:.0f} ms avoided")
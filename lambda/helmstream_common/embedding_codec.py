@@ -0,0 +1,141 @@
+"""
+HelmStream - Embedding Codec
+Packs Titan embeddings into a compact DynamoDB Binary attribute and reads
+both the packed and the legacy List-of-Decimal layouts
+"""
+
+import math
+import os
+import struct
+import sys
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Blob layout (little-endian):
+#   magic  4s  b'HSEM'
+#   version B  format version, currently 1
+#   dtype   B  1 = float32, 2 = float16
+#   dim     H  number of components
+#   payload dim * itemsize bytes
+MAGIC = b'HSEM'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sBBH')
+DTYPE_FLOAT32 = 1
+DTYPE_FLOAT16 = 2
+_DTYPE_CODES = {'float32': DTYPE_FLOAT32, 'float16': DTYPE_FLOAT16}
+_ITEMSIZE = {DTYPE_FLOAT32: 4, DTYPE_FLOAT16: 2}
+
+# 'float32', 'float16' or 'list' (legacy List of Decimal, for rollbacks)
+EMBEDDING_STORAGE_FORMAT = os.environ.get('EMBEDDING_STORAGE_FORMAT', 'float32')
+# Store unit vectors plus embedding_norm so retrieval is a plain dot product
+EMBEDDING_NORMALIZE = os.environ.get('EMBEDDING_NORMALIZE', 'true').lower() == 'true'
+
+_LITTLE_ENDIAN = sys.byteorder == 'little'
+
+
+def encode_embedding(embedding, storage_format=None):
+    """Encode an embedding for a DynamoDB item in the configured layout"""
+    storage_format = storage_format or EMBEDDING_STORAGE_FORMAT
+    if storage_format == 'list':
+        from decimal import Decimal
+        return [Decimal(str(x)) for x in embedding]
+    if storage_format not in _DTYPE_CODES:
+        raise ValueError(f"Unknown embedding storage format: {storage_format}")
+
+    dtype = _DTYPE_CODES[storage_format]
+    dim = len(embedding)
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, dtype, dim)
+    if dtype == DTYPE_FLOAT16:
+        return header + struct.pack(f'<{dim}e', *embedding)
+    payload = array('f', embedding)
+    if not _LITTLE_ENDIAN:
+        payload.byteswap()
+    return header + payload.tobytes()
+
+
+def normalize_embedding(embedding):
+    """(unit-length copy of embedding, original magnitude); zero vectors are returned unchanged"""
+    values = [float(x) for x in embedding]
+    norm = math.sqrt(sum(x * x for x in values))
+    if norm == 0:
+        return values, 0.0
+    return [x / norm for x in values], norm
+
+
+def embedding_attributes(embedding, storage_format=None, normalize=None):
+    """
+    DynamoDB attributes for an embedding: 'embedding', plus 'embedding_norm'
+    (the original magnitude) when the stored vector has been unit-normalized
+    """
+    normalize = EMBEDDING_NORMALIZE if normalize is None else normalize
+    if not normalize:
+        return {'embedding': encode_embedding(embedding, storage_format)}
+    from decimal import Decimal
+    unit, norm = normalize_embedding(embedding)
+    return {
+        'embedding': encode_embedding(unit, storage_format),
+        'embedding_norm': Decimal(repr(norm))
+    }
+
+
+def is_normalized(item):
+    """True if an item's stored embedding is unit length (written with embedding_norm)"""
+    norm = item.get('embedding_norm')
+    return norm is not None and norm > 0
+
+
+def _blob_bytes(value):
+    """Raw bytes from a boto3 Binary, bytes, bytearray or memoryview"""
+    return getattr(value, 'value', value)
+
+
+def is_packed(value):
+    """True if value is a packed embedding blob rather than a legacy list"""
+    return value is not None and not isinstance(value, (list, tuple)) and \
+        bytes(_blob_bytes(value)[:4]) == MAGIC
+
+
+def decode_embedding(value):
+    """
+    Decode a stored embedding into a float sequence
+
+    Packed float32 blobs are returned as a zero-copy memoryview over the
+    item's bytes; float16 blobs and legacy List-of-Decimal values are
+    converted to a list of floats. Missing values decode to [].
+    """
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple)):
+        return [float(x) for x in value]
+
+    blob = _blob_bytes(value)
+    magic, version, dtype, dim = HEADER.unpack_from(blob)
+    if magic != MAGIC:
+        raise ValueError("Embedding blob has an unknown header")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported embedding format version: {version}")
+    end = HEADER.size + dim * _ITEMSIZE[dtype]
+
+    if dtype == DTYPE_FLOAT16:
+        if np is not None:
+            return np.frombuffer(blob, dtype='<f2', count=dim, offset=HEADER.size).astype(np.float32)
+        return list(struct.unpack_from(f'<{dim}e', blob, HEADER.size))
+
+    view = memoryview(blob)[HEADER.size:end]
+    if _LITTLE_ENDIAN:
+        return view.cast('f')
+    floats = array('f', view.tobytes())
+    floats.byteswap()
+    return floats
+
+
+def embedding_size_bytes(value):
+    """Approximate DynamoDB storage size of a stored embedding attribute"""
+    if isinstance(value, (list, tuple)):
+        # Numbers are stored as variable-length decimals: ~1 byte per 2 digits + 1
+        return sum(len(str(x).lstrip('-').replace('.', '')) // 2 + 2 for x in value)
+    return len(_blob_bytes(value))
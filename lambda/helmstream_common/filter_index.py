@@ -0,0 +1,102 @@
+"""
+HelmStream - Metadata Filter Index
+Inverted index from each filter value to a compact row bitset, so metadata
+filters resolve as bitset intersections instead of a scan FilterExpression
+"""
+
+try:
+    import numpy as np
+except ImportError:  # Bitsets are decoded byte by byte without NumPy
+    np = None
+
+
+def _set_bit(bits, row):
+    index = row >> 3
+    if index >= len(bits):
+        bits.extend(bytes(max(index + 1 - len(bits), len(bits))))
+    bits[index] |= 1 << (row & 7)
+
+
+def _clear_bit(bits, row):
+    index = row >> 3
+    if index < len(bits):
+        bits[index] &= ~(1 << (row & 7)) & 0xFF
+
+
+def bitset_rows(bits):
+    """Ascending row numbers set in a bitset (int or bytes-like, little-endian)"""
+    if isinstance(bits, int):
+        bits = bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+    if np is not None:
+        return np.flatnonzero(np.unpackbits(np.frombuffer(bytes(bits), dtype=np.uint8), bitorder='little')).tolist()
+    rows = []
+    for index, byte in enumerate(bits):
+        while byte:
+            low = byte & -byte
+            rows.append(index * 8 + low.bit_length() - 1)
+            byte ^= low
+    return rows
+
+
+class FilterIndex:
+    """
+    Row bitsets per (filter, value), maintained as rows are added or removed
+
+    attributes maps a filter name (as produced by the query filter
+    extractor) to the item attribute it tests, e.g. {'vessel':
+    'vessel_involved'}. Each bitset is a bytearray with bit r set when row
+    r carries that value; counts track per-value cardinality.
+    """
+
+    def __init__(self, attributes):
+        self.attributes = dict(attributes)
+        self.clear()
+
+    def clear(self):
+        self.bitsets = {name: {} for name in self.attributes}
+        self.counts = {name: {} for name in self.attributes}
+        self.row_values = {}
+
+    def add(self, row, item):
+        """Index (or re-index) row from an item's metadata"""
+        self.remove(row)
+        values = {}
+        for name, attribute in self.attributes.items():
+            value = item.get(attribute)
+            if value is None:
+                continue
+            _set_bit(self.bitsets[name].setdefault(value, bytearray()), row)
+            self.counts[name][value] = self.counts[name].get(value, 0) + 1
+            values[name] = value
+        self.row_values[row] = values
+
+    def remove(self, row):
+        for name, value in self.row_values.pop(row, {}).items():
+            _clear_bit(self.bitsets[name][value], row)
+            self.counts[name][value] -= 1
+
+    def cardinality(self, name, value):
+        """Rows currently carrying value for filter name"""
+        return self.counts.get(name, {}).get(value, 0)
+
+    def match(self, filters):
+        """
+        Ascending rows satisfying every filter
+
+        Bitsets are intersected smallest first, stopping as soon as the
+        intersection is empty; an unknown value matches nothing.
+        """
+        ordered = sorted(filters.items(), key=lambda entry: self.cardinality(*entry))
+        result = None
+        for name, value in ordered:
+            bits = self.bitsets[name].get(value)
+            if bits is None:
+                return []
+            bits = int.from_bytes(bits, 'little')
+            result = bits if result is None else result & bits
+            if not result:
+                return []
+        return bitset_rows(result) if result is not None else None
+
+    def stats(self):
+        return {name: len(values) for name, values in self.counts.items()}
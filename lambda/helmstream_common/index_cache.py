@@ -0,0 +1,390 @@
+"""
+HelmStream - Warm-Container Embedding Index
+Keeps the decoded embedding matrix and lightweight item metadata in module
+scope so warm Lambda invocations skip the full table scan
+"""
+
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from helmstream_common.embedding_codec import decode_embedding, is_normalized
+from helmstream_common.lexical import HYBRID_CANDIDATES, reciprocal_rank_fusion
+from helmstream_common.scan import TopK
+from helmstream_common.similarity import build_matrix, build_matrix_from_rows
+
+INDEX_CACHE_ENABLED = os.environ.get('INDEX_CACHE_ENABLED', 'true').lower() == 'true'
+# Serve the cached index without touching DynamoDB for this long
+INDEX_CACHE_TTL_SECONDS = float(os.environ.get('INDEX_CACHE_TTL_SECONDS', '60'))
+# Rebuild from a full scan this often, to pick up deletes and in-place updates
+INDEX_FULL_REFRESH_SECONDS = float(os.environ.get('INDEX_FULL_REFRESH_SECONDS', '900'))
+# Re-read items this far behind the high-water mark to catch late writers
+INDEX_REFRESH_LOOKBACK_SECONDS = float(os.environ.get('INDEX_REFRESH_LOOKBACK_SECONDS', '30'))
+
+
+def _rewind(timestamp, seconds):
+    """ISO timestamp moved back by seconds (unparseable values are kept)"""
+    try:
+        return (datetime.fromisoformat(timestamp) - timedelta(seconds=seconds)).isoformat()
+    except (TypeError, ValueError):
+        return timestamp
+
+
+def _version(item):
+    """What identifies one write of an item: its created_at and content_hash"""
+    return item.get('created_at'), item.get('content_hash')
+
+
+def _strip_embedding(item):
+    return {k: v for k, v in item.items() if k not in ('embedding', 'lexical_terms')}
+
+
+class EmbeddingIndex:
+    """
+    In-memory embedding index refreshed incrementally by created_at
+
+    full_loader() and incremental_loader(since) both return an iterable of
+    item pages; the incremental loader only needs items with
+    created_at >= since. Re-delivered items are upserted by key, so
+    loaders may overlap freely. Items deleted from the table leave a warm
+    index through deletion_loader(since), which yields (key, deleted_at)
+    for deletes at or after since (see tombstones.py); a row created after
+    its tombstone is kept. When snapshot_source() returns a snapshot
+    containing this corpus (see snapshot.py), full loads map it instead of
+    scanning and only pull items newer than its high-water mark. An
+    optional ann (IVFIndex) is kept in step with every insert, update and
+    delete, and answers searches once the corpus is large enough. An
+    optional filter index (FilterIndex) is maintained the same way and
+    resolves metadata filters to row sets via filter_rows(), and an
+    optional lexical index (BM25Index) is fed the raw items for
+    lexical_search() and hybrid_search().
+    """
+
+    def __init__(self, name, key, full_loader, incremental_loader=None, metadata=None,
+                 ttl_seconds=None, full_refresh_seconds=None, lookback_seconds=None,
+                 snapshot_source=None, ann=None, filters=None, lexical=None, deletion_loader=None):
+        self.name = name
+        self.key = key
+        self.full_loader = full_loader
+        self.incremental_loader = incremental_loader
+        self.deletion_loader = deletion_loader
+        self.metadata = metadata or _strip_embedding
+        self.snapshot_source = snapshot_source
+        self.ann = ann
+        self.filters = filters
+        self.lexical = lexical
+        self.ttl_seconds = INDEX_CACHE_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+        self.full_refresh_seconds = INDEX_FULL_REFRESH_SECONDS if full_refresh_seconds is None else full_refresh_seconds
+        self.lookback_seconds = INDEX_REFRESH_LOOKBACK_SECONDS if lookback_seconds is None else lookback_seconds
+
+        self._lock = threading.RLock()
+        self._reset()
+        self.loaded_at = None
+        self.full_loaded_at = None
+        self.counters = {
+            'hits': 0,
+            'misses': 0,
+            'refreshes': 0,
+            'full_loads': 0,
+            'snapshot_loads': 0,
+            'refresh_ms_total': 0.0,
+            'last_refresh_ms': 0.0,
+            'last_refresh_items': 0,
+            'deletes_applied': 0
+        }
+
+    def _reset(self):
+        self.ids = []
+        self.meta = []
+        self.versions = []
+        self.rows = {}
+        self.deleted = set()
+        self.matrix = build_matrix()
+        self.high_water_mark = None
+        self.snapshot_version = None
+        self.generation = 0
+        if self.filters is not None:
+            self.filters.clear()
+        if self.lexical is not None:
+            self.lexical.clear()
+
+    def __len__(self):
+        return len(self.ids) - len(self.deleted)
+
+    def upsert(self, item):
+        """
+        Insert or replace one item; returns its row number
+
+        A re-delivered item whose created_at and content_hash match the
+        stored row (the lookback window, or the overlap with a snapshot)
+        is left as it is, so mapped snapshot rows are not rewritten.
+        """
+        item_id = item[self.key]
+        version = _version(item)
+        row = self.rows.get(item_id)
+        if row is not None and version[0] and self.versions[row] == version:
+            return row
+        vector = decode_embedding(item.get('embedding'))
+        unit = is_normalized(item)
+        if row is None:
+            row = self.matrix.append(vector, unit)
+            self.ids.append(item_id)
+            self.meta.append(self.metadata(item))
+            self.versions.append(version)
+            self.rows[item_id] = row
+        else:
+            self.matrix.set_row(row, vector, unit)
+            self.meta[row] = self.metadata(item)
+            self.versions[row] = version
+        if self.ann is not None:
+            self.ann.add(self.matrix, row)
+        if self.filters is not None:
+            self.filters.add(row, self.meta[row])
+        if self.lexical is not None:
+            self.lexical.add(row, item)
+
+        created_at = item.get('created_at')
+        if created_at and (self.high_water_mark is None or created_at > self.high_water_mark):
+            self.high_water_mark = created_at
+        return row
+
+    def delete(self, item_id):
+        """Drop one item; its row is tombstoned until the next full load"""
+        with self._lock:
+            row = self.rows.pop(item_id, None)
+            if row is None:
+                return False
+            self.deleted.add(row)
+            self.matrix.clear_row(row)
+            if self.ann is not None:
+                self.ann.remove(row)
+            if self.filters is not None:
+                self.filters.remove(row)
+            if self.lexical is not None:
+                self.lexical.remove(row)
+            return True
+
+    def _seed(self, snapshot):
+        """Start from a memory-mapped snapshot's rows (zero-copy with NumPy)"""
+        info = snapshot.corpora[self.name]
+        self._reset()
+        self.matrix = build_matrix_from_rows(snapshot.matrix(self.name), info['count'], snapshot.dim)
+        self.ids = snapshot.ids(self.name)
+        raw = snapshot.metadata(self.name)
+        self.meta = [self.metadata(meta) for meta in raw]
+        self.versions = [_version(meta) for meta in raw]
+        self.rows = {item_id: row for row, item_id in enumerate(self.ids)}
+        self.high_water_mark = snapshot.high_water_mark(self.name)
+        self.snapshot_version = snapshot.version
+        if self.filters is not None:
+            for row, meta in enumerate(self.meta):
+                self.filters.add(row, meta)
+        if self.lexical is not None:
+            postings = snapshot.lexical(self.name)
+            if postings is not None:
+                self.lexical.load_base(postings)
+            else:
+                for row, meta in enumerate(raw):
+                    self.lexical.add(row, meta)
+        return info['count']
+
+    def _apply_deletions(self, since):
+        """Drop rows whose tombstones are at or after since; returns how many were dropped"""
+        if self.deletion_loader is None:
+            return 0
+        dropped = 0
+        try:
+            for item_id, deleted_at in self.deletion_loader(since):
+                row = self.rows.get(item_id)
+                created_at = self.versions[row][0] if row is not None else None
+                if row is not None and not (created_at and created_at > deleted_at):
+                    dropped += self.delete(item_id)
+        except Exception as e:
+            # Tombstones at or after the high-water mark are read again on the next refresh
+            print(f"⚠️  Could not read {self.name} tombstones: {str(e)}")
+        self.counters['deletes_applied'] += dropped
+        return dropped
+
+    def _load(self, pages):
+        count = 0
+        for page in pages:
+            for item in page:
+                self.upsert(item)
+                count += 1
+        return count
+
+    def get(self):
+        """Return the index, refreshing it first if it is older than the TTL"""
+        with self._lock:
+            now = time.time()
+            if self.loaded_at is not None and now - self.loaded_at < self.ttl_seconds:
+                self.counters['hits'] += 1
+                return self
+
+            started = time.perf_counter()
+            mode = 'incremental refresh'
+            full = (self.loaded_at is None or self.incremental_loader is None
+                    or self.high_water_mark is None
+                    or now - self.full_loaded_at >= self.full_refresh_seconds)
+            if full:
+                self.counters['misses'] += 1
+                self.counters['full_loads'] += 1
+                snapshot = self.snapshot_source() if self.snapshot_source else None
+                if (snapshot is not None and self.name in snapshot and self.incremental_loader is not None
+                        and snapshot.high_water_mark(self.name)):
+                    self.counters['snapshot_loads'] += 1
+                    mode = f"snapshot {snapshot.version} load"
+                    count = self._seed(snapshot)
+                    since = _rewind(self.high_water_mark, self.lookback_seconds)
+                    count += self._load(self.incremental_loader(since))
+                    dropped = self._apply_deletions(since)
+                else:
+                    mode = 'full load'
+                    self._reset()
+                    count = self._load(self.full_loader())
+                    dropped = 0
+                self.full_loaded_at = now
+            else:
+                self.counters['refreshes'] += 1
+                since = _rewind(self.high_water_mark, self.lookback_seconds)
+                count = self._load(self.incremental_loader(since))
+                dropped = self._apply_deletions(since)
+
+            if self.ann is not None and (full or self.ann.needs_build(self.matrix)):
+                self.ann.build(self.matrix)
+            self.generation += 1
+            self.loaded_at = now
+            elapsed = (time.perf_counter() - started) * 1000
+            self.counters['last_refresh_ms'] = round(elapsed, 1)
+            self.counters['last_refresh_items'] = count
+            self.counters['refresh_ms_total'] += elapsed
+            print(f"[INDEX] {self.name}: {mode} of {count} items, {dropped} deleted, "
+                  f"in {elapsed:.0f} ms ({len(self)} rows, {self.matrix.backend} kernel)")
+            return self
+
+    def invalidate(self):
+        """Force a full reload on the next get()"""
+        with self._lock:
+            self.loaded_at = None
+
+    def filter_rows(self, filters):
+        """
+        Ascending live rows whose metadata matches every filter, or None when unfiltered
+
+        Without a filter index, filter names are compared directly against
+        metadata attributes in a linear pass.
+        """
+        if not filters:
+            return None
+        if self.filters is not None:
+            return self.filters.match(filters)
+        return [row for row, meta in enumerate(self.meta)
+                if row not in self.deleted and all(meta.get(name) == value for name, value in filters.items())]
+
+    def search(self, query_embedding, top_k, rows=None):
+        """(score, row) pairs for the best top_k rows, optionally limited to rows"""
+        if rows is not None and self.deleted:
+            rows = [row for row in rows if row not in self.deleted]
+        if self.ann is not None:
+            # Deleted rows are never bucketed, so the ANN path needs no extra filtering
+            results = self.ann.search(self.matrix, query_embedding, top_k, rows)
+            if results is not None:
+                return results
+        return self._top(self.matrix.score_array(query_embedding), top_k, rows)
+
+    def search_many(self, query_embeddings, top_k, rows=None):
+        """
+        search() for several queries; rows is None or one row list (or None) per query
+
+        Queries the approximate index does not serve are scored together in
+        a single matrix-matrix product.
+        """
+        rows = list(rows) if rows is not None else [None] * len(query_embeddings)
+        if self.deleted:
+            rows = [[row for row in r if row not in self.deleted] if r is not None else None for r in rows]
+        results = [None] * len(query_embeddings)
+        if self.ann is not None:
+            for i, query_embedding in enumerate(query_embeddings):
+                results[i] = self.ann.search(self.matrix, query_embedding, top_k, rows[i])
+        pending = [i for i, result in enumerate(results) if result is None]
+        if pending:
+            scores = self.matrix.score_arrays([query_embeddings[i] for i in pending])
+            for i, query_scores in zip(pending, scores):
+                results[i] = self._top(query_scores, top_k, rows[i])
+        return results
+
+    def _top(self, scores, top_k, rows):
+        """(score, row) pairs for the best top_k of scores, over live rows or just rows"""
+        if rows is None and self.deleted:
+            rows = [row for row in range(len(self.ids)) if row not in self.deleted]
+        top = TopK(top_k)
+        if rows is None:
+            top.extend(scores, range(len(scores)))
+        elif isinstance(scores, list):
+            for row in rows:
+                top.push(scores[row], row)
+        else:
+            top.extend(scores[rows], rows)
+        return top.results()
+
+    def lexical_search(self, query_text, top_k, rows=None, require_all=False):
+        """(BM25 score, row) pairs from the lexical index ([] without one)"""
+        if self.lexical is None:
+            return []
+        return self.lexical.search(query_text, top_k, rows, require_all)
+
+    def hybrid_search(self, query_embedding, query_text, top_k, rows=None):
+        """
+        (cosine similarity, row, fusion score) triples, best first
+
+        The vector and BM25 rankings (HYBRID_CANDIDATES deep) are merged with
+        reciprocal rank fusion. Rows found only lexically are scored exactly
+        so every result carries its cosine similarity. Without a lexical
+        index or lexical hits this is plain search() with no fusion score.
+        """
+        depth = max(top_k, HYBRID_CANDIDATES)
+        if rows is not None and self.deleted:
+            rows = [row for row in rows if row not in self.deleted]
+        vector = self.search(query_embedding, depth, rows)
+        return self._fuse(query_embedding, query_text, vector, top_k, rows)
+
+    def hybrid_search_many(self, query_embeddings, query_texts, top_k, rows=None):
+        """hybrid_search() for several queries, their vector rankings from one search_many()"""
+        rows = list(rows) if rows is not None else [None] * len(query_embeddings)
+        if self.deleted:
+            rows = [[row for row in r if row not in self.deleted] if r is not None else None for r in rows]
+        vectors = self.search_many(query_embeddings, max(top_k, HYBRID_CANDIDATES), rows)
+        return [self._fuse(query_embedding, query_text, vector, top_k, query_rows)
+                for query_embedding, query_text, vector, query_rows
+                in zip(query_embeddings, query_texts, vectors, rows)]
+
+    def _fuse(self, query_embedding, query_text, vector, top_k, rows):
+        depth = max(top_k, HYBRID_CANDIDATES)
+        lexical = self.lexical_search(query_text, depth, rows) if query_text else []
+        if not lexical:
+            return [(score, row, None) for score, row in vector[:top_k]]
+
+        fused = reciprocal_rank_fusion([vector, lexical], top_k)
+        similarity = {row: score for score, row in vector}
+        missing = [row for _, row in fused if row not in similarity]
+        if missing:
+            similarity.update(zip(missing, (float(s) for s in self.matrix.scores_for(query_embedding, missing))))
+        return [(similarity[row], row, score) for score, row in fused]
+
+    def stats(self):
+        """Cache counters for logging and debug responses"""
+        lookups = self.counters['hits'] + self.counters['misses'] + self.counters['refreshes']
+        return dict(
+            self.counters,
+            refresh_ms_total=round(self.counters['refresh_ms_total'], 1),
+            rows=len(self),
+            matrix_resident_bytes=self.matrix.resident_bytes(),
+            generation=self.generation,
+            snapshot_version=self.snapshot_version,
+            high_water_mark=self.high_water_mark,
+            hit_rate=round(self.counters['hits'] / lookups, 3) if lookups else 0.0,
+            ann=self.ann.stats() if self.ann is not None else None,
+            filter_values=self.filters.stats() if self.filters is not None else None,
+            lexical=self.lexical.stats() if self.lexical is not None else None
+        )
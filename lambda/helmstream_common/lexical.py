@@ -0,0 +1,297 @@
+"""
+HelmStream - Lexical (BM25) Index
+Term statistics computed at ingest, a BM25 inverted index kept alongside
+the embedding index, and reciprocal rank fusion of lexical and vector
+rankings
+"""
+
+import math
+import os
+import re
+from array import array
+
+from helmstream_common.scan import TopK
+
+try:
+    import numpy as np
+except ImportError:  # Postings are scored with dict accumulation without NumPy
+    np = None
+
+LEXICAL_ENABLED = os.environ.get('LEXICAL_ENABLED', 'true').lower() == 'true'
+# Answer keyword-shaped queries from BM25 alone, skipping the query embedding
+LEXICAL_FAST_PATH = os.environ.get('LEXICAL_FAST_PATH', 'true').lower() == 'true'
+# Distinct terms stored per item at ingest (highest frequency first)
+LEXICAL_MAX_TERMS = int(os.environ.get('LEXICAL_MAX_TERMS', '1000'))
+# Depth of each ranking fed to fusion, and the RRF damping constant
+HYBRID_CANDIDATES = int(os.environ.get('HYBRID_CANDIDATES', '50'))
+HYBRID_RRF_K = int(os.environ.get('HYBRID_RRF_K', '60'))
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN = re.compile(r'[a-z0-9]+')
+STOPWORDS = frozenset("""
+a about above after all also an and any are as at be been before being below between both but by can could
+did do does doing down during each few for from further had has have having he her here hers him his how i
+if in into is it its just me more most my no nor not now of off on once only or other our out over own re
+same she should so some such than that the their them then there these they this those through to too
+under until up very was we were what when where which while who whom why will with would you your
+""".split())
+QUESTION_WORDS = frozenset("""
+what when where which who whom whose why how explain summarize summarise describe tell show list compare
+should could would can is are was were does did do
+""".split())
+
+
+def tokenize(text):
+    """Lower-cased alphanumeric terms without stopwords"""
+    return [term for term in _TOKEN.findall(str(text).lower()) if term not in STOPWORDS]
+
+
+def term_frequencies(text, max_terms=None):
+    """({term: count} for the most frequent max_terms terms, total term count)"""
+    counts = {}
+    terms = tokenize(text)
+    for term in terms:
+        counts[term] = counts.get(term, 0) + 1
+    max_terms = LEXICAL_MAX_TERMS if max_terms is None else max_terms
+    if len(counts) > max_terms:
+        counts = dict(sorted(counts.items(), key=lambda entry: -entry[1])[:max_terms])
+    return counts, len(terms)
+
+
+def lexical_attributes(text):
+    """DynamoDB attributes carrying an item's term statistics ('term:count term:count ...')"""
+    counts, length = term_frequencies(text)
+    return {
+        'lexical_terms': ' '.join(f"{term}:{count}" for term, count in counts.items()),
+        'lexical_length': length
+    }
+
+
+def item_terms(item, fields):
+    """({term: count}, length) from an item's lexical_terms, or by tokenizing its text fields"""
+    encoded = item.get('lexical_terms')
+    if encoded is not None:
+        counts = {}
+        for entry in encoded.split():
+            term, _, count = entry.rpartition(':')
+            counts[term] = int(count)
+        return counts, int(item.get('lexical_length') or sum(counts.values()))
+    return term_frequencies('\n'.join(str(item.get(field) or '') for field in fields))
+
+
+def is_keyword_query(query):
+    """
+    True for short lookups such as "Dock 2 propeller shaft" or "IMO 9321483"
+
+    A query is keyword-shaped when it has at most six words, no question
+    words, and at least one identifier-like token: a number, a mixed
+    letter/digit code, a quoted phrase or an acronym of three or more capitals.
+    """
+    words = query.strip().rstrip('?').split()
+    if not words or len(words) > 6 or '?' in query:
+        return False
+    if any(word.lower().strip('"\'') in QUESTION_WORDS for word in words):
+        return False
+    if '"' in query:
+        return True
+    return any(any(ch.isdigit() for ch in word) or (len(word) >= 3 and word.isalpha() and word.isupper())
+               for word in words)
+
+
+def build_postings(term_maps, lengths):
+    """
+    CSR postings for a snapshot: {'terms', 'offsets', 'rows', 'tfs', 'lengths'}
+
+    term_maps[row] is that row's {term: count}; rows within a term are ascending.
+    """
+    postings = {}
+    for row, counts in enumerate(term_maps):
+        for term, count in counts.items():
+            postings.setdefault(term, []).append((row, count))
+    terms = sorted(postings)
+    offsets = array('Q', [0])
+    rows = array('I')
+    tfs = array('H')
+    for term in terms:
+        for row, count in postings[term]:
+            rows.append(row)
+            tfs.append(min(count, 65535))
+        offsets.append(len(rows))
+    return {'terms': terms, 'offsets': offsets, 'rows': rows, 'tfs': tfs, 'lengths': array('I', lengths)}
+
+
+def reciprocal_rank_fusion(rankings, top_k, k=None):
+    """(fused score, row) for the best top_k rows over several best-first (score, row) rankings"""
+    k = HYBRID_RRF_K if k is None else k
+    fused = {}
+    for ranking in rankings:
+        for rank, (_, row) in enumerate(ranking):
+            fused[row] = fused.get(row, 0.0) + 1.0 / (k + rank + 1)
+    top = TopK(top_k)
+    for row, score in fused.items():
+        top.push(score, row)
+    return top.results()
+
+
+class BM25Index:
+    """
+    BM25 over item text, addressed by the embedding index's row numbers
+
+    Postings come in two layers: an immutable base (CSR arrays, usually
+    mapped from a snapshot) and a dict overlay for rows added since. A row
+    re-indexed or removed after the base was loaded is masked out of it.
+    Items supply pre-computed 'lexical_terms' when ingestion wrote them;
+    otherwise the text fields are tokenized on load.
+    """
+
+    def __init__(self, fields, k1=BM25_K1, b=BM25_B):
+        self.fields = tuple(fields)
+        self.k1 = k1
+        self.b = b
+        self.clear()
+
+    def clear(self):
+        self.lengths = array('I')
+        self.docs = 0
+        self.total_length = 0
+        self.overlay = {}
+        self.row_terms = {}
+        self.base_terms = {}
+        self.base_rows = None
+        self.base_tfs = None
+        self.base_count = 0
+        self.stale = set()
+
+    def _grow(self, row):
+        if row >= len(self.lengths):
+            self.lengths.extend(array('I', bytes(4 * (row + 1 - len(self.lengths)))))
+
+    def load_base(self, postings):
+        """Adopt CSR postings (from build_postings or a snapshot) as the base layer"""
+        self.clear()
+        offsets = postings['offsets']
+        self.base_terms = {term: (offsets[i], offsets[i + 1]) for i, term in enumerate(postings['terms'])}
+        if np is not None:
+            self.base_rows = np.asarray(postings['rows'], dtype=np.uint32)
+            self.base_tfs = np.asarray(postings['tfs'], dtype=np.float32)
+        else:
+            self.base_rows = postings['rows']
+            self.base_tfs = postings['tfs']
+        self.lengths = array('I', postings['lengths'])
+        self.base_count = len(self.lengths)
+        self.docs = sum(1 for length in self.lengths if length)
+        self.total_length = sum(self.lengths)
+
+    def add(self, row, item):
+        """Index (or re-index) one row from an item"""
+        self.remove(row)
+        counts, length = item_terms(item, self.fields)
+        if not counts:
+            return
+        self._grow(row)
+        self.lengths[row] = max(length, 1)
+        self.docs += 1
+        self.total_length += self.lengths[row]
+        for term, count in counts.items():
+            self.overlay.setdefault(term, {})[row] = count
+        self.row_terms[row] = list(counts)
+
+    def remove(self, row):
+        if row >= len(self.lengths) or not self.lengths[row]:
+            return
+        for term in self.row_terms.pop(row, ()):
+            postings = self.overlay[term]
+            del postings[row]
+            if not postings:
+                del self.overlay[term]
+        if row < self.base_count:
+            self.stale.add(row)
+        self.docs -= 1
+        self.total_length -= self.lengths[row]
+        self.lengths[row] = 0
+
+    def __len__(self):
+        return self.docs
+
+    def _postings(self, term):
+        """(rows, tfs) of live rows containing term"""
+        rows, tfs = [], []
+        if term in self.base_terms:
+            start, end = self.base_terms[term]
+            rows, tfs = self.base_rows[start:end], self.base_tfs[start:end]
+            if self.stale:
+                if np is not None:
+                    keep = ~np.isin(rows, np.fromiter(self.stale, dtype=np.uint32, count=len(self.stale)))
+                    rows, tfs = rows[keep], tfs[keep]
+                else:
+                    pairs = [(r, t) for r, t in zip(rows, tfs) if r not in self.stale]
+                    rows, tfs = [r for r, _ in pairs], [t for _, t in pairs]
+        extra = self.overlay.get(term)
+        if extra:
+            if np is not None:
+                rows = np.concatenate([np.asarray(rows, dtype=np.uint32), np.fromiter(extra, dtype=np.uint32)])
+                tfs = np.concatenate([np.asarray(tfs, dtype=np.float32),
+                                      np.fromiter(extra.values(), dtype=np.float32)])
+            else:
+                rows, tfs = list(rows) + list(extra), list(tfs) + list(extra.values())
+        return rows, tfs
+
+    def search(self, query, top_k, rows=None, require_all=False):
+        """
+        (BM25 score, row) pairs for the best top_k rows, optionally limited to rows
+
+        With require_all, only rows containing every query term qualify.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or not self.docs:
+            return []
+        avgdl = self.total_length / self.docs
+        allowed = None if rows is None else set(rows)
+        top = TopK(top_k)
+
+        if np is not None:
+            size = len(self.lengths)
+            lengths = np.frombuffer(self.lengths, dtype=np.uint32).astype(np.float32)
+            scores = np.zeros(size, dtype=np.float32)
+            hits = np.zeros(size, dtype=np.int32)
+            for term in terms:
+                found, tfs = self._postings(term)
+                if not len(found):
+                    continue
+                found = np.asarray(found, dtype=np.intp)
+                idf = math.log(1 + (self.docs - len(found) + 0.5) / (len(found) + 0.5))
+                norm = self.k1 * (1 - self.b + self.b * lengths[found] / avgdl)
+                scores[found] += idf * tfs * (self.k1 + 1) / (tfs + norm)
+                hits[found] += 1
+            candidates = np.flatnonzero(hits == len(terms)) if require_all else np.flatnonzero(hits)
+            if allowed is not None:
+                candidates = candidates[np.isin(candidates, np.fromiter(allowed, dtype=np.intp, count=len(allowed)))]
+            top.extend(scores[candidates], candidates.tolist())
+            return top.results()
+
+        scores = {}
+        hits = {}
+        for term in terms:
+            found, tfs = self._postings(term)
+            if not found:
+                continue
+            idf = math.log(1 + (self.docs - len(found) + 0.5) / (len(found) + 0.5))
+            for row, tf in zip(found, tfs):
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[row] / avgdl)
+                scores[row] = scores.get(row, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+                hits[row] = hits.get(row, 0) + 1
+        for row in sorted(scores):
+            if (allowed is None or row in allowed) and (not require_all or hits[row] == len(terms)):
+                top.push(scores[row], row)
+        return top.results()
+
+    def stats(self):
+        return {
+            'docs': self.docs,
+            'terms': len(set(self.base_terms) | set(self.overlay)),
+            'base_rows': self.base_count,
+            'overlay_rows': len(self.row_terms),
+            'stale_base_rows': len(self.stale)
+        }
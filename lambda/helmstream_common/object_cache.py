@@ -0,0 +1,208 @@
+"""
+HelmStream - S3 Object Cache
+Document bodies (or byte ranges of them) fetched concurrently and kept
+per warm container: a size-bounded in-memory LRU that spills to /tmp,
+revalidated against S3 with conditional GETs on the object's ETag
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+S3_FETCH_MAX_WORKERS = int(os.environ.get('S3_FETCH_MAX_WORKERS', '4'))
+DOCUMENT_CACHE_BYTES = int(os.environ.get('DOCUMENT_CACHE_BYTES', str(32 * 1024 * 1024)))
+# Bodies evicted from memory are kept here; empty disables the spill tier
+DOCUMENT_CACHE_SPILL_DIR = os.environ.get('DOCUMENT_CACHE_SPILL_DIR', '/tmp/helmstream-documents')
+DOCUMENT_CACHE_SPILL_BYTES = int(os.environ.get('DOCUMENT_CACHE_SPILL_BYTES', str(256 * 1024 * 1024)))
+# Serve a cached body without asking S3 for this long after it was last validated
+DOCUMENT_CACHE_REVALIDATE_SECONDS = float(os.environ.get('DOCUMENT_CACHE_REVALIDATE_SECONDS', '300'))
+
+
+def parse_s3_uri(s3_uri):
+    """(bucket, key) from s3://bucket/key"""
+    bucket, _, key = s3_uri.replace('s3://', '', 1).partition('/')
+    return bucket, key
+
+
+def _not_modified(error):
+    return error.response.get('Error', {}).get('Code') in ('304', 'NotModified')
+
+
+class S3ObjectCache:
+    """
+    Object bodies (or byte ranges) by S3 URI, each remembered with its ETag
+
+    A body validated within revalidate_seconds is served from memory (or
+    the spill directory) with no S3 call. Older ones are re-requested with
+    IfNoneMatch, so an unchanged object costs a 304 and no transfer. A
+    byte range is cached separately from the whole object.
+    """
+
+    def __init__(self, s3_client, max_bytes=None, spill_dir=None, spill_bytes=None, revalidate_seconds=None):
+        self.s3 = s3_client
+        self.max_bytes = DOCUMENT_CACHE_BYTES if max_bytes is None else max_bytes
+        self.spill_dir = DOCUMENT_CACHE_SPILL_DIR if spill_dir is None else spill_dir
+        self.spill_bytes = DOCUMENT_CACHE_SPILL_BYTES if spill_bytes is None else spill_bytes
+        self.revalidate_seconds = DOCUMENT_CACHE_REVALIDATE_SECONDS if revalidate_seconds is None else revalidate_seconds
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # uri -> (etag, body, validated_at)
+        self._bytes = 0
+        self._stats = {'memory_hits': 0, 'spill_hits': 0, 'not_modified': 0, 'downloads': 0, 'bytes_downloaded': 0}
+
+    # ----- memory tier -----
+
+    def _store(self, uri, etag, body, validated_at):
+        spilled = []
+        with self._lock:
+            old = self._entries.pop(uri, None)
+            if old is not None:
+                self._bytes -= len(old[1])
+            if len(body) <= self.max_bytes:
+                self._entries[uri] = (etag, body, validated_at)
+                self._bytes += len(body)
+            else:
+                spilled.append((uri, (etag, body, validated_at)))
+            while self._bytes > self.max_bytes:
+                evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted[1][1])
+                spilled.append(evicted)
+        for evicted_uri, (evicted_etag, evicted_body, evicted_validated_at) in spilled:
+            self._spill(evicted_uri, evicted_etag, evicted_body, evicted_validated_at)
+
+    # ----- /tmp spill tier -----
+
+    def _spill_path(self, uri):
+        return os.path.join(self.spill_dir, hashlib.sha256(uri.encode('utf-8')).hexdigest())
+
+    def _spill(self, uri, etag, body, validated_at):
+        """Write '<validated_at> <etag>' and the body to the spill directory"""
+        if not self.spill_dir or len(body) > self.spill_bytes:
+            return
+        try:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            path = self._spill_path(uri)
+            with open(path + '.tmp', 'wb') as f:
+                f.write(f"{validated_at!r} {etag}".encode('utf-8') + b'\n' + body)
+            os.replace(path + '.tmp', path)
+            self._trim_spill()
+        except OSError as e:
+            print(f"⚠️  Could not spill {uri} to {self.spill_dir}: {str(e)}")
+
+    def _trim_spill(self):
+        """Drop the oldest spill files beyond spill_bytes (a read moves a file back to memory)"""
+        files = []
+        for name in os.listdir(self.spill_dir):
+            path = os.path.join(self.spill_dir, name)
+            if not name.endswith('.tmp'):
+                stat = os.stat(path)
+                files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.spill_bytes:
+                break
+            os.remove(path)
+            total -= size
+
+    def _unspill(self, uri):
+        """(etag, body, validated_at) from the spill directory, or None; the file stays until _drop_spill()"""
+        if not self.spill_dir:
+            return None
+        try:
+            with open(self._spill_path(uri), 'rb') as f:
+                header, _, body = f.read().partition(b'\n')
+        except OSError:
+            return None
+        validated_at, _, etag = header.decode('utf-8').partition(' ')
+        try:
+            return etag, body, float(validated_at)
+        except ValueError:
+            return header.decode('utf-8'), body, 0.0  # Written before validation times were kept
+
+    def _drop_spill(self, uri):
+        try:
+            os.remove(self._spill_path(uri))
+        except OSError:
+            pass
+
+    # ----- lookups -----
+
+    def get(self, s3_uri, byte_range=None):
+        """
+        Object body as bytes, from cache when S3 confirms (or recently confirmed) it is current
+
+        byte_range is (start, end) with end exclusive, fetched with a ranged GET.
+        """
+        now = time.time()
+        cache_key = s3_uri if byte_range is None else f"{s3_uri}#bytes={byte_range[0]}-{byte_range[1] - 1}"
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None:
+                self._entries.move_to_end(cache_key)
+        tier = 'memory'
+        if entry is None:
+            entry = self._unspill(cache_key)
+            tier = 'spill'
+
+        # A spill file is only dropped once its body is back in memory or replaced
+        if entry is not None and now - entry[2] < self.revalidate_seconds:
+            if tier == 'spill':
+                self._drop_spill(cache_key)
+                self._store(cache_key, *entry)
+            with self._lock:
+                self._stats[f'{tier}_hits'] += 1
+            return entry[1]
+
+        bucket, key = parse_s3_uri(s3_uri)
+        kwargs = {'Bucket': bucket, 'Key': key}
+        if byte_range is not None:
+            kwargs['Range'] = f"bytes={byte_range[0]}-{byte_range[1] - 1}"
+        if entry is not None:
+            kwargs['IfNoneMatch'] = entry[0]
+        try:
+            response = self.s3.get_object(**kwargs)
+        except ClientError as e:
+            if entry is None or not _not_modified(e):
+                raise
+            if tier == 'spill':
+                self._drop_spill(cache_key)
+            self._store(cache_key, entry[0], entry[1], now)
+            with self._lock:
+                self._stats['not_modified'] += 1
+            return entry[1]
+
+        body = response['Body'].read()
+        if tier == 'spill':
+            self._drop_spill(cache_key)
+        self._store(cache_key, response.get('ETag', ''), body, now)
+        with self._lock:
+            self._stats['downloads'] += 1
+            self._stats['bytes_downloaded'] += len(body)
+        return body
+
+    def get_many(self, s3_uris, byte_ranges=None, max_workers=None):
+        """
+        Bodies for several URIs fetched concurrently, in order; a failed fetch yields its exception
+
+        byte_ranges, when given, holds a (start, end) or None per URI.
+        """
+        def fetch(request):
+            try:
+                return self.get(*request)
+            except Exception as e:
+                return e
+
+        requests = list(zip(s3_uris, byte_ranges or [None] * len(s3_uris)))
+        if len(requests) <= 1:
+            return [fetch(request) for request in requests]
+        workers = min(max_workers or S3_FETCH_MAX_WORKERS, len(requests))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='s3-fetch') as executor:
+            return list(executor.map(fetch, requests))
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries), cached_bytes=self._bytes)
@@ -0,0 +1,149 @@
+"""
+HelmStream - Overlapped Query Pipeline
+Starts a query's retrieval data load (index refresh or scan pages) on a
+background thread while the query embedding is computed, so the critical
+path pays for the slower of the two rather than their sum
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+PIPELINE_OVERLAP_ENABLED = os.environ.get('PIPELINE_OVERLAP_ENABLED', 'true').lower() == 'true'
+# Scan pages read ahead of scoring while the embedding is in flight
+PREFETCH_MAX_PAGES = int(os.environ.get('PREFETCH_MAX_PAGES', '8'))
+
+_DONE = object()
+
+# Index refreshes; the pool lives as long as the warm container. Page
+# readers get their own threads so one left blocked cannot starve it.
+_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix='prefetch')
+
+
+class Prefetch:
+    """
+    fn() running in the background from construction; result() waits for it
+
+    With PIPELINE_OVERLAP_ENABLED off, fn runs inline on the first result().
+    ms is how long fn took once it has finished.
+    """
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.ms = None
+        self._future = _EXECUTOR.submit(self._run) if PIPELINE_OVERLAP_ENABLED else None
+
+    def _run(self):
+        started = time.perf_counter()
+        try:
+            return self.fn()
+        finally:
+            self.ms = round((time.perf_counter() - started) * 1000, 1)
+
+    def result(self):
+        return self._future.result() if self._future is not None else self._run()
+
+
+class PagePrefetch:
+    """
+    Pages of an iterator (e.g. scan_pages) read ahead on a background thread
+
+    At most max_pages are buffered, so memory stays bounded however long
+    the consumer takes to start. Iterate once; an error in the source is
+    raised to the consumer. The reader blocks while the buffer is full, so
+    close() (or cancel_load) must run on every path that does not consume
+    the pages; it is harmless after they were consumed.
+    """
+
+    def __init__(self, pages, max_pages=None):
+        self.pages = pages
+        self.first_page_ms = None
+        self._started = time.perf_counter()
+        self._queue = queue.Queue(maxsize=max(1, PREFETCH_MAX_PAGES if max_pages is None else max_pages))
+        self._stop = threading.Event()
+        self._thread = None
+        if PIPELINE_OVERLAP_ENABLED:
+            self._thread = threading.Thread(target=self._read, name='page-prefetch', daemon=True)
+            self._thread.start()
+
+    def _put(self, entry):
+        while not self._stop.is_set():
+            try:
+                self._queue.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _read(self):
+        try:
+            for page in self.pages:
+                if self.first_page_ms is None:
+                    self.first_page_ms = round((time.perf_counter() - self._started) * 1000, 1)
+                if not self._put(page):
+                    break
+        except Exception as e:
+            self._put(e)
+        finally:
+            if hasattr(self.pages, 'close'):
+                self.pages.close()
+            self._put(_DONE)
+
+    def buffered(self):
+        """Pages read ahead and waiting for the consumer"""
+        return self._queue.qsize()
+
+    def __iter__(self):
+        if self._thread is None:
+            yield from self.pages
+            return
+        try:
+            while True:
+                entry = self._queue.get()
+                if entry is _DONE:
+                    return
+                if isinstance(entry, Exception):
+                    raise entry
+                yield entry
+        finally:
+            self.close()
+
+    def close(self):
+        self._stop.set()
+
+
+def await_load(load, timings, embed_ms, started):
+    """
+    Wait for a Prefetch started alongside the query embedding and record the overlap
+
+    started is when both began. A PagePrefetch is only recorded (scoring
+    consumes its pages as they arrive); None means nothing was started.
+    """
+    if isinstance(load, Prefetch):
+        load.result()
+        wall_ms = (time.perf_counter() - started) * 1000
+        serial_ms = embed_ms + load.ms
+        timings.append({'stage': 'load index', 'overlapped': PIPELINE_OVERLAP_ENABLED, 'ms': load.ms})
+        timings.append({
+            'stage': 'overlap',
+            'ms': round(wall_ms, 1),
+            'serial_ms': round(serial_ms, 1),
+            'saved_ms': round(serial_ms - wall_ms, 1)
+        })
+    elif isinstance(load, PagePrefetch):
+        timings.append({'stage': 'prefetch pages', 'overlapped': PIPELINE_OVERLAP_ENABLED,
+                        'pages_buffered': load.buffered(), 'first_page_ms': load.first_page_ms})
+
+
+def cancel_load(load):
+    """
+    Stop reading pages that will not be scored (an index refresh is left to finish)
+
+    Call it in a finally around everything between starting the load and
+    scoring it, so an error (e.g. a throttled embedding call) cannot leave
+    the reader blocked on a full buffer.
+    """
+    if isinstance(load, PagePrefetch):
+        load.close()
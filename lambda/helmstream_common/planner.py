@@ -0,0 +1,255 @@
+"""
+HelmStream - Retrieval Query Planner
+Per-value cardinality statistics, maintained at ingest, and a small cost
+model that picks how each filtered vector query is executed
+"""
+
+import math
+import os
+import threading
+import time
+
+PLANNER_ENABLED = os.environ.get('PLANNER_ENABLED', 'true').lower() == 'true'
+PLANNER_STATS_TABLE = os.environ.get('PLANNER_STATS_TABLE', 'helmstream-email-stats')
+# Reuse statistics read from the stats table for this long
+PLANNER_STATS_TTL_SECONDS = float(os.environ.get('PLANNER_STATS_TTL_SECONDS', '300'))
+# Cost model, in milliseconds per item; calibrate from the [RETRIEVAL] logs
+PLANNER_SCAN_MS_PER_ITEM = float(os.environ.get('PLANNER_SCAN_MS_PER_ITEM', '0.1'))
+PLANNER_QUERY_MS_PER_ITEM = float(os.environ.get('PLANNER_QUERY_MS_PER_ITEM', '0.1'))
+PLANNER_INDEX_MS_PER_ROW = float(os.environ.get('PLANNER_INDEX_MS_PER_ROW', '0.0005'))
+# Lambda time held back for answer generation when checking the budget
+PLANNER_GENERATION_RESERVE_MS = float(os.environ.get('PLANNER_GENERATION_RESERVE_MS', '20000'))
+# Post-filter an unfiltered vector search when at least this fraction of rows match
+PLANNER_POST_FILTER_MIN_FRACTION = float(os.environ.get('PLANNER_POST_FILTER_MIN_FRACTION', '0.25'))
+
+# Stats table row holding the corpus size
+TOTAL_DIMENSION = '_total'
+
+
+def stat_deltas(old_item, new_item, dimensions):
+    """
+    {(dimension, value): change} for one write replacing old_item with new_item
+
+    dimensions maps a filter name to the item attribute it counts. Either
+    item may be None (insert or delete); empty values are not counted.
+    """
+    deltas = {}
+    for item, sign in ((old_item, -1), (new_item, 1)):
+        if not item:
+            continue
+        deltas[(TOTAL_DIMENSION, TOTAL_DIMENSION)] = deltas.get((TOTAL_DIMENSION, TOTAL_DIMENSION), 0) + sign
+        for dimension, attribute in dimensions.items():
+            value = item.get(attribute)
+            if value is None or value == '':
+                continue
+            key = (dimension, str(value))
+            deltas[key] = deltas.get(key, 0) + sign
+    return {key: change for key, change in deltas.items() if change}
+
+
+def record_ingest(table, old_item, new_item, dimensions):
+    """Apply one write's count changes to the stats table with atomic ADDs (thread-safe client)"""
+    for (dimension, value), change in stat_deltas(old_item, new_item, dimensions).items():
+        table.meta.client.update_item(
+            TableName=table.name,
+            Key={'dimension': dimension, 'value': value},
+            UpdateExpression='ADD item_count :change',
+            ExpressionAttributeValues={':change': change}
+        )
+
+
+class CardinalityStats:
+    """Rows per (dimension, value), plus the corpus total"""
+
+    def __init__(self, counts, total, source):
+        self.counts = counts
+        self.total = total
+        self.source = source
+
+    @classmethod
+    def from_items(cls, items):
+        counts = {}
+        total = 0
+        for item in items:
+            count = int(item.get('item_count', 0))
+            if item['dimension'] == TOTAL_DIMENSION:
+                total = count
+            else:
+                counts.setdefault(item['dimension'], {})[item['value']] = count
+        return cls(counts, total, 'stats table')
+
+    @classmethod
+    def from_filter_index(cls, filter_index, total):
+        """Exact live counts from a warm FilterIndex"""
+        return cls({name: dict(values) for name, values in filter_index.counts.items()}, total, 'filter index')
+
+    def count(self, dimension, value):
+        return self.counts.get(dimension, {}).get(value, 0)
+
+    def estimate(self, filters):
+        """Expected rows matching every filter, assuming independent dimensions"""
+        estimate = float(self.total)
+        for dimension, value in (filters or {}).items():
+            estimate *= self.count(dimension, value) / self.total if self.total else 0.0
+        return estimate
+
+
+class StatsCache:
+    """Stats-table contents cached in module scope for ttl_seconds"""
+
+    def __init__(self, table_factory, ttl_seconds=None):
+        self.table_factory = table_factory
+        self.ttl_seconds = PLANNER_STATS_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+        self._lock = threading.Lock()
+        self.stats = None
+        self.loaded_at = None
+
+    def get(self):
+        """Current statistics, or None when the stats table cannot be read"""
+        with self._lock:
+            now = time.time()
+            if self.loaded_at is not None and now - self.loaded_at < self.ttl_seconds:
+                return self.stats
+            try:
+                table = self.table_factory()
+                items = []
+                kwargs = {}
+                while True:
+                    response = table.scan(**kwargs)
+                    items.extend(response.get('Items', []))
+                    if 'LastEvaluatedKey' not in response:
+                        break
+                    kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+                self.stats = CardinalityStats.from_items(items)
+            except Exception as e:
+                print(f"⚠️  Planner statistics unavailable: {str(e)}")
+                self.stats = None
+            self.loaded_at = now
+            return self.stats
+
+
+def relaxation_stages(filters, order):
+    """Filter sets from strictest to loosest, dropping dimensions in order"""
+    stages = [dict(filters)]
+    current = dict(filters)
+    for dimension in order:
+        if dimension in current:
+            current = {name: value for name, value in current.items() if name != dimension}
+            stages.append(current)
+    return stages
+
+
+def access_paths(filters, stats, index_enabled, index_warm, indexed_dimensions, scan_segments=1):
+    """
+    Every way to answer one filter set, each with an estimated cost in ms
+
+    A cold in-memory index carries its load in estimated_ms but only its
+    scoring in steady_ms: once loaded it serves every later invocation of
+    the container, so plans are ranked by steady_ms and the load only has
+    to fit the time budget.
+    """
+    total = stats.total
+    matches = stats.estimate(filters)
+    scan_ms = total * PLANNER_SCAN_MS_PER_ITEM / max(1, scan_segments)
+    paths = []
+
+    if index_enabled:
+        fraction = matches / total if total else 1.0
+        mode = 'none' if not filters else ('post' if fraction >= PLANNER_POST_FILTER_MIN_FRACTION else 'bitset')
+        score_ms = total * PLANNER_INDEX_MS_PER_ROW
+        paths.append({
+            'plan': 'vector_search',
+            'filter_mode': mode,
+            'match_fraction': round(fraction, 4),
+            'index_warm': index_warm,
+            'steady_ms': score_ms,
+            'estimated_ms': score_ms + (0.0 if index_warm else scan_ms)
+        })
+
+    indexed = [name for name in filters if name in indexed_dimensions]
+    if indexed:
+        route = min(indexed, key=lambda name: stats.count(name, filters[name]))
+        rows = stats.count(route, filters[route])
+        paths.append({
+            'plan': 'key_lookup',
+            'route': route,
+            'estimated_rows_read': rows,
+            'estimated_ms': rows * PLANNER_QUERY_MS_PER_ITEM
+        })
+
+    paths.append({'plan': 'filtered_scan', 'estimated_rows_read': total, 'estimated_ms': scan_ms})
+    for path in paths:
+        path['filters'] = dict(filters)
+        path['estimated_matches'] = round(matches, 1)
+        path['estimated_ms'] = round(path['estimated_ms'], 1)
+        path['steady_ms'] = round(path.get('steady_ms', path['estimated_ms']), 1)
+    return paths
+
+
+def choose_plan(filters, stats, top_k, index_enabled, index_warm, indexed_dimensions,
+                relaxation_order=(), remaining_ms=None, scan_segments=1):
+    """
+    Plan for one query: {'plan', 'reason', 'stages': [access path, ...], 'fallback': [...]}
+
+    Each stage is the access path with the lowest steady_ms whose
+    estimated_ms fits the time left after PLANNER_GENERATION_RESERVE_MS
+    (the cheapest overall if none fits). When the estimate says the full
+    filter set cannot fill top_k, the plan becomes a staged relaxation that
+    drops filters in relaxation_order; stages estimated to match nothing
+    are skipped. Otherwise the relaxed stages are kept as 'fallback', run
+    only if the strict stage finds nothing (the estimate assumes
+    independent filters, so correlated ones can over-constrain unseen).
+    """
+    budget_ms = None if remaining_ms is None else remaining_ms - PLANNER_GENERATION_RESERVE_MS
+
+    def cheapest(stage_filters):
+        paths = access_paths(stage_filters, stats, index_enabled, index_warm, indexed_dimensions, scan_segments)
+        fitting = [path for path in paths if budget_ms is None or path['estimated_ms'] <= budget_ms]
+        if fitting:
+            return min(fitting, key=lambda path: path['steady_ms']), paths
+        return min(paths, key=lambda path: path['estimated_ms']), paths
+
+    stage_filters = relaxation_stages(filters, relaxation_order)
+    strict, candidates = cheapest(stage_filters[0])
+    relaxed = [cheapest(f)[0] for f in stage_filters[1:] if stats.estimate(f) > 0]
+    plan = {
+        'plan': strict['plan'],
+        'statistics': stats.source,
+        'total_rows': stats.total,
+        'budget_ms': None if budget_ms is None else round(budget_ms, 1),
+        'reason': ('' if budget_ms is None else f"{budget_ms:.0f} ms budget; ") + 'candidates ' + ', '.join(f"{path['plan']} ~{path['steady_ms']:g} ms"
+                                            + ('' if path['steady_ms'] == path['estimated_ms']
+                                               else f" (~{path['estimated_ms']:g} ms cold)")
+                                            for path in candidates),
+        'stages': [strict],
+        'fallback': relaxed
+    }
+
+    if filters and strict['estimated_matches'] < top_k and relaxed:
+        plan['plan'] = 'relaxation'
+        plan['stages'] = [strict] + relaxed
+        plan['fallback'] = []
+        plan['reason'] = (f"~{strict['estimated_matches']:g} rows match all filters, fewer than top_k={top_k}; "
+                          f"relaxing {', '.join(name for name in relaxation_order if name in filters)}; "
+                          + plan['reason'])
+    return plan
+
+
+def fallback_plan(filters, index_enabled, route):
+    """Plan used when no statistics are available: the pre-planner behaviour"""
+    if index_enabled:
+        stage = {'plan': 'vector_search', 'filter_mode': 'bitset' if filters else 'none'}
+    elif route is not None:
+        stage = {'plan': 'key_lookup', 'route': route}
+    else:
+        stage = {'plan': 'filtered_scan'}
+    stage['filters'] = dict(filters)
+    return {'plan': stage['plan'], 'statistics': None, 'reason': 'no statistics available',
+            'stages': [stage], 'fallback': []}
+
+
+def oversampled_k(top_k, fraction, available):
+    """Unfiltered results to fetch so about top_k survive a post-filter keeping fraction of rows"""
+    if fraction <= 0:
+        return available
+    return min(available, max(top_k, math.ceil(2 * top_k / fraction)))
@@ -0,0 +1,220 @@
+"""
+HelmStream - Quantized Embedding Index
+Compact codes for every row, searched coarse-to-fine: a sign-bit Hamming
+scan picks a shortlist, per-dimension int8 codes re-rank it, and the final
+few candidates are re-scored exactly against the memory-mapped float rows
+"""
+
+import os
+import time
+
+from helmstream_common.scan import TopK
+
+try:
+    import numpy as np
+except ImportError:  # Quantized search needs NumPy; without it search stays exact
+    np = None
+
+# Rows kept after the 1-bit Hamming scan
+QUANT_BINARY_CANDIDATES = int(os.environ.get('QUANT_BINARY_CANDIDATES', '2000'))
+# Rows kept after int8 re-ranking, then scored exactly
+QUANT_RESCORE_CANDIDATES = int(os.environ.get('QUANT_RESCORE_CANDIDATES', '100'))
+
+_POPCOUNT = None
+
+
+def popcount_rows(bits):
+    """Set bits per row of a (n, bytes) uint8 array"""
+    global _POPCOUNT
+    if hasattr(np, 'bitwise_count'):  # NumPy 2.0+
+        if bits.shape[1] % 8 == 0 and bits.flags.c_contiguous:
+            bits = bits.view(np.uint64)  # 8x fewer elements to count
+        return np.bitwise_count(bits).sum(axis=1, dtype=np.int32)
+    if _POPCOUNT is None:
+        _POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+    return _POPCOUNT[bits].sum(axis=1, dtype=np.int32)
+
+
+def _grown(codes, capacity):
+    """codes copied into a zeroed array of capacity rows"""
+    grown = np.zeros((capacity,) + codes.shape[1:], dtype=codes.dtype)
+    grown[:len(codes)] = codes
+    return grown
+
+
+class QuantizedIndex:
+    """
+    int8 + 1-bit codes over the rows of a NumpyMatrix
+
+    Calibration (per-dimension mean, min and scale) is fitted on build()
+    and refitted once the corpus has doubled; rows added in between are
+    encoded with the current calibration. Scores returned are exact cosine
+    similarities, so only recall is approximate. The float rows are only
+    read for the final re-score, so build() moves them out of the Python
+    heap (NumpyMatrix.spill): the codes are the only per-row data left
+    resident, and the float rows stay in the page cache.
+    """
+
+    def __init__(self, binary_candidates=None, rescore_candidates=None, min_rows=20000):
+        self.binary_candidates = QUANT_BINARY_CANDIDATES if binary_candidates is None else binary_candidates
+        self.rescore_candidates = QUANT_RESCORE_CANDIDATES if rescore_candidates is None else rescore_candidates
+        self.min_rows = min_rows
+        self.dim = 0
+        self.trained_rows = 0
+        self.mean = None
+        self.low = None
+        self.scale = None
+        self.bits = None
+        self.codes = None
+        self.valid = None
+        self.counters = {
+            'ann_searches': 0,
+            'exact_searches': 0,
+            'builds': 0,
+            'last_build_ms': 0.0
+        }
+
+    @property
+    def trained(self):
+        return self.mean is not None
+
+    def __len__(self):
+        return int(self.valid.sum()) if self.valid is not None else 0
+
+    def _encode(self, vectors):
+        """(sign bits, int8 codes) for an (n, dim) float array"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        bits = np.packbits(vectors > self.mean, axis=-1)
+        codes = np.clip(np.rint((vectors - self.low) / self.scale), 0, 255) - 128
+        return bits, codes.astype(np.int8)
+
+    def build(self, matrix):
+        """Calibrate on the live rows of matrix (refitting if the corpus drifted) and encode every row"""
+        self.bits = self.codes = self.valid = None
+        if np is None or getattr(matrix, 'backend', None) != 'numpy':
+            self.mean = None
+            return
+
+        live = matrix.norms > 0
+        if int(live.sum()) < self.min_rows:
+            self.mean = None
+            return
+
+        started = time.perf_counter()
+        vectors = matrix.rows
+        count = int(live.sum())
+        if (not self.trained or self.dim != matrix.dim
+                or count > 2 * self.trained_rows or 2 * count < self.trained_rows):
+            sample = vectors[live]
+            self.dim = matrix.dim
+            self.mean = sample.mean(axis=0).astype(np.float32)
+            self.low = sample.min(axis=0).astype(np.float32)
+            spread = sample.max(axis=0) - self.low
+            self.scale = (np.where(spread > 0, spread, 1.0) / 255).astype(np.float32)
+            self.trained_rows = count
+
+        self.bits, self.codes = self._encode(vectors)
+        self.valid = live.copy()
+        released = matrix.spill()
+        elapsed = (time.perf_counter() - started) * 1000
+        self.counters['builds'] += 1
+        self.counters['last_build_ms'] = round(elapsed, 1)
+        print(f"[QUANT] Encoded {count} rows ({self.bytes_per_vector()} bytes/vector) in {elapsed:.0f} ms: "
+              f"{self.resident_bytes() / 2**20:.1f} MiB of codes resident, "
+              f"{released / 2**20:.1f} MiB of float rows moved out of the heap")
+
+    def needs_build(self, matrix):
+        """True once an untrained index has enough rows, or the corpus doubled since calibration"""
+        if np is None or getattr(matrix, 'backend', None) != 'numpy':
+            return False
+        if not self.trained:
+            return len(matrix) - len(matrix.irregular) >= self.min_rows
+        return len(self) > 2 * self.trained_rows
+
+    def add(self, matrix, row):
+        """Encode one row after it was appended or replaced"""
+        if not self.trained:
+            return
+        if row >= len(self.valid):
+            capacity = max(row + 1, 2 * len(self.valid))
+            self.bits = _grown(self.bits, capacity)
+            self.codes = _grown(self.codes, capacity)
+            self.valid = _grown(self.valid, capacity)
+        bits, codes = self._encode(matrix.vector(row)[None, :])
+        self.bits[row] = bits[0]
+        self.codes[row] = codes[0]
+        self.valid[row] = matrix.norms[row] > 0
+
+    def remove(self, row):
+        if self.valid is not None and row < len(self.valid):
+            self.valid[row] = False
+
+    def bytes_per_vector(self):
+        """Code bytes per row: int8 codes plus sign bits"""
+        return self.dim + (self.dim + 7) // 8 if self.trained else 0
+
+    def resident_bytes(self):
+        """Heap bytes actually held by the codes, including spare capacity"""
+        return sum(codes.nbytes for codes in (self.bits, self.codes, self.valid) if codes is not None)
+
+    def shortlist(self, query, rows=None, keep=None):
+        """Rows with the smallest sign-bit Hamming distance to query"""
+        q = np.asarray(query, dtype=np.float32)
+        qbits = np.packbits(q > self.mean)
+        count = len(self.valid)
+        distances = popcount_rows(np.bitwise_xor(self.bits[:count], qbits))
+        allowed = self.valid
+        if rows is not None:
+            allowed = np.zeros(count, dtype=bool)
+            index = np.asarray(rows, dtype=np.intp)
+            allowed[index[index < count]] = True
+            allowed &= self.valid
+        eligible = np.flatnonzero(allowed)
+        keep = min(keep or self.binary_candidates, len(eligible))
+        if keep < len(eligible):
+            eligible = eligible[np.argpartition(distances[eligible], keep - 1)[:keep]]
+        return eligible
+
+    def rerank(self, query, candidates, norms, keep=None):
+        """Best rescore_candidates of candidates by int8-approximated cosine"""
+        q = np.asarray(query, dtype=np.float32)
+        weights = q * self.scale
+        # x ~ low + (code + 128) * scale, so q.x is affine in the int8 codes
+        approx = self.codes[candidates].astype(np.float32) @ weights + float(q @ self.low + 128 * weights.sum())
+        approx = approx / np.where(norms[candidates] > 0, norms[candidates], 1.0)
+        keep = min(keep or self.rescore_candidates, len(candidates))
+        if keep < len(candidates):
+            candidates = candidates[np.argpartition(-approx, keep - 1)[:keep]]
+        return candidates
+
+    def search(self, matrix, query, top_k, rows=None):
+        """(score, row) pairs via the coarse-to-fine pipeline, or None to fall back to exact search"""
+        if not self.trained or len(query) != matrix.dim or (rows is not None and len(rows) < self.min_rows):
+            self.counters['exact_searches'] += 1
+            return None
+
+        shortlist = self.shortlist(query, rows, max(self.binary_candidates, top_k))
+        candidates = self.rerank(query, shortlist, matrix.norms, max(self.rescore_candidates, top_k))
+        if matrix.irregular:
+            extra = list(matrix.irregular) if rows is None else [r for r in rows if r in matrix.irregular]
+            candidates = np.concatenate([candidates, np.asarray(extra, dtype=np.intp)])
+        if len(candidates) < top_k:
+            self.counters['exact_searches'] += 1
+            return None
+
+        self.counters['ann_searches'] += 1
+        candidates = np.sort(candidates).tolist()
+        top = TopK(top_k)
+        top.extend(matrix.scores_for(query, candidates), candidates)
+        return top.results()
+
+    def stats(self):
+        return dict(
+            self.counters,
+            indexed_rows=len(self),
+            bytes_per_vector=self.bytes_per_vector(),
+            resident_bytes=self.resident_bytes(),
+            float32_bytes_per_vector=self.dim * 4,
+            binary_candidates=self.binary_candidates,
+            rescore_candidates=self.rescore_candidates
+        )
@@ -0,0 +1,116 @@
+"""
+HelmStream - Adaptive Rate Control
+Runs ingest work on a bounded pool whose concurrency follows AIMD: it
+halves when Bedrock throttles and grows by one slot per window of
+successful calls
+"""
+
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+# Worker threads, and the concurrency a batch starts at and may grow to
+INGEST_MAX_CONCURRENCY = int(os.environ.get('INGEST_MAX_CONCURRENCY', '8'))
+INGEST_INITIAL_CONCURRENCY = int(os.environ.get('INGEST_INITIAL_CONCURRENCY', '2'))
+# A throttled item is retried this many times, after full-jitter backoff (seconds)
+THROTTLE_MAX_RETRIES = int(os.environ.get('THROTTLE_MAX_RETRIES', '4'))
+THROTTLE_BACKOFF_BASE = 0.2
+THROTTLE_BACKOFF_CAP = 5.0
+
+THROTTLE_ERROR_CODES = ('ThrottlingException', 'TooManyRequestsException', 'ServiceQuotaExceededException')
+
+
+def is_throttle(error):
+    """True for a Bedrock (or other AWS) throttling error"""
+    return isinstance(error, ClientError) and error.response.get('Error', {}).get('Code') in THROTTLE_ERROR_CODES
+
+
+class AIMDController:
+    """
+    Concurrency limit adjusted by additive increase, multiplicative decrease
+
+    acquire() blocks until fewer than limit calls are in flight and
+    returns a ticket for release(). Each success adds 1/limit (one slot
+    per window of successes); a throttle multiplies the limit by
+    decrease, at most once per window: throttles from calls that started
+    before the last cut do not cut again. Other errors leave it alone.
+    """
+
+    def __init__(self, initial=None, maximum=None, minimum=1, decrease=0.5):
+        self.maximum = max(1, INGEST_MAX_CONCURRENCY if maximum is None else maximum)
+        self.minimum = max(1, min(minimum, self.maximum))
+        self.limit = float(min(self.maximum, max(self.minimum,
+                                                 INGEST_INITIAL_CONCURRENCY if initial is None else initial)))
+        self.decrease = decrease
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._epoch = 0
+        self.successes = 0
+        self.throttles = 0
+        self.low = self.high = int(self.limit)
+
+    def acquire(self):
+        with self._cond:
+            while self._in_flight >= int(self.limit):
+                self._cond.wait()
+            self._in_flight += 1
+            return self._epoch
+
+    def release(self, ticket, outcome='success'):
+        """outcome is 'success', 'throttle' or 'error'"""
+        with self._cond:
+            self._in_flight -= 1
+            if outcome == 'throttle':
+                self.throttles += 1
+                if ticket == self._epoch:
+                    self.limit = max(self.minimum, self.limit * self.decrease)
+                    self._epoch += 1
+            elif outcome == 'success':
+                self.successes += 1
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self.low = min(self.low, int(self.limit))
+            self.high = max(self.high, int(self.limit))
+            self._cond.notify_all()
+
+    def summary(self):
+        return (f"{self.throttles} throttled, concurrency {self.low}-{self.high} "
+                f"(final {int(self.limit)}/{self.maximum})")
+
+
+def run_adaptive(fn, items, controller=None):
+    """
+    fn(item) for every item under an AIMDController, in order; a failure yields its exception
+
+    A throttled call is retried after jittered exponential backoff, up to
+    THROTTLE_MAX_RETRIES times, so fn must be safe to repeat. Returns
+    (results, controller).
+    """
+    controller = controller or AIMDController()
+
+    def call(item):
+        attempt = 0
+        while True:
+            ticket = controller.acquire()
+            try:
+                result = fn(item)
+            except Exception as e:
+                throttled = is_throttle(e)
+                controller.release(ticket, 'throttle' if throttled else 'error')
+                if not throttled or attempt >= THROTTLE_MAX_RETRIES:
+                    return e
+                attempt += 1
+                time.sleep(random.uniform(0, min(THROTTLE_BACKOFF_CAP, THROTTLE_BACKOFF_BASE * 2 ** attempt)))
+                continue
+            controller.release(ticket)
+            return result
+
+    items = list(items)
+    if len(items) <= 1:
+        return [call(item) for item in items], controller
+    workers = min(controller.maximum, len(items))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ingest') as executor:
+        return list(executor.map(call, items)), controller
@@ -0,0 +1,262 @@
+"""
+HelmStream - Segmented DynamoDB Scanner
+Pages every scan segment to completion on a bounded thread pool and streams
+the pages back to the caller as they arrive; hydrates items by key with
+BatchGetItem
+"""
+
+import heapq
+import queue
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import numpy as np
+except ImportError:  # TopK falls back to pushing every score
+    np = None
+
+_DONE = object()
+
+# BatchGetItem accepts at most 100 keys per request
+BATCH_GET_LIMIT = 100
+# UnprocessedKeys retry budget and full-jitter backoff bounds (seconds)
+BATCH_GET_MAX_ATTEMPTS = 8
+BATCH_GET_BACKOFF_BASE = 0.05
+BATCH_GET_BACKOFF_CAP = 2.0
+
+
+class ScanStats:
+    """Counters for one logical scan across all of its segments"""
+
+    def __init__(self, total_segments=1):
+        self.total_segments = total_segments
+        self.pages = 0
+        self.items = 0
+        self.scanned = 0
+        self.consumed_capacity = 0.0
+        self.started = time.perf_counter()
+        self.wall_time_ms = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, response):
+        with self._lock:
+            self.pages += 1
+            self.items += response.get('Count', len(response.get('Items', [])))
+            self.scanned += response.get('ScannedCount', 0)
+            capacity = response.get('ConsumedCapacity') or {}
+            self.consumed_capacity += float(capacity.get('CapacityUnits', 0))
+
+    def record_batch(self, response, table_name):
+        """Count one BatchGetItem response (ConsumedCapacity is a per-table list there)"""
+        with self._lock:
+            self.pages += 1
+            self.items += len(response.get('Responses', {}).get(table_name, []))
+            for capacity in response.get('ConsumedCapacity') or []:
+                self.consumed_capacity += float(capacity.get('CapacityUnits', 0))
+
+    def finish(self):
+        self.wall_time_ms = (time.perf_counter() - self.started) * 1000
+        return self
+
+    def as_dict(self):
+        return {
+            'segments': self.total_segments,
+            'pages': self.pages,
+            'items': self.items,
+            'scanned': self.scanned,
+            'consumed_capacity': round(self.consumed_capacity, 2),
+            'wall_time_ms': round(self.wall_time_ms, 1)
+        }
+
+    def __str__(self):
+        return (f"{self.items} items in {self.pages} pages over {self.total_segments} segment(s), "
+                f"{self.consumed_capacity:.1f} RCU, {self.wall_time_ms:.0f} ms")
+
+
+def _scan_segment(client, table_name, scan_kwargs, segment, total_segments, stats, stop):
+    """Yield the pages of one segment, following LastEvaluatedKey to the end"""
+    kwargs = dict(scan_kwargs, TableName=table_name, ReturnConsumedCapacity='TOTAL')
+    if total_segments > 1:
+        kwargs.update(Segment=segment, TotalSegments=total_segments)
+    while not stop.is_set():
+        response = client.scan(**kwargs)
+        stats.record(response)
+        yield response.get('Items', [])
+        if 'LastEvaluatedKey' not in response:
+            return
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def scan_pages(table, total_segments=1, max_workers=None, stats=None, **scan_kwargs):
+    """
+    Yield lists of items from a full table scan
+
+    With more than one segment, each segment runs on its own worker and
+    pages are handed back through a bounded queue, so memory stays at a
+    few pages regardless of table size. Uses the table's low-level client,
+    which (unlike the resource) is safe to share across threads.
+    """
+    total_segments = max(1, total_segments or 1)
+    stats = stats if stats is not None else ScanStats(total_segments)
+    client = table.meta.client
+    stop = threading.Event()
+
+    if total_segments == 1:
+        try:
+            yield from _scan_segment(client, table.name, scan_kwargs, 0, 1, stats, stop)
+        finally:
+            stats.finish()
+        return
+
+    workers = max(1, min(total_segments, max_workers or total_segments))
+    pages = queue.Queue(maxsize=workers * 2)
+
+    def put(entry):
+        while not stop.is_set():
+            try:
+                pages.put(entry, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def run(segment):
+        try:
+            for items in _scan_segment(client, table.name, scan_kwargs, segment, total_segments, stats, stop):
+                put(items)
+        except Exception as e:
+            put(e)
+        finally:
+            put(_DONE)
+
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='scan')
+    try:
+        for segment in range(total_segments):
+            executor.submit(run, segment)
+        remaining = total_segments
+        while remaining:
+            entry = pages.get()
+            if entry is _DONE:
+                remaining -= 1
+            elif isinstance(entry, Exception):
+                raise entry
+            else:
+                yield entry
+    finally:
+        stop.set()
+        executor.shutdown(wait=True)
+        stats.finish()
+
+
+def query_pages(table, stats=None, **query_kwargs):
+    """Yield lists of items from a Query, following LastEvaluatedKey to the end"""
+    stats = stats if stats is not None else ScanStats()
+    kwargs = dict(query_kwargs, ReturnConsumedCapacity='TOTAL')
+    while True:
+        response = table.query(**kwargs)
+        stats.record(response)
+        yield response.get('Items', [])
+        if 'LastEvaluatedKey' not in response:
+            break
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    stats.finish()
+
+
+def batch_get_items(table, keys, stats=None, **get_kwargs):
+    """
+    Fetch items by primary key with BatchGetItem, in the order of keys
+
+    Requests go out 100 keys at a time; UnprocessedKeys (throttling or the
+    16 MB response cap) are retried with jittered exponential backoff.
+    Keys with no item are skipped. get_kwargs (ProjectionExpression,
+    ConsistentRead, ...) apply to every request.
+    """
+    stats = stats if stats is not None else ScanStats()
+    if not keys:
+        stats.finish()
+        return []
+
+    key_names = list(keys[0])
+    found = {}
+    pending = list({tuple(key[name] for name in key_names): key for key in keys}.values())
+    attempt = 0
+    client = table.meta.client
+    while pending:
+        chunk, pending = pending[:BATCH_GET_LIMIT], pending[BATCH_GET_LIMIT:]
+        response = client.batch_get_item(
+            RequestItems={table.name: dict(get_kwargs, Keys=chunk)},
+            ReturnConsumedCapacity='TOTAL'
+        )
+        stats.record_batch(response, table.name)
+        for item in response.get('Responses', {}).get(table.name, []):
+            found[tuple(item[name] for name in key_names)] = item
+
+        unprocessed = response.get('UnprocessedKeys', {}).get(table.name, {}).get('Keys', [])
+        if unprocessed:
+            attempt += 1
+            if attempt >= BATCH_GET_MAX_ATTEMPTS:
+                raise RuntimeError(f"BatchGetItem left {len(unprocessed)} keys unprocessed "
+                                   f"after {attempt} attempts on {table.name}")
+            time.sleep(random.uniform(0, min(BATCH_GET_BACKOFF_CAP, BATCH_GET_BACKOFF_BASE * 2 ** attempt)))
+            pending = unprocessed + pending
+
+    stats.finish()
+    ordered = (found.get(tuple(key[name] for name in key_names)) for key in keys)
+    return [item for item in ordered if item is not None]
+
+
+class TopK:
+    """
+    Bounded min-heap keeping the k highest-scoring items
+
+    Ties are broken by arrival order, matching a stable descending sort of
+    the full result set. NumPy score arrays are pre-selected with
+    argpartition, so only the rows that can still enter the heap are
+    pushed one by one.
+    """
+
+    def __init__(self, k):
+        self.k = max(0, k)
+        self._heap = []
+        self._seq = 0
+
+    def push(self, score, item):
+        entry = (score, -self._seq, item)
+        self._seq += 1
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, entry)
+        elif self.k and entry[:2] > self._heap[0][:2]:
+            heapq.heapreplace(self._heap, entry)
+
+    def extend(self, scores, items):
+        if np is not None and isinstance(scores, np.ndarray):
+            if not hasattr(items, '__getitem__'):
+                items = list(items)
+            for i in self._contenders(scores).tolist():
+                self.push(float(scores[i]), items[i])
+            return
+        for score, item in zip(scores, items):
+            self.push(score, item)
+
+    def _contenders(self, scores):
+        """Indices (ascending) of the scores that could enter the heap"""
+        if not self.k or not len(scores):
+            return np.zeros(0, dtype=np.intp)
+        mask = np.ones(len(scores), dtype=bool)
+        if self.k < len(scores):
+            kth = scores[np.argpartition(-scores, self.k - 1)[:self.k]].min()
+            # Keep every score tied with the k-th best so arrival order settles ties
+            mask = scores >= kth
+        if len(self._heap) == self.k:
+            # A later arrival only displaces the minimum by scoring strictly higher
+            mask &= scores > self._heap[0][0]
+        return np.flatnonzero(mask)
+
+    def __len__(self):
+        return len(self._heap)
+
+    def results(self):
+        """(score, item) pairs, best first"""
+        ordered = sorted(self._heap, key=lambda entry: (-entry[0], -entry[1]))
+        return [(score, item) for score, _, item in ordered]
@@ -0,0 +1,544 @@
+"""
+HelmStream - Similarity Kernels
+Scores a whole corpus against a query embedding as one matrix-vector product
+"""
+
+import math
+import mmap
+import os
+import tempfile
+from array import array
+from operator import mul
+
+from helmstream_common.embedding_codec import decode_embedding, is_normalized
+from helmstream_common.scan import TopK
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; the array kernel covers its absence
+    np = None
+
+# 'numpy', 'array' or 'auto' (NumPy when importable)
+SIMILARITY_BACKEND = os.environ.get('SIMILARITY_BACKEND', 'auto')
+# float32 halves memory; float64 reproduces the legacy float scores
+SIMILARITY_DTYPE = os.environ.get('SIMILARITY_DTYPE', 'float32')
+# Unlinked files holding float rows moved out of the heap (NumpyMatrix.spill)
+SIMILARITY_SPILL_DIR = os.environ.get('SIMILARITY_SPILL_DIR', '/tmp/helmstream-rows')
+
+_sumprod = getattr(math, 'sumprod', None)  # Python 3.12+
+# Stored rows this close to length 1 are treated as pre-normalized
+UNIT_TOLERANCE = 1e-5
+
+
+def cosine_similarity(vec1, vec2):
+    """Reference cosine similarity (the original per-item implementation)"""
+    dot_product = sum(a * b for a, b in zip(vec1, vec2))
+    magnitude1 = math.sqrt(sum(a * a for a in vec1))
+    magnitude2 = math.sqrt(sum(b * b for b in vec2))
+    if magnitude1 == 0 or magnitude2 == 0:
+        return 0.0
+    return dot_product / (magnitude1 * magnitude2)
+
+
+def _dot(a, b):
+    if _sumprod is not None:
+        return _sumprod(a, b)
+    return sum(map(mul, a, b))
+
+
+def _file_backed(rows):
+    """True when rows view a memory map (a snapshot or spill file) rather than heap memory"""
+    while rows is not None:
+        if isinstance(rows, (mmap.mmap, np.memmap)):
+            return True
+        rows = rows.obj if isinstance(rows, memoryview) else getattr(rows, 'base', None)
+    return False
+
+
+class _BaseMatrix:
+    """
+    Bookkeeping shared by both kernels
+
+    Rows whose length differs from the matrix dimension (including empty
+    embeddings) are kept aside and scored with the reference function, so
+    they keep the legacy zip-truncation and zero-magnitude semantics.
+    Matrices grow in place with append() and rows can be replaced with
+    set_row(), so a warm index never has to be repacked from scratch.
+
+    Rows flagged unit=True (stored pre-normalized, see embedding_codec)
+    skip the norm computation; while every row is unit length, scoring is a
+    plain dot product against the once-normalized query.
+    """
+
+    backend = None
+
+    def __init__(self, vectors=(), dim=None, dtype=None, units=None):
+        vectors = list(vectors)
+        if dim is None:
+            dim = next((len(v) for v in vectors if len(v)), 0)
+        self.dim = dim
+        self.dtype = dtype or SIMILARITY_DTYPE
+        self.irregular = {}
+        self.all_unit = True
+        self._count = 0
+        self._init_storage()
+        units = units or [False] * len(vectors)
+        for vector, unit in zip(vectors, units):
+            self.append(vector, unit)
+
+    @classmethod
+    def from_rows(cls, rows, count, dim, dtype=None):
+        """Wrap packed float32 rows (e.g. a memory-mapped snapshot) as a matrix"""
+        matrix = cls((), dim=dim, dtype=dtype)
+        matrix._adopt(rows, count)
+        matrix._count = count
+        return matrix
+
+    def __len__(self):
+        return self._count
+
+    def _regular(self, vector):
+        if not self.dim and len(vector):
+            # First real row fixes the dimension; earlier rows were all empty
+            self.dim = len(vector)
+            count, self._count = self._count, 0
+            self._init_storage()
+            for _ in range(count):
+                self._append(None)
+                self._count += 1
+        return bool(self.dim) and len(vector) == self.dim
+
+    def append(self, vector, unit=False):
+        """Add a row at the end; returns its index"""
+        index = self._count
+        if self._regular(vector):
+            self.all_unit = self.all_unit and unit
+            self._append(vector, unit)
+        else:
+            self.irregular[index] = vector
+            self._append(None)
+        self._count += 1
+        return index
+
+    def set_row(self, index, vector, unit=False):
+        """Replace row index in place"""
+        self.irregular.pop(index, None)
+        if self._regular(vector):
+            self.all_unit = self.all_unit and unit
+            self._assign(index, vector, unit)
+        else:
+            self.irregular[index] = vector
+            self._assign(index, None)
+
+    def clear_row(self, index):
+        """Zero row index so it scores 0.0 (used for deleted items)"""
+        self.irregular.pop(index, None)
+        self._assign(index, None)
+
+    def row(self, i):
+        """Row i as a list of floats"""
+        if i in self.irregular:
+            return list(self.irregular[i])
+        return self._row(i)
+
+    def scores(self, query):
+        """Cosine similarity of every row against query, as a list of floats"""
+        scores = self.score_array(query)
+        return scores if isinstance(scores, list) else scores.tolist()
+
+    def score_array(self, query):
+        """Like scores(), but left as a NumPy array by the NumPy kernel (for TopK.extend)"""
+        if not self._count:
+            return []
+        if len(query) != self.dim:
+            return [cosine_similarity(query, self.row(i)) for i in range(self._count)]
+        scores = self._scores(query)
+        for i, vector in self.irregular.items():
+            scores[i] = cosine_similarity(query, vector)
+        return scores
+
+    def score_arrays(self, queries):
+        """
+        score_array() for several queries at once
+
+        The NumPy kernel scores every query in one matrix-matrix product,
+        so a batch streams the corpus through the cache once instead of
+        once per query.
+        """
+        queries = list(queries)
+        if not self._count:
+            return [[] for _ in queries]
+        results = [None] * len(queries)
+        regular = [i for i, query in enumerate(queries) if len(query) == self.dim]
+        if regular:
+            for i, scores in zip(regular, self._scores_many([queries[i] for i in regular])):
+                for row, vector in self.irregular.items():
+                    scores[row] = cosine_similarity(queries[i], vector)
+                results[i] = scores
+        for i, query in enumerate(queries):
+            if results[i] is None:
+                results[i] = self.score_array(query)
+        return results
+
+    def _scores_many(self, queries):
+        return [self._scores(query) for query in queries]
+
+    def scores_for(self, query, rows):
+        """Cosine similarity of just the given rows, in the order given"""
+        rows = list(rows)
+        if not rows:
+            return []
+        if len(query) != self.dim:
+            return [cosine_similarity(query, self.row(i)) for i in rows]
+        scores = self._scores_for(query, rows)
+        if self.irregular:
+            for j, i in enumerate(rows):
+                if i in self.irregular:
+                    scores[j] = cosine_similarity(query, self.irregular[i])
+        return scores
+
+
+class NumpyMatrix(_BaseMatrix):
+    """Contiguous (n, dim) matrix scored with a single BLAS gemv"""
+
+    backend = 'numpy'
+
+    def _init_storage(self):
+        dtype = np.float64 if self.dtype == 'float64' else np.float32
+        self._buffer = np.zeros((16, self.dim), dtype=dtype)
+        self._norms = np.zeros(16, dtype=np.float64)
+        # Writes past a read-only (mapped) base: replaced base rows and appended rows
+        self._patches = {}
+        self._tail = None
+        self._spilled = False
+
+    def spill(self):
+        """
+        Keep the float rows out of the Python heap from now on
+
+        Rows mapped from a snapshot stay mapped, with only the rows
+        written since held in the heap overlay; heap rows move to an
+        unlinked file under SIMILARITY_SPILL_DIR, and later writes and
+        growth go to such a file instead of a heap copy. The rows then
+        live in the page cache, which the kernel can reclaim. Returns the
+        heap bytes released.
+        """
+        released = 0
+        self._spilled = True
+        if self.dim and self._buffer.flags.writeable and not _file_backed(self._buffer):
+            released = self._buffer.nbytes
+            self._buffer = self._mapped(self._buffer, len(self._buffer))
+        return released
+
+    def _mapped(self, rows, capacity):
+        """rows copied into a zeroed (capacity, dim) array backed by an unlinked file"""
+        os.makedirs(SIMILARITY_SPILL_DIR, exist_ok=True)
+        with tempfile.TemporaryFile(dir=SIMILARITY_SPILL_DIR) as handle:
+            mapped = np.memmap(handle, dtype=rows.dtype, mode='w+', shape=(capacity, self.dim))
+        mapped[:len(rows)] = rows
+        return mapped
+
+    def resident_bytes(self):
+        """Heap bytes held by the float rows (only the overlay while the base is memory-mapped)"""
+        overlay = sum(vector.nbytes for vector in self._patches.values())
+        if self._tail is not None:
+            overlay += self._tail.nbytes
+        return overlay + (0 if _file_backed(self._buffer) else self._buffer.nbytes)
+
+    @property
+    def _overlaid(self):
+        return self._tail is not None or bool(self._patches)
+
+    @property
+    def rows(self):
+        """(n, dim) rows; a heap copy once rows were written past a mapped base"""
+        if not self._overlaid:
+            return self._buffer[:self._count]
+        return self._take(np.arange(self._count))
+
+    @property
+    def norms(self):
+        return self._norms[:self._count]
+
+    def vector(self, i):
+        """Row i as a float array, a view where possible"""
+        if i in self._patches:
+            return self._patches[i]
+        if self._tail is not None and i >= len(self._buffer):
+            return self._tail[i - len(self._buffer)]
+        return self._buffer[i]
+
+    def _take(self, index):
+        """Rows at index (an intp array), gathered across the base and the overlay"""
+        if not self._overlaid:
+            return self._buffer[index]
+        base = len(self._buffer)
+        rows = np.empty((len(index), self.dim), dtype=self._buffer.dtype)
+        mapped = index < base
+        rows[mapped] = self._buffer[index[mapped]]
+        if not mapped.all():
+            rows[~mapped] = self._tail[index[~mapped] - base]
+        if self._patches:
+            for j in np.flatnonzero(np.isin(index, list(self._patches))).tolist():
+                rows[j] = self._patches[int(index[j])]
+        return rows
+
+    def _dots(self, q):
+        """Every row dotted with q (dim,) or (dim, m), in float64"""
+        if not self._overlaid:
+            return (self.rows @ q).astype(np.float64)
+        base = len(self._buffer)
+        parts = [self._buffer @ q]
+        if self._tail is not None:
+            parts.append(self._tail[:self._count - base] @ q)
+        dots = np.concatenate(parts).astype(np.float64)
+        for row, vector in self._patches.items():
+            dots[row] = vector @ q
+        return dots
+
+    def _adopt(self, rows, count):
+        rows = np.asarray(rows).reshape(count, self.dim)
+        if rows.dtype != self._buffer.dtype:
+            rows = rows.astype(self._buffer.dtype)
+        # Read-only views (mmap) stay zero-copy: writes go to the overlay
+        self._buffer = rows
+        self._norms = np.sqrt(np.einsum('ij,ij->i', rows, rows, dtype=np.float64))
+        unit = np.abs(self._norms - 1.0) < UNIT_TOLERANCE
+        self.all_unit = bool(np.all(unit | (self._norms == 0)))
+        if self.all_unit:
+            self._norms[unit] = 1.0
+
+    def _append(self, vector, unit=False):
+        if not self._buffer.flags.writeable:
+            # Rows appended past a read-only base go to a heap tail
+            slot = self._count - len(self._buffer)
+            if self._tail is None:
+                self._tail = np.zeros((16, self.dim), dtype=self._buffer.dtype)
+            elif slot == len(self._tail):
+                self._tail = np.resize(self._tail, (2 * len(self._tail), self.dim))
+            if self._count == len(self._norms):
+                self._norms = np.resize(self._norms, max(16, 2 * len(self._norms)))
+        elif self._count == len(self._buffer):
+            # Amortized O(1) growth, like list.append
+            capacity = max(16, len(self._buffer) * 2)
+            if self._spilled:
+                self._buffer = self._mapped(self._buffer, capacity)
+            else:
+                self._buffer = np.resize(self._buffer, (capacity, self.dim))
+            self._norms = np.resize(self._norms, capacity)
+        self._assign(self._count, vector, unit)
+
+    def _assign(self, index, vector, unit=False):
+        if self._buffer.flags.writeable:
+            target = self._buffer[index]
+        elif index < len(self._buffer):
+            # A replaced row of the read-only base is overridden, never copied wholesale
+            target = self._patches.get(index)
+            if target is None:
+                target = self._patches[index] = np.empty(self.dim, dtype=self._buffer.dtype)
+        else:
+            target = self._tail[index - len(self._buffer)]
+        if vector is None:
+            target[:] = 0
+            self._norms[index] = 0.0
+            return
+        target[:] = vector
+        if unit:
+            self._norms[index] = 1.0
+            return
+        self._norms[index] = math.sqrt(float(np.dot(target, target.astype(np.float64))))
+
+    def _row(self, i):
+        return self.vector(i).tolist()
+
+    def _scores(self, query):
+        q = np.asarray(query, dtype=self._buffer.dtype)
+        q_norm = math.sqrt(float(np.dot(q, q.astype(np.float64))))
+        if q_norm == 0:
+            return np.zeros(self._count)
+        dots = self._dots(q)
+        if self.all_unit:
+            return dots / q_norm
+        denom = self.norms * q_norm
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(denom > 0, dots / denom, 0.0)
+
+    def _scores_many(self, queries):
+        q = np.asarray(queries, dtype=self._buffer.dtype)
+        q_norms = np.sqrt(np.einsum('ij,ij->i', q, q, dtype=np.float64))
+        # One GEMM: (rows, dim) x (dim, queries)
+        dots = self._dots(q.T).T
+        denom = q_norms[:, None] if self.all_unit else q_norms[:, None] * self.norms[None, :]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scores = np.where(denom > 0, dots / denom, 0.0)
+        return list(scores)
+
+    def _scores_for(self, query, rows):
+        q = np.asarray(query, dtype=self._buffer.dtype)
+        q_norm = math.sqrt(float(np.dot(q, q.astype(np.float64))))
+        if q_norm == 0:
+            return [0.0] * len(rows)
+        index = np.asarray(rows, dtype=np.intp)
+        dots = (self._take(index) @ q).astype(np.float64)
+        if self.all_unit:
+            return (dots / q_norm).tolist()
+        denom = self._norms[index] * q_norm
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scores = np.where(denom > 0, dots / denom, 0.0)
+        return scores.tolist()
+
+
+class ArrayMatrix(_BaseMatrix):
+    """
+    Flat row-major array('f') matrix scored without NumPy
+
+    Row norms are computed once when a row is stored and the query norm
+    once per call, so each row costs a single C-level multiply-accumulate
+    pass.
+    """
+
+    backend = 'array'
+
+    def _init_storage(self):
+        typecode = 'd' if self.dtype == 'float64' else 'f'
+        self.rows = array(typecode)
+        self.norms = []
+
+    def _adopt(self, rows, count):
+        packed = array('f')
+        packed.frombytes(memoryview(rows).cast('B'))
+        if self.rows.typecode != 'f':
+            packed = array(self.rows.typecode, packed)
+        self.rows = packed
+        dim = self.dim
+        self.norms = [math.sqrt(_dot(packed[i * dim:(i + 1) * dim], packed[i * dim:(i + 1) * dim]))
+                      for i in range(count)]
+        self.all_unit = all(norm == 0 or abs(norm - 1.0) < UNIT_TOLERANCE for norm in self.norms)
+        if self.all_unit:
+            self.norms = [1.0 if norm else 0.0 for norm in self.norms]
+
+    def _packed(self, vector):
+        typecode = self.rows.typecode
+        if vector is None:
+            return array(typecode, [0.0]) * self.dim
+        if isinstance(vector, memoryview) and vector.format == typecode:
+            packed = array(typecode)
+            packed.frombytes(vector.cast('B'))
+            return packed
+        return array(typecode, vector)
+
+    def _append(self, vector, unit=False):
+        packed = self._packed(vector)
+        self.rows.extend(packed)
+        self.norms.append(1.0 if unit else math.sqrt(_dot(packed, packed)))
+
+    def _assign(self, index, vector, unit=False):
+        packed = self._packed(vector)
+        self.rows[index * self.dim:(index + 1) * self.dim] = packed
+        self.norms[index] = 1.0 if unit and vector is not None else math.sqrt(_dot(packed, packed))
+
+    def resident_bytes(self):
+        """Heap bytes held by the float rows"""
+        return len(self.rows) * self.rows.itemsize
+
+    def _row(self, i):
+        return self.rows[i * self.dim:(i + 1) * self.dim].tolist()
+
+    def _scores(self, query):
+        dim = self.dim
+        view = memoryview(self.rows)
+        q = array(self.rows.typecode, query)
+        q_norm = math.sqrt(_dot(q, q))
+        if q_norm == 0:
+            return [0.0] * self._count
+        if self.all_unit:
+            # Pure dot product: zero rows score 0.0 without a branch
+            q = array(q.typecode, [x / q_norm for x in q])
+            scores = [_dot(view[i * dim:(i + 1) * dim], q) for i in range(self._count)]
+            view.release()
+            return scores
+        scores = []
+        for i, norm in enumerate(self.norms):
+            if norm == 0:
+                scores.append(0.0)
+            else:
+                scores.append(_dot(view[i * dim:(i + 1) * dim], q) / (norm * q_norm))
+        view.release()
+        return scores
+
+    def _scores_for(self, query, rows):
+        dim = self.dim
+        view = memoryview(self.rows)
+        q = array(self.rows.typecode, query)
+        q_norm = math.sqrt(_dot(q, q))
+        if q_norm == 0:
+            return [0.0] * len(rows)
+        scores = []
+        for i in rows:
+            norm = self.norms[i]
+            if norm == 0:
+                scores.append(0.0)
+            else:
+                scores.append(_dot(view[i * dim:(i + 1) * dim], q) / (norm * q_norm))
+        view.release()
+        return scores
+
+
+def build_matrix(vectors=(), dim=None, backend=None, dtype=None, units=None):
+    """Pack embeddings into the fastest available similarity matrix (units flags pre-normalized rows)"""
+    backend = backend or SIMILARITY_BACKEND
+    if backend == 'numpy' or (backend == 'auto' and np is not None):
+        if np is None:
+            raise ImportError("SIMILARITY_BACKEND=numpy but NumPy is not installed")
+        return NumpyMatrix(vectors, dim=dim, dtype=dtype, units=units)
+    return ArrayMatrix(vectors, dim=dim, dtype=dtype, units=units)
+
+
+def build_matrix_from_rows(rows, count, dim, backend=None, dtype=None):
+    """Matrix over an existing packed float32 row buffer"""
+    backend = backend or SIMILARITY_BACKEND
+    if backend == 'numpy' or (backend == 'auto' and np is not None):
+        if np is None:
+            raise ImportError("SIMILARITY_BACKEND=numpy but NumPy is not installed")
+        return NumpyMatrix.from_rows(rows, count, dim, dtype=dtype)
+    return ArrayMatrix.from_rows(rows, count, dim, dtype=dtype)
+
+
+def top_k_pages(query_embedding, pages, top_k, key=None):
+    """
+    Streaming top-k over pages of items (e.g. from scan_pages)
+
+    Each page is decoded and scored as one matrix, then pushed through a
+    single bounded heap, so only the current page and k entries are alive
+    at once. key(item) picks what the heap keeps (default: the item).
+    Returns (score, kept) pairs, best first, ties in arrival order.
+    """
+    top = TopK(top_k)
+    for page in pages:
+        if not page:
+            continue
+        matrix = build_matrix([decode_embedding(item.get('embedding')) for item in page],
+                              units=[is_normalized(item) for item in page])
+        top.extend(matrix.score_array(query_embedding), page if key is None else [key(item) for item in page])
+    return top.results()
+
+
+def top_k_pages_many(query_embeddings, pages, top_k, key=None):
+    """top_k_pages() for several queries in one pass over the pages, one matrix-matrix product per page"""
+    tops = [TopK(top_k) for _ in query_embeddings]
+    for page in pages:
+        if not page:
+            continue
+        matrix = build_matrix([decode_embedding(item.get('embedding')) for item in page],
+                              units=[is_normalized(item) for item in page])
+        kept = page if key is None else [key(item) for item in page]
+        for top, scores in zip(tops, matrix.score_arrays(query_embeddings)):
+            top.extend(scores, kept)
+    return [top.results() for top in tops]
+
+
+def score_corpus(query_embedding, vectors, backend=None, dtype=None):
+    """Cosine scores for a list of embeddings against one query"""
+    if not vectors:
+        return []
+    return build_matrix(vectors, backend=backend, dtype=dtype).scores(query_embedding)
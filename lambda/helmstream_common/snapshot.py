@@ -0,0 +1,395 @@
+"""
+HelmStream - Index Snapshots
+One versioned binary file holding every embedding, id and metadata record,
+published behind an atomic manifest pointer and memory-mapped by readers
+
+File layout (little-endian, every section 64-byte aligned):
+    magic        4s   b'HSIX'
+    version      I    snapshot format version
+    dir_length   Q    length of the JSON directory that follows
+    directory    JSON dimension, row count, section offsets, corpus ranges
+    -- data start (section offsets are relative to here) --
+    matrix       float32[count, dim]
+    id_offsets   uint32[count + 1] into ids
+    ids          UTF-8 item keys
+    meta_offsets uint64[count + 1] into meta
+    meta         UTF-8 JSON object per row
+    lexical.<corpus>.*  optional BM25 postings per corpus (see lexical.py):
+                 terms (newline-separated), offsets uint64, rows uint32
+                 (corpus-relative), tfs uint16, lengths uint32[count]
+
+Rows are grouped by corpus ('emails', 'documents'); the directory records
+each corpus's first row, row count, key attribute and created_at
+high-water mark, so a reader can take a zero-copy slice of its own rows.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+import time
+from array import array
+from decimal import Decimal
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+MAGIC = b'HSIX'
+FORMAT_VERSION = 1
+PREFIX = struct.Struct('<4sIQ')
+ALIGNMENT = 64
+MANIFEST_NAME = 'manifest.json'
+
+# Where handlers look for snapshots: s3://bucket/prefix, file:///dir or a plain directory
+INDEX_SNAPSHOT_URI = os.environ.get('INDEX_SNAPSHOT_URI') or (
+    f"s3://{os.environ['S3_BUCKET_NAME']}/index" if os.environ.get('S3_BUCKET_NAME') else '')
+INDEX_SNAPSHOT_CACHE_DIR = os.environ.get('INDEX_SNAPSHOT_CACHE_DIR', '/tmp/helmstream-index')
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    raise TypeError(f"Cannot serialize {type(value).__name__} in snapshot metadata")
+
+
+def _pad(offset):
+    return (-offset) % ALIGNMENT
+
+
+# ============================================
+# WRITER
+# ============================================
+
+def write_snapshot(path, corpora, snapshot_version=None):
+    """
+    Write a snapshot file
+
+    corpora maps a corpus name to a dict with 'key' (item key attribute),
+    'rows' (list of (id, vector, metadata)), optional 'high_water_mark' and
+    optional 'lexical' (postings from lexical.build_postings). Returns the
+    directory that was written into the header.
+    """
+    rows = []
+    ranges = {}
+    dim = 0
+    for name, corpus in corpora.items():
+        ranges[name] = {
+            'start': len(rows),
+            'count': len(corpus['rows']),
+            'key': corpus['key'],
+            'high_water_mark': corpus.get('high_water_mark'),
+            'lexical': corpus.get('lexical') is not None
+        }
+        rows.extend(corpus['rows'])
+        dim = dim or next((len(vector) for _, vector, _ in corpus['rows'] if len(vector)), 0)
+
+    count = len(rows)
+    matrix = array('f')
+    zero_row = array('f', [0.0]) * dim
+    id_offsets = array('I', [0])
+    id_blob = bytearray()
+    meta_offsets = array('Q', [0])
+    meta_blob = bytearray()
+    for item_id, vector, metadata in rows:
+        if len(vector) == dim:
+            matrix.extend(vector)
+        else:
+            matrix.extend(zero_row)
+        id_blob += str(item_id).encode('utf-8')
+        id_offsets.append(len(id_blob))
+        meta_blob += json.dumps(metadata, default=_json_default, separators=(',', ':')).encode('utf-8')
+        meta_offsets.append(len(meta_blob))
+
+    sections = [('matrix', matrix.tobytes()), ('id_offsets', id_offsets.tobytes()), ('ids', bytes(id_blob)),
+                ('meta_offsets', meta_offsets.tobytes()), ('meta', bytes(meta_blob))]
+    for name, corpus in corpora.items():
+        postings = corpus.get('lexical')
+        if postings is not None:
+            sections += [(f'lexical.{name}.terms', '\n'.join(postings['terms']).encode('utf-8')),
+                         (f'lexical.{name}.offsets', array('Q', postings['offsets']).tobytes()),
+                         (f'lexical.{name}.rows', array('I', postings['rows']).tobytes()),
+                         (f'lexical.{name}.tfs', array('H', postings['tfs']).tobytes()),
+                         (f'lexical.{name}.lengths', array('I', postings['lengths']).tobytes())]
+
+    directory = {
+        'format_version': FORMAT_VERSION,
+        'snapshot_version': snapshot_version or time.strftime('%Y%m%dT%H%M%SZ', time.gmtime()),
+        'built_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'dtype': 'float32',
+        'dim': dim,
+        'count': count,
+        'corpora': ranges,
+        'sections': {}
+    }
+
+    offset = 0
+    for name, data in sections:
+        directory['sections'][name] = [offset, len(data)]
+        offset += len(data) + _pad(len(data))
+    encoded = json.dumps(directory).encode('utf-8')
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(PREFIX.pack(MAGIC, FORMAT_VERSION, len(encoded)))
+        f.write(encoded)
+        f.write(b'\0' * _pad(f.tell()))
+        data_start = f.tell()
+        for name, data in sections:
+            f.write(b'\0' * (data_start + directory['sections'][name][0] - f.tell()))
+            f.write(data)
+    os.replace(tmp_path, path)
+    return directory
+
+
+# ============================================
+# READER
+# ============================================
+
+class Snapshot:
+    """Read-only, memory-mapped view of a snapshot file"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, dir_length = PREFIX.unpack_from(self._mmap)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a HelmStream index snapshot")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported snapshot format version: {version}")
+        self.directory = json.loads(self._mmap[PREFIX.size:PREFIX.size + dir_length])
+        self._data_start = PREFIX.size + dir_length + _pad(PREFIX.size + dir_length)
+        self.version = self.directory['snapshot_version']
+        self.dim = self.directory['dim']
+        self.count = self.directory['count']
+        self.corpora = self.directory['corpora']
+
+    def __contains__(self, corpus):
+        return corpus in self.corpora
+
+    def _section(self, name):
+        offset, length = self.directory['sections'][name]
+        offset += self._data_start
+        return memoryview(self._mmap)[offset:offset + length]
+
+    def matrix(self, corpus):
+        """Zero-copy float32 view of one corpus's rows (NumPy array or flat memoryview)"""
+        info = self.corpora[corpus]
+        row_bytes = self.dim * 4
+        view = self._section('matrix')[info['start'] * row_bytes:(info['start'] + info['count']) * row_bytes]
+        if np is not None:
+            return np.frombuffer(view, dtype='<f4').reshape(info['count'], self.dim)
+        return view.cast('f')
+
+    def _strings(self, offsets_name, blob_name, typecode, start, count):
+        offsets = self._section(offsets_name).cast(typecode)
+        blob = self._section(blob_name)
+        return [bytes(blob[offsets[i]:offsets[i + 1]]).decode('utf-8') for i in range(start, start + count)]
+
+    def ids(self, corpus):
+        info = self.corpora[corpus]
+        return self._strings('id_offsets', 'ids', 'I', info['start'], info['count'])
+
+    def metadata(self, corpus):
+        info = self.corpora[corpus]
+        return [json.loads(raw) for raw in self._strings('meta_offsets', 'meta', 'Q', info['start'], info['count'])]
+
+    def lexical(self, corpus):
+        """BM25 postings for a corpus (zero-copy views), or None if the snapshot has none"""
+        if not self.corpora[corpus].get('lexical'):
+            return None
+        prefix = f'lexical.{corpus}.'
+        terms = bytes(self._section(prefix + 'terms')).decode('utf-8')
+        return {
+            'terms': terms.split('\n') if terms else [],
+            'offsets': self._section(prefix + 'offsets').cast('Q'),
+            'rows': self._section(prefix + 'rows').cast('I'),
+            'tfs': self._section(prefix + 'tfs').cast('H'),
+            'lengths': self._section(prefix + 'lengths').cast('I')
+        }
+
+    def high_water_mark(self, corpus):
+        return self.corpora[corpus].get('high_water_mark')
+
+    def close(self):
+        try:
+            self._mmap.close()
+        except BufferError:
+            # A zero-copy view is still alive; the mapping is freed with it
+            pass
+        self._file.close()
+
+
+# ============================================
+# STORES (S3 or local directory)
+# ============================================
+
+class LocalSnapshotStore:
+    """Snapshots in a local directory, for on-prem and offline use"""
+
+    def __init__(self, root):
+        self.root = root
+
+    def read_manifest(self):
+        try:
+            with open(os.path.join(self.root, MANIFEST_NAME)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def fetch(self, manifest, dest):
+        shutil.copyfile(os.path.join(self.root, manifest['key']), dest)
+
+    def local_path(self, manifest):
+        """Snapshots already on local disk are mapped in place"""
+        return os.path.join(self.root, manifest['key'])
+
+    def publish(self, path, manifest):
+        os.makedirs(os.path.join(self.root, 'snapshots'), exist_ok=True)
+        shutil.copyfile(path, os.path.join(self.root, manifest['key']))
+        tmp = os.path.join(self.root, f'.{MANIFEST_NAME}.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp, os.path.join(self.root, MANIFEST_NAME))
+
+
+class S3SnapshotStore:
+    """Snapshots under an S3 prefix; the manifest object is the version pointer"""
+
+    def __init__(self, bucket, prefix, s3_client=None):
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+        if s3_client is None:
+            import boto3
+            s3_client = boto3.client('s3', region_name=os.environ.get('AWS_REGION', 'us-east-1'))
+        self.s3 = s3_client
+
+    def _key(self, name):
+        return f"{self.prefix}/{name}" if self.prefix else name
+
+    def read_manifest(self):
+        try:
+            response = self.s3.get_object(Bucket=self.bucket, Key=self._key(MANIFEST_NAME))
+        except self.s3.exceptions.NoSuchKey:
+            return None
+        return json.loads(response['Body'].read())
+
+    def fetch(self, manifest, dest):
+        # Single GET streamed straight to disk
+        self.s3.download_file(self.bucket, self._key(manifest['key']), dest)
+
+    def local_path(self, manifest):
+        return None
+
+    def publish(self, path, manifest):
+        # Snapshot objects are immutable; only the manifest PUT switches readers
+        self.s3.upload_file(path, self.bucket, self._key(manifest['key']))
+        self.s3.put_object(Bucket=self.bucket, Key=self._key(MANIFEST_NAME),
+                           Body=json.dumps(manifest, indent=2).encode('utf-8'),
+                           ContentType='application/json', CacheControl='no-cache')
+
+
+def open_store(uri, s3_client=None):
+    """Snapshot store for an s3://, file:// or plain directory URI"""
+    if uri.startswith('s3://'):
+        bucket, _, prefix = uri[len('s3://'):].partition('/')
+        return S3SnapshotStore(bucket, prefix, s3_client)
+    if uri.startswith('file://'):
+        uri = uri[len('file://'):]
+    return LocalSnapshotStore(uri)
+
+
+def publish_snapshot(store, path, directory):
+    """Upload a written snapshot and atomically repoint the manifest at it"""
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha256.update(chunk)
+    version = directory['snapshot_version']
+    manifest = {
+        'snapshot_version': version,
+        'key': f"snapshots/{version}.hsix",
+        'size': os.path.getsize(path),
+        'sha256': sha256.hexdigest(),
+        'built_at': directory['built_at'],
+        'corpora': {name: {'count': info['count'], 'high_water_mark': info['high_water_mark']}
+                    for name, info in directory['corpora'].items()}
+    }
+    store.publish(path, manifest)
+    return manifest
+
+
+class SnapshotLoader:
+    """
+    Fetches the current snapshot once per version and keeps it mapped
+
+    Each call re-reads the small manifest; the snapshot itself is only
+    downloaded (into INDEX_SNAPSHOT_CACHE_DIR) when the version changes.
+    A failed download or unreadable file is logged and the snapshot
+    already held (or None) is returned, so the index loads from DynamoDB.
+    """
+
+    def __init__(self, uri=None, cache_dir=None, s3_client=None):
+        self.uri = INDEX_SNAPSHOT_URI if uri is None else uri
+        self.cache_dir = cache_dir or INDEX_SNAPSHOT_CACHE_DIR
+        self.store = open_store(self.uri, s3_client) if self.uri else None
+        self.snapshot = None
+
+    def _download(self, manifest):
+        """Local path of the manifest's snapshot, fetched into cache_dir unless already there"""
+        path = self.store.local_path(manifest)
+        if path is not None:
+            return path
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = os.path.join(self.cache_dir, f"{manifest['snapshot_version']}.hsix")
+        if os.path.exists(path) and os.path.getsize(path) == manifest['size']:
+            return path
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix='.part')
+        os.close(fd)
+        try:
+            self.store.fetch(manifest, tmp)
+            if os.path.getsize(tmp) != manifest['size']:
+                raise ValueError(f"Snapshot {manifest['snapshot_version']} is truncated")
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        return path
+
+    def __call__(self):
+        if self.store is None:
+            return None
+        try:
+            manifest = self.store.read_manifest()
+        except Exception as e:
+            print(f"⚠️  Could not read snapshot manifest at {self.uri}: {str(e)}")
+            return self.snapshot
+        if manifest is None:
+            return None
+        if self.snapshot is not None and self.snapshot.version == manifest['snapshot_version']:
+            return self.snapshot
+
+        started = time.perf_counter()
+        try:
+            snapshot = Snapshot(self._download(manifest))
+        except Exception as e:
+            # The index falls back to a DynamoDB load instead of failing the query
+            print(f"⚠️  Could not load snapshot {manifest.get('snapshot_version')}: {str(e)}")
+            return self.snapshot
+
+        previous = self.snapshot
+        self.snapshot = snapshot
+        if previous is not None:
+            previous.close()
+            if self.store.local_path(manifest) is None and os.path.dirname(previous.path) == self.cache_dir:
+                os.remove(previous.path)
+        print(f"[SNAPSHOT] Loaded {self.snapshot.version} ({self.snapshot.count} rows) "
+              f"in {(time.perf_counter() - started) * 1000:.0f} ms")
+        return self.snapshot
@@ -0,0 +1,78 @@
+"""
+HelmStream - Response Streaming Server
+HTTP front for a RAG engine run by the Lambda Web Adapter behind a
+function URL in RESPONSE_STREAM mode: each request is passed to the
+engine's lambda_handler, and a streaming_response body is written with
+chunked transfer encoding, one flushed chunk per event
+"""
+
+import importlib
+import json
+import os
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from helmstream_common.streaming import enable_response_streaming
+
+# Port the Lambda Web Adapter forwards to (its AWS_LWA_PORT / PORT)
+STREAM_SERVER_PORT = int(os.environ.get('AWS_LWA_PORT', os.environ.get('PORT', '8080')))
+
+
+def make_request_handler(lambda_handler):
+    """BaseHTTPRequestHandler class serving lambda_handler"""
+
+    class RequestHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            # The adapter's readiness check
+            self._send(200, {'Content-Type': 'application/json'}, json.dumps({'status': 'ready'}))
+
+        def do_POST(self):
+            raw = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            response = lambda_handler({'body': raw.decode('utf-8') or '{}'}, None)
+            body = response.get('body', '')
+            headers = dict(response.get('headers') or {'Content-Type': 'application/json'})
+            if isinstance(body, str):
+                self._send(response.get('statusCode', 200), headers, body)
+                return
+
+            self.send_response(response.get('statusCode', 200))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for chunk in body:
+                data = chunk.encode('utf-8')
+                self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+
+        def _send(self, status, headers, body):
+            data = body.encode('utf-8')
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            print(f"[STREAM SERVER] {format % args}")
+
+    return RequestHandler
+
+
+def serve(lambda_handler, port=None):
+    """Serve lambda_handler until the process exits"""
+    enable_response_streaming()
+    server = ThreadingHTTPServer(('0.0.0.0', port or STREAM_SERVER_PORT), make_request_handler(lambda_handler))
+    print(f"[STREAM SERVER] listening on port {server.server_port}")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    # python3 -m helmstream_common.stream_server [module], run from the function's package root
+    sys.path.insert(0, os.getcwd())
+    serve(importlib.import_module(sys.argv[1] if len(sys.argv) > 1 else 'handler').lambda_handler)
@@ -0,0 +1,5 @@
+#!/bin/bash
+# Lambda Web Adapter entry point (the streaming function's handler):
+# serves the engine in this package over HTTP on $AWS_LWA_PORT
+cd "$LAMBDA_TASK_ROOT"
+exec python3 -m helmstream_common.stream_server handler
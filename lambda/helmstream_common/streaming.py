@@ -0,0 +1,155 @@
+"""
+HelmStream - Streaming Answers
+Claude responses read incrementally with invoke_model_with_response_stream
+and framed as newline-delimited JSON or server-sent events, written to the
+client as they are produced by stream_server behind a function URL
+"""
+
+import json
+import time
+
+STREAM_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'sse': 'text/event-stream'
+}
+
+
+# Set by stream_server when this process answers through the Lambda Web
+# Adapter; the managed runtime cannot flush a response in parts
+_RESPONSE_STREAMING = False
+
+
+def enable_response_streaming():
+    global _RESPONSE_STREAMING
+    _RESPONSE_STREAMING = True
+
+
+def response_streaming():
+    """True when streaming_response bodies are written to the client incrementally"""
+    return _RESPONSE_STREAMING
+
+
+STREAMING_UNAVAILABLE = ("Streaming is served by the engine's response-streaming function URL; "
+                         "this endpoint returns complete responses only")
+
+
+def stream_format(value):
+    """'ndjson', 'sse' or None (no streaming) from a request's "stream" field"""
+    if value is True:
+        return 'ndjson'
+    if isinstance(value, str) and value.lower() in STREAM_FORMATS:
+        return value.lower()
+    return None
+
+
+def stream_claude(client, model_id, request_body):
+    """
+    Yield {'type': 'delta', 'text'} events as Claude generates, then one
+    {'type': 'usage', 'token_usage', 'ttft_ms', 'generation_ms'} event
+
+    ttft_ms runs from the request to the first text delta.
+    """
+    started = time.perf_counter()
+    response = client.invoke_model_with_response_stream(
+        modelId=model_id,
+        contentType='application/json',
+        accept='application/json',
+        body=json.dumps(request_body)
+    )
+    first_token_ms = None
+    token_usage = {'input_tokens': 0, 'output_tokens': 0}
+    for event in response['body']:
+        chunk = event.get('chunk')
+        if not chunk:
+            continue
+        message = json.loads(chunk['bytes'])
+        if message['type'] == 'message_start':
+            token_usage['input_tokens'] = message['message'].get('usage', {}).get('input_tokens', 0)
+        elif message['type'] == 'content_block_delta' and message['delta'].get('text'):
+            if first_token_ms is None:
+                first_token_ms = (time.perf_counter() - started) * 1000
+            yield {'type': 'delta', 'text': message['delta']['text']}
+        elif message['type'] == 'message_delta':
+            token_usage['output_tokens'] = message.get('usage', {}).get('output_tokens', 0)
+
+    generation_ms = (time.perf_counter() - started) * 1000
+    print(f"[STREAM] first token {first_token_ms or 0:.0f} ms, complete {generation_ms:.0f} ms")
+    print(f"[COST] Bedrock tokens - Input: {token_usage['input_tokens']}, Output: {token_usage['output_tokens']}")
+    yield {
+        'type': 'usage',
+        'token_usage': token_usage,
+        'ttft_ms': round(first_token_ms, 1) if first_token_ms is not None else None,
+        'generation_ms': round(generation_ms, 1)
+    }
+
+
+def encode_event(event, fmt):
+    """One event as an NDJSON line or an SSE frame named by its type"""
+    data = json.dumps(event)
+    if fmt == 'sse':
+        return f"event: {event['type']}\ndata: {data}\n\n"
+    return data + '\n'
+
+
+def _encoded(events, fmt):
+    """Encoded events; an error after the response has started becomes a final 'error' event"""
+    try:
+        for event in events:
+            yield encode_event(event, fmt)
+    except Exception as e:
+        print(f"❌ Error while streaming: {str(e)}")
+        yield encode_event({'type': 'error', 'error': str(e)}, fmt)
+
+
+def streaming_response(events, fmt):
+    """
+    Response whose body is a generator of encoded events
+
+    Only stream_server can send it: it writes and flushes each event as
+    the generator yields it, so the client sees the first delta as soon
+    as Claude produces it. Handlers check response_streaming() before
+    accepting a "stream" request.
+    """
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Content-Type': STREAM_FORMATS[fmt],
+            'Cache-Control': 'no-cache',
+            'Access-Control-Allow-Origin': '*'
+        },
+        'body': _encoded(events, fmt)
+    }
+
+
+def answer_events(head, deltas, finish):
+    """
+    head, each text delta of a stream_claude generator, then a 'done' trailer
+
+    finish(answer, timing) runs with the complete answer before the trailer
+    is sent (to cache or record it) and returns extra trailer fields; timing
+    holds token_usage, ttft_ms and generation_ms.
+    """
+    yield head
+    parts = []
+    usage = {}
+    for event in deltas:
+        if event['type'] == 'delta':
+            parts.append(event['text'])
+            yield event
+        else:
+            usage = event
+    trailer = {
+        'type': 'done',
+        'token_usage': usage.get('token_usage', {}),
+        'ttft_ms': usage.get('ttft_ms'),
+        'generation_ms': usage.get('generation_ms')
+    }
+    trailer.update(finish(''.join(parts), dict(trailer)) or {})
+    yield trailer
+
+
+def replay_events(head, answer, trailer):
+    """The events of an answer that is already complete (a cache hit), as one delta"""
+    yield head
+    yield {'type': 'delta', 'text': answer}
+    yield dict(trailer, type='done', ttft_ms=0.0, generation_ms=0.0)
@@ -0,0 +1,49 @@
+"""
+HelmStream - Deletion Tombstones
+One record per item deleted from a corpus, queried by deletion time, so
+warm indexes that refresh by created_at also drop deleted items
+"""
+
+import os
+import time
+from datetime import datetime
+
+from boto3.dynamodb.conditions import Key
+
+from helmstream_common.scan import ScanStats, query_pages
+
+TOMBSTONE_TABLE = os.environ.get('TOMBSTONE_TABLE', 'helmstream-tombstones')
+# Outlive the oldest snapshot an index may seed from, or a seeded index misses the delete
+TOMBSTONE_TTL_SECONDS = int(os.environ.get('TOMBSTONE_TTL_SECONDS', str(7 * 24 * 3600)))
+
+
+def record_deletion(table, corpus, item_id):
+    """
+    Write the tombstone of item_id in corpus; returns its deleted_at
+
+    Goes through the table's low-level client, which (unlike the
+    resource) is safe to share across threads. The sort key is
+    '<deleted_at>#<item_id>', so tombstones written in the same instant
+    stay distinct and a range query by time still finds them.
+    """
+    deleted_at = datetime.utcnow().isoformat()
+    table.meta.client.put_item(
+        TableName=table.name,
+        Item={
+            'corpus': corpus,
+            'deletion': f"{deleted_at}#{item_id}",
+            'item_id': item_id,
+            'deleted_at': deleted_at,
+            'expires_at': int(time.time()) + TOMBSTONE_TTL_SECONDS
+        }
+    )
+    return deleted_at
+
+
+def deleted_since(table, corpus, since):
+    """(item_id, deleted_at) for every tombstone of corpus written at or after since"""
+    stats = ScanStats()
+    for page in query_pages(table, stats, KeyConditionExpression=Key('corpus').eq(corpus) & Key('deletion').gte(since)):
+        for tombstone in page:
+            yield tombstone['item_id'], tombstone['deleted_at']
+    print(f"[QUERY] {corpus} tombstones since {since}: {stats}")
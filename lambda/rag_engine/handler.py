@@ -6,9 +6,28 @@ Handles RAG queries: embedding, retrieval, and response generation
 import json
 import boto3
 import os
+import time
 from datetime import datetime
 from decimal import Decimal
-import math
+
+from boto3.dynamodb.conditions import Key
+
+from helmstream_common.ann import ANN_ENABLED, approximate_index
+from helmstream_common.answer_cache import ANSWER_CACHE_TABLE, AnswerCache, answer_key, answer_scope
+from helmstream_common.batch import batch_items, run_bounded, total_token_usage
+from helmstream_common.batch_write import BatchWriter
+from helmstream_common.chunking import CHUNK_FIELDS
+from helmstream_common.context_packer import CONTEXT_TOKEN_BUDGET, pack_context
+from helmstream_common.embedding_cache import EMBEDDING_CACHE_TABLE, EmbeddingCache
+from helmstream_common.index_cache import INDEX_CACHE_ENABLED, EmbeddingIndex
+from helmstream_common.lexical import LEXICAL_ENABLED, LEXICAL_FAST_PATH, BM25Index, is_keyword_query
+from helmstream_common.object_cache import S3ObjectCache
+from helmstream_common.pipeline import PagePrefetch, Prefetch, await_load, cancel_load
+from helmstream_common.scan import ScanStats, batch_get_items, query_pages, scan_pages
+from helmstream_common.similarity import top_k_pages, top_k_pages_many
+from helmstream_common.snapshot import SnapshotLoader
+from helmstream_common.streaming import (STREAMING_UNAVAILABLE, answer_events, replay_events, response_streaming,
+                                         stream_claude, stream_format, streaming_response)
 
 # Initialize AWS clients
 bedrock = boto3.client('bedrock-runtime', region_name=os.environ.get('AWS_REGION', 'us-east-1'))
@@ -22,6 +41,14 @@ BUCKET_NAME = os.environ.get('S3_BUCKET_NAME')
 BEDROCK_EMBED_MODEL = os.environ.get('BEDROCK_TITAN_EMBED_MODEL_ID', 'amazon.titan-embed-text-v1')
 BEDROCK_CLAUDE_MODEL = os.environ.get('BEDROCK_CLAUDE_MODEL_ID', 'anthropic.claude-3-sonnet-20240229-v1:0')
 
+# Retrieval scan parallelism (DynamoDB parallel scan segments)
+SCAN_TOTAL_SEGMENTS = int(os.environ.get('SCAN_TOTAL_SEGMENTS', '4'))
+SCAN_MAX_WORKERS = int(os.environ.get('SCAN_MAX_WORKERS', '4'))
+# Phase-one scan attributes: key and vector only (summaries are fetched for winners)
+VECTOR_PROJECTION = 'document_id, embedding, embedding_norm'
+# Partition keys of type-created-index polled on incremental index refresh
+DOCUMENT_TYPES = os.environ.get('DOCUMENT_TYPES', 'invoice,port_report,certificate,general').split(',')
+
 
 def lambda_handler(event, context):
     """
@@ -32,8 +59,21 @@ def lambda_handler(event, context):
         "message": "What is the port fee for MV Ocean Star?",
         "conversation_id": "optional-conv-id",
         "top_k": 5,
-        "include_sources": true
+        "include_sources": true,
+        "context_tokens": 3000,
+        "stream": false,
+        "debug": false
     }
+
+    {"queries": [...]} answers several questions in one invocation (see
+    batch_handler). context_tokens caps the prompt tokens spent on retrieved context
+    (default CONTEXT_TOKEN_BUDGET). "stream": true (or "ndjson" / "sse")
+    returns a sources event, the answer as delta events and a "done"
+    trailer with token usage and time to first token; it is accepted only
+    through the response-streaming function URL (stream_server), where
+    each event reaches the client as it is produced. "debug": true adds
+    per-stage timings, including what overlapping the query embedding with
+    the index refresh saved.
     """
 
     try:
@@ -43,6 +83,9 @@ def lambda_handler(event, context):
         else:
             body = event
 
+        if 'queries' in body:
+            return batch_handler(body, context)
+
         # Validate required fields
         if 'message' not in body:
             return error_response(400, "Missing required field: 'message'")
@@ -51,78 +94,105 @@ def lambda_handler(event, context):
         conversation_id = body.get('conversation_id')
         top_k = body.get('top_k', 5)
         include_sources = body.get('include_sources', True)
+        context_tokens = int(body.get('context_tokens', CONTEXT_TOKEN_BUDGET))
+        stream = stream_format(body.get('stream'))
+        debug = bool(body.get('debug', False))
+        timings = []
+        if stream and not response_streaming():
+            return error_response(400, STREAMING_UNAVAILABLE)
 
         print(f"Processing query: {query[:100]}...")
 
-        # Step 1: Generate query embedding
-        print("Generating query embedding...")
-        query_embedding = generate_embedding(query)
-        print(f"✓ Query embedding generated ({len(query_embedding)} dimensions)")
-
-        # Step 2: Retrieve similar documents
-        print(f"Retrieving top-{top_k} similar documents...")
-        similar_docs = retrieve_similar_documents(query_embedding, top_k)
-        print(f"✓ Found {len(similar_docs)} similar documents")
-
-        # Step 3: Fetch full document content from S3
-        context_docs = []
-        for doc in similar_docs[:3]:  # Use top 3 for context to stay within token limits
+        # Repeated questions skip retrieval and generation
+        cache_scope = answer_scope('documents', {}, top_k, (BEDROCK_EMBED_MODEL, BEDROCK_CLAUDE_MODEL),
+                                   context_tokens)
+        cache_key = answer_key(cache_scope, query)
+        generation = ANSWERS.generation()
+        cached = ANSWERS.get(cache_key, generation)
+        if cached is not None:
+            return cached_answer_response(cached, query, conversation_id, include_sources, stream)
+
+        # Keyword-shaped queries (part numbers, IMO numbers) skip the embedding call
+        query_embedding = None
+        similar_docs = lexical_fast_path(query, top_k)
+        if similar_docs is not None:
+            print(f"✓ Lexical fast path found {len(similar_docs)} documents")
+        else:
+            # Step 1: Generate query embedding (or reuse a cached one) while the
+            # index refreshes, or the scan starts, in the background
+            print("Generating query embedding...")
+            started = time.perf_counter()
+            load = start_data_load()
             try:
-                doc_text = fetch_document_from_s3(doc['s3_uri'])
-                context_docs.append({
-                    'title': doc['title'],
-                    'text': doc_text,
-                    'type': doc['type'],
-                    'score': doc['similarity_score']
-                })
-            except Exception as e:
-                print(f"⚠️  Error fetching document {doc['document_id']}: {str(e)}")
-                # Use preview text as fallback
-                context_docs.append({
-                    'title': doc['title'],
-                    'text': doc.get('text_preview', ''),
-                    'type': doc['type'],
-                    'score': doc['similarity_score']
-                })
-
-        print(f"✓ Retrieved {len(context_docs)} document contents")
-
-        # Step 4: Generate response using Claude with context
+                query_embedding, embedding_source = QUERY_EMBEDDINGS.get(query, generate_embedding)
+                embed_ms = round((time.perf_counter() - started) * 1000, 1)
+                timings.append({'stage': 'embed query', 'source': embedding_source, 'ms': embed_ms})
+                print(f"✓ Query embedding from {embedding_source} ({len(query_embedding)} dimensions)")
+
+                # A near-identical question already answered at this generation
+                cached = ANSWERS.get_similar(cache_scope, query_embedding, generation)
+                if cached is not None:
+                    return cached_answer_response(cached, query, conversation_id, include_sources, stream)
+
+                # Step 2: Retrieve similar documents (vector + BM25 fusion) once both are ready
+                await_load(load, timings, embed_ms, started)
+                print(f"Retrieving top-{top_k} similar documents...")
+                started = time.perf_counter()
+                similar_docs = retrieve_similar_documents(query_embedding, top_k, query_text=query,
+                                                          pages=load if isinstance(load, PagePrefetch) else None)
+            finally:
+                # Stops a scan reader that an error or a cache hit left unconsumed
+                cancel_load(load)
+            timings.append({'stage': 'retrieve', 'results': len(similar_docs),
+                            'ms': round((time.perf_counter() - started) * 1000, 1)})
+            print(f"✓ Found {len(similar_docs)} similar documents")
+
+        # Step 3: Fetch document content from S3 (concurrently, warm bodies from cache)
+        started = time.perf_counter()
+        candidates = context_candidates(similar_docs)
+        timings.append({'stage': 'fetch documents', 'ms': round((time.perf_counter() - started) * 1000, 1)})
+
+        # Step 4: Fill the context budget by marginal relevance
+        context_docs, context_usage = pack_context(candidates, context_tokens)
+        print(f"✓ Packed {len(context_docs)} of {len(candidates)} document contents")
+
+        # Response sources (sent before the answer when streaming)
+        sources = format_sources(similar_docs)
+
+        def finish(response_text, token_usage, timing):
+            """Step 6: Save conversation (if conversation_id provided) and cache the answer"""
+            if conversation_id:
+                save_conversation_turn(conversation_id, query, response_text, [ctx['doc'] for ctx in context_docs])
+            # Cached with its sources; conversation_id is per request
+            response_data = {
+                'answer': response_text,
+                'token_usage': token_usage,
+                'context_usage': context_usage,
+                'sources': sources
+            }
+            ANSWERS.put(cache_key, cache_scope, generation, response_data, query_embedding)
+            if debug:
+                timings.append(dict(timing, stage='generate answer'))
+                response_data = dict(response_data, debug={'timings': timings})
+            return response_data
+
+        # Step 5: Generate response using Claude with context
         print("Generating response with Claude...")
+        if stream:
+            deltas = stream_claude(bedrock, BEDROCK_CLAUDE_MODEL, claude_request(query, context_docs))
+            return streaming_response(answer_events(
+                sources_event(sources, conversation_id, include_sources), deltas,
+                lambda response_text, timing: trailer_fields(finish(response_text, timing['token_usage'], {
+                    'ms': timing['generation_ms'], 'ttft_ms': timing['ttft_ms']
+                }), False)
+            ), stream)
+
+        started = time.perf_counter()
         response_text, token_usage = generate_response_with_context(query, context_docs)
         print(f"✓ Response generated (tokens: {token_usage})")
+        response_data = finish(response_text, token_usage, {'ms': round((time.perf_counter() - started) * 1000, 1)})
 
-        # Step 5: Save conversation (if conversation_id provided)
-        if conversation_id:
-            save_conversation_turn(conversation_id, query, response_text, similar_docs[:3])
-
-        # Prepare response
-        response_data = {
-            'answer': response_text,
-            'conversation_id': conversation_id,
-            'token_usage': token_usage
-        }
-
-        if include_sources:
-            response_data['sources'] = [
-                {
-                    'document_id': doc['document_id'],
-                    'title': doc['title'],
-                    'type': doc['type'],
-                    'similarity_score': float(doc['similarity_score']),
-                    'preview': doc.get('text_preview', '')[:200]
-                }
-                for doc in similar_docs
-            ]
-
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps(response_data)
-        }
+        return answer_response(dict(response_data, cached=False), conversation_id, include_sources)
 
     except Exception as e:
         print(f"❌ Error processing query: {str(e)}")
@@ -131,6 +201,202 @@ def lambda_handler(event, context):
         return error_response(500, f"Error processing query: {str(e)}")
 
 
+def batch_retrieve_documents(items, pages=None):
+    """
+    Shared retrieval for embedded batch items: every question is scored in
+    one matrix-matrix product against the warm index (fused with BM25 when
+    it is built), or in one pass over the vector scan without it
+    """
+    top_k = max(item['top_k'] for item in items)
+    embeddings = [item['embedding'] for item in items]
+    if not INDEX_CACHE_ENABLED:
+        for item, docs in zip(items, scan_similar_documents_many(embeddings, top_k, pages)):
+            item['docs'] = docs[:item['top_k']]
+        return
+
+    index = DOCUMENT_INDEX.get()
+    print(f"[INDEX] {index.stats()}")
+    if index.lexical is not None:
+        ranked = index.hybrid_search_many(embeddings, [item['message'] for item in items], top_k)
+    else:
+        ranked = [[(score, row, None) for score, row in hits] for hits in index.search_many(embeddings, top_k)]
+    for item, hits in zip(items, ranked):
+        item['docs'] = [
+            dict(index.meta[row], similarity_score=similarity,
+                 **({'fusion_score': fused} if fused is not None else {}))
+            for similarity, row, fused in hits[:item['top_k']]
+        ]
+
+
+def answer_batch_item(item, generation, turns):
+    """Response for one retrieved batch question (run on the generation pool); its turn goes into turns"""
+    context_docs, context_usage = pack_context(context_candidates(item['docs']), item['context_tokens'])
+    response_text, token_usage = generate_response_with_context(item['message'], context_docs)
+    if item.get('conversation_id'):
+        save_conversation_turn(item['conversation_id'], item['message'], response_text,
+                               [ctx['doc'] for ctx in context_docs], turns)
+    response_data = {
+        'answer': response_text,
+        'token_usage': token_usage,
+        'context_usage': context_usage,
+        'sources': format_sources(item['docs'])
+    }
+    ANSWERS.put(item['cache_key'], item['cache_scope'], generation, response_data, item.get('embedding'))
+    return dict(response_data, cached=False)
+
+
+def batch_result(item):
+    """One entry of a batch response, shaped like a single response body"""
+    result = dict(item['response'], query=item['message'], conversation_id=item.get('conversation_id'))
+    if not item['include_sources']:
+        result.pop('sources', None)
+    return result
+
+
+def batch_handler(body, context):
+    """
+    Answer {"queries": [...]} with one index load and one scoring pass
+
+    Entries are question strings or objects with a "message" and their own
+    conversation_id, top_k, include_sources or context_tokens. Questions
+    are embedded concurrently while the index refreshes (or the scan
+    starts), scored together, and answered on a bounded pool of Claude
+    calls. The response holds a result per question, in order, with
+    summed token usage and per-stage timings.
+    """
+    started_all = time.perf_counter()
+    try:
+        items = batch_items(body, {'top_k': 5, 'context_tokens': CONTEXT_TOKEN_BUDGET, 'include_sources': True,
+                                   'conversation_id': None})
+    except ValueError as e:
+        return error_response(400, str(e))
+    timings = []
+
+    # Repeated questions are answered from the cache
+    started = time.perf_counter()
+    generation = ANSWERS.generation()
+    for item in items:
+        item['top_k'] = int(item['top_k'])
+        item['context_tokens'] = int(item['context_tokens'])
+        item['cache_scope'] = answer_scope('documents', {}, item['top_k'],
+                                           (BEDROCK_EMBED_MODEL, BEDROCK_CLAUDE_MODEL), item['context_tokens'])
+        item['cache_key'] = answer_key(item['cache_scope'], item['message'])
+        item['response'] = ANSWERS.get(item['cache_key'], generation)
+    pending = [item for item in items if item['response'] is None]
+    timings.append({'stage': 'answer cache', 'hits': len(items) - len(pending),
+                    'ms': round((time.perf_counter() - started) * 1000, 1)})
+
+    # Keyword-shaped questions answered from BM25 alone skip the embedding call
+    started = time.perf_counter()
+    for item in pending:
+        item['docs'] = lexical_fast_path(item['message'], item['top_k'])
+    to_embed = [item for item in pending if item['docs'] is None]
+    if len(to_embed) < len(pending):
+        timings.append({'stage': 'lexical fast path', 'hits': len(pending) - len(to_embed),
+                        'ms': round((time.perf_counter() - started) * 1000, 1)})
+
+    # Embed the rest concurrently while the index refreshes (or the scan starts)
+    started = time.perf_counter()
+    load = start_data_load() if to_embed else None
+    try:
+        for item, embedding in zip(to_embed, run_bounded(
+                lambda item: QUERY_EMBEDDINGS.get(item['message'], generate_embedding)[0], to_embed)):
+            if isinstance(embedding, Exception):
+                item['response'] = {'error': str(embedding)}
+            else:
+                item['embedding'] = embedding
+        embed_ms = round((time.perf_counter() - started) * 1000, 1)
+        timings.append({'stage': 'embed queries', 'queries': len(to_embed), 'ms': embed_ms})
+
+        # Near-identical questions already answered, then one shared scoring pass
+        for item in to_embed:
+            if 'embedding' in item:
+                item['response'] = ANSWERS.get_similar(item['cache_scope'], item['embedding'], generation)
+        to_score = [item for item in to_embed if item['response'] is None]
+        if to_score:
+            await_load(load, timings, embed_ms, started)
+            started = time.perf_counter()
+            batch_retrieve_documents(to_score, pages=load if isinstance(load, PagePrefetch) else None)
+            timings.append({'stage': 'retrieve', 'queries': len(to_score),
+                            'ms': round((time.perf_counter() - started) * 1000, 1)})
+    finally:
+        cancel_load(load)
+
+    # Claude generations on a bounded pool; the batch's conversation turns are written together
+    started = time.perf_counter()
+    turns = conversation_writer()
+    answering = [item for item in pending if item['response'] is None]
+    for item, response in zip(answering, run_bounded(lambda item: answer_batch_item(item, generation, turns),
+                                                     answering)):
+        item['response'] = response if not isinstance(response, Exception) else {'error': str(response)}
+    timings.append({'stage': 'generate answers', 'queries': len(answering),
+                    'ms': round((time.perf_counter() - started) * 1000, 1)})
+    for item in items:
+        if item['response'].get('cached') and item['conversation_id']:
+            save_conversation_turn(item['conversation_id'], item['message'], item['response']['answer'],
+                                   item['response']['sources'][:3], turns)
+    if turns.flush():
+        print(f"⚠️  Error saving conversations: {turns.failed[0][1]}")
+    print(f"[WRITE] conversations: {turns}")
+
+    results = [batch_result(item) for item in items]
+    total_ms = round((time.perf_counter() - started_all) * 1000, 1)
+    failed = sum(1 for result in results if 'error' in result)
+    print(f"[BATCH] {len(items)} queries ({sum(1 for result in results if result.get('cached'))} cached, "
+          f"{len(answering)} generated, {failed} failed) in {total_ms:.0f} ms")
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*'
+        },
+        'body': json.dumps({
+            'results': results,
+            'token_usage': total_token_usage(results),
+            'failed': failed,
+            'timings': timings,
+            'total_ms': total_ms
+        })
+    }
+
+
+def context_candidates(similar_docs):
+    """pack_context candidates for the retrieved documents, their text fetched from S3"""
+    candidates = []
+    for doc, doc_text in zip(similar_docs, fetch_documents_from_s3(similar_docs)):
+        if isinstance(doc_text, Exception):
+            print(f"⚠️  Error fetching document {doc['document_id']}: {str(doc_text)}")
+            # Use preview text as fallback
+            doc_text = doc.get('text_preview', '')
+        candidates.append({
+            'doc': doc,
+            'title': doc['title'],
+            'text': doc_text,
+            'type': doc['type'],
+            'score': doc['similarity_score'],
+            'header': context_header(doc['title'], doc['type'], doc['similarity_score'])
+        })
+    return candidates
+
+
+def format_sources(similar_docs):
+    """Response sources for the retrieved documents"""
+    return [
+        {
+            'document_id': doc.get('source_document_id', doc['document_id']),
+            'title': doc['title'],
+            'type': doc['type'],
+            'similarity_score': float(doc['similarity_score']),
+            **{key: float(doc[key]) for key in ('fusion_score', 'lexical_score') if key in doc},
+            # Which part of the document matched (chunked documents only)
+            **({'chunk': int(doc['chunk_index']), 'byte_range': list(chunk_byte_range(doc))}
+               if chunk_byte_range(doc) else {}),
+            'preview': doc.get('text_preview', '')[:200]
+        }
+        for doc in similar_docs
+    ]
+
+
 def generate_embedding(text):
     """Generate 768-dimensional embedding using Bedrock Titan"""
     try:
@@ -154,101 +420,221 @@ def generate_embedding(text):
         raise
 
 
-def retrieve_similar_documents(query_embedding, top_k=5):
+# Repeated questions reuse their query embedding from this container or the shared table
+QUERY_EMBEDDINGS = EmbeddingCache(BEDROCK_EMBED_MODEL, lambda: dynamodb.Table(EMBEDDING_CACHE_TABLE))
+
+# Complete answers, retired whenever the document processor bumps the generation
+ANSWERS = AnswerCache('documents', lambda: dynamodb.Table(ANSWER_CACHE_TABLE))
+
+
+def document_summary(doc):
+    """Lightweight fields kept per document (everything but the embedding)"""
+    return {
+        'document_id': doc['document_id'],
+        'title': doc['title'],
+        's3_uri': doc['s3_uri'],
+        'type': doc['type'],
+        'text_preview': doc.get('text_preview', ''),
+        'metadata': doc.get('metadata', {}),
+        **{field: doc[field] for field in CHUNK_FIELDS if field in doc}
+    }
+
+
+def load_all_documents(**scan_kwargs):
+    """Full parallel scan of the documents table, as pages of items"""
+    stats = ScanStats(SCAN_TOTAL_SEGMENTS)
+    yield from scan_pages(dynamodb.Table(DOCUMENTS_TABLE), SCAN_TOTAL_SEGMENTS, SCAN_MAX_WORKERS, stats,
+                          **scan_kwargs)
+    print(f"[SCAN] {'vector-only ' if scan_kwargs else ''}{stats}")
+
+
+def load_documents_since(since):
+    """Documents created at or after since, read through type-created-index"""
+    table = dynamodb.Table(DOCUMENTS_TABLE)
+    stats = ScanStats()
+    doc_types = set(DOCUMENT_TYPES) | {meta['type'] for meta in DOCUMENT_INDEX.meta}
+    for doc_type in sorted(doc_types):
+        yield from query_pages(
+            table, stats,
+            IndexName='type-created-index',
+            KeyConditionExpression=Key('type').eq(doc_type) & Key('created_at').gte(since)
+        )
+    print(f"[QUERY] type-created-index since {since}: {stats}")
+
+
+# Warm-container index, shared by every invocation of this container and
+# seeded from the published snapshot (INDEX_SNAPSHOT_URI) when one exists;
+# titles and text (ingest-time term counts) are BM25-indexed alongside
+DOCUMENT_INDEX = EmbeddingIndex(
+    'documents', 'document_id',
+    full_loader=load_all_documents,
+    incremental_loader=load_documents_since,
+    metadata=document_summary,
+    snapshot_source=SnapshotLoader(),
+    ann=approximate_index() if ANN_ENABLED else None,
+    lexical=BM25Index(('title', 'text_preview')) if LEXICAL_ENABLED else None
+)
+
+
+def lexical_fast_path(query, top_k=5):
+    """
+    Documents for a keyword-shaped query from BM25 alone, or None to embed the query
+
+    Only taken when every query term occurs in at least one document;
+    similarity_score is then the BM25 score relative to the best hit.
+    """
+    if not (LEXICAL_FAST_PATH and INDEX_CACHE_ENABLED and DOCUMENT_INDEX.lexical is not None
+            and is_keyword_query(query)):
+        return None
+    index = DOCUMENT_INDEX.get()
+    hits = index.lexical_search(query, top_k, require_all=True)
+    if not hits:
+        return None
+    print(f"[LEXICAL] fast path: {len(hits)} documents contain every term of {query!r}")
+    best = hits[0][0] or 1.0
+    return [
+        dict(index.meta[row], similarity_score=float(score) / best, lexical_score=float(score))
+        for score, row in hits
+    ]
+
+
+def start_data_load():
+    """Begin the index refresh (or, without the index cache, the vector scan) before the query embedding exists"""
+    if INDEX_CACHE_ENABLED:
+        return Prefetch(DOCUMENT_INDEX.get)
+    return PagePrefetch(load_all_documents(ProjectionExpression=VECTOR_PROJECTION))
+
+
+def retrieve_similar_documents(query_embedding, top_k=5, query_text=None, pages=None):
     """
     Retrieve top-K similar documents using cosine similarity
-    Free-tier optimized: scan DynamoDB, compute similarity in-memory with NumPy-free approach
+    Free-tier optimized: score against the warm in-memory index (refreshed
+    incrementally), or parallel-scan DynamoDB when the cache is disabled.
+    With query_text, the index fuses vector and BM25 rankings (RRF).
+    pages are scan pages start_data_load is already reading.
     """
     try:
-        table = dynamodb.Table(DOCUMENTS_TABLE)
-
-        # Scan all documents (acceptable for MVP with <1000 docs)
-        print("Scanning DynamoDB for documents...")
-        response = table.scan()
-        documents = response['Items']
-
-        print(f"Found {len(documents)} total documents")
-
-        # Compute cosine similarity for each document
-        similarities = []
-        for doc in documents:
-            # Convert Decimal to float
-            doc_embedding = [float(x) for x in doc['embedding']]
-
-            # Compute cosine similarity (without NumPy)
-            similarity = cosine_similarity_pure_python(query_embedding, doc_embedding)
-
-            similarities.append({
-                'document_id': doc['document_id'],
-                'title': doc['title'],
-                's3_uri': doc['s3_uri'],
-                'type': doc['type'],
-                'text_preview': doc.get('text_preview', ''),
-                'metadata': doc.get('metadata', {}),
-                'similarity_score': similarity
-            })
-
-        # Sort by similarity (highest first) and return top-K
-        similarities.sort(key=lambda x: x['similarity_score'], reverse=True)
-        return similarities[:top_k]
+        if not INDEX_CACHE_ENABLED:
+            return scan_similar_documents(query_embedding, top_k, pages)
+
+        index = DOCUMENT_INDEX.get()
+        print(f"[INDEX] {index.stats()}")
+        if query_text and index.lexical is not None:
+            return [
+                dict(index.meta[row], similarity_score=similarity,
+                     **({'fusion_score': fused} if fused is not None else {}))
+                for similarity, row, fused in index.hybrid_search(query_embedding, query_text, top_k)
+            ]
+        return [
+            dict(index.meta[row], similarity_score=similarity)
+            for similarity, row in index.search(query_embedding, top_k)
+        ]
 
     except Exception as e:
         print(f"❌ Error retrieving documents: {str(e)}")
         raise
 
 
-def cosine_similarity_pure_python(vec1, vec2):
+def scan_similar_documents(query_embedding, top_k=5, pages=None):
     """
-    Compute cosine similarity without NumPy (for Lambda compatibility)
+    Two-phase retrieval: score a vector-only parallel scan, then hydrate
+    just the top_k winners with BatchGetItem
     """
-    # Dot product
-    dot_product = sum(a * b for a, b in zip(vec1, vec2))
+    print(f"Scanning DynamoDB for documents ({SCAN_TOTAL_SEGMENTS} segments)...")
+    if pages is None:
+        pages = load_all_documents(ProjectionExpression=VECTOR_PROJECTION)
+    # Pages stream through one bounded heap: memory is a page plus top_k ids
+    winners = top_k_pages(query_embedding, pages, top_k, key=lambda doc: doc['document_id'])
+    return hydrate_documents([winners])[0]
+
+
+def scan_similar_documents_many(query_embeddings, top_k=5, pages=None):
+    """scan_similar_documents() for several queries: one scan, one matrix-matrix product per page, one hydrate"""
+    print(f"Scanning DynamoDB for {len(query_embeddings)} queries ({SCAN_TOTAL_SEGMENTS} segments)...")
+    if pages is None:
+        pages = load_all_documents(ProjectionExpression=VECTOR_PROJECTION)
+    return hydrate_documents(top_k_pages_many(query_embeddings, pages, top_k, key=lambda doc: doc['document_id']))
+
+
+def hydrate_documents(rankings):
+    """Document summaries for lists of (similarity, document_id) winners, fetched with one BatchGetItem pass"""
+    doc_ids = list(dict.fromkeys(doc_id for winners in rankings for _, doc_id in winners))
+    hydrate_stats = ScanStats()
+    docs = {
+        doc['document_id']: doc
+        for doc in batch_get_items(dynamodb.Table(DOCUMENTS_TABLE),
+                                   [{'document_id': doc_id} for doc_id in doc_ids], hydrate_stats)
+    }
+    print(f"[RETRIEVAL] phase 2 hydrate: {hydrate_stats.items}/{len(doc_ids)} items, "
+          f"{hydrate_stats.consumed_capacity:.1f} RCU, {hydrate_stats.wall_time_ms:.0f} ms")
 
-    # Magnitudes
-    magnitude1 = math.sqrt(sum(a * a for a in vec1))
-    magnitude2 = math.sqrt(sum(b * b for b in vec2))
+    return [
+        [dict(document_summary(docs[doc_id]), similarity_score=similarity)
+         for similarity, doc_id in winners if doc_id in docs]
+        for winners in rankings
+    ]
 
-    # Cosine similarity
-    if magnitude1 == 0 or magnitude2 == 0:
-        return 0.0
 
-    return dot_product / (magnitude1 * magnitude2)
+# Document bodies kept across warm invocations, revalidated by ETag
+DOCUMENT_BODIES = S3ObjectCache(s3)
 
 
 def fetch_document_from_s3(s3_uri):
     """Fetch document content from S3"""
     try:
-        # Parse s3://bucket/key
-        parts = s3_uri.replace('s3://', '').split('/', 1)
-        bucket = parts[0]
-        key = parts[1]
-
-        response = s3.get_object(Bucket=bucket, Key=key)
-        return response['Body'].read().decode('utf-8')
+        return DOCUMENT_BODIES.get(s3_uri).decode('utf-8')
 
     except Exception as e:
         print(f"❌ Error fetching from S3: {str(e)}")
         raise
 
 
-def generate_response_with_context(query, context_docs):
+def chunk_byte_range(doc):
+    """(start, end) of a chunk's text in its S3 object, or None for a whole-document item"""
+    if doc.get('byte_start') is None:
+        return None
+    return int(doc['byte_start']), int(doc['byte_end'])
+
+
+def fetch_documents_from_s3(docs):
     """
-    Generate response using Claude 3 Sonnet with retrieved context
+    Fetch the text of several documents or chunks concurrently
+
+    Chunks are read with ranged GETs of just their bytes. Each entry is
+    the text or the exception raised.
     """
-    try:
-        # Build context string
-        context_parts = []
-        for i, ctx in enumerate(context_docs, 1):
-            context_parts.append(f"""
+    started = time.perf_counter()
+    byte_ranges = [chunk_byte_range(doc) for doc in docs]
+    bodies = DOCUMENT_BODIES.get_many([doc['s3_uri'] for doc in docs], byte_ranges)
+    print(f"[S3] fetched {len(docs)} documents ({sum(1 for r in byte_ranges if r)} ranged) in "
+          f"{(time.perf_counter() - started) * 1000:.0f} ms | {DOCUMENT_BODIES.stats()}")
+    return [body if isinstance(body, Exception) else body.decode('utf-8') for body in bodies]
+
+
+def context_header(title, doc_type, score):
+    """Title line of a context document (charged to the context budget)"""
+    return f"Document: {title} (Type: {doc_type}, Relevance: {score:.2f})\n---"
+
+
+def claude_request(query, context_docs):
+    """
+    Claude 3 Sonnet request body for a question over retrieved context
+
+    context_docs come from pack_context, already fitted to the token budget.
+    """
+    # Build context string
+    context_parts = []
+    for i, ctx in enumerate(context_docs, 1):
+        context_parts.append(f"""
 Document {i}: {ctx['title']} (Type: {ctx['type']}, Relevance: {ctx['score']:.2f})
 ---
-{ctx['text'][:2000]}
-""")  # Limit each document to 2000 chars
+{ctx['text']}
+""")
 
-        context = "\n\n".join(context_parts)
+    context = "\n\n".join(context_parts)
 
-        # Create prompt
-        prompt = f"""You are a maritime operations assistant with access to a knowledge base of maritime documents. Answer the following question based ONLY on the provided context documents.
+    # Create prompt
+    prompt = f"""You are a maritime operations assistant with access to a knowledge base of maritime documents. Answer the following question based ONLY on the provided context documents.
 
 Context Documents:
 {context}
@@ -264,22 +650,30 @@ Instructions:
 
 Answer:"""
 
+    return {
+        'anthropic_version': 'bedrock-2023-05-31',
+        'max_tokens': 1024,
+        'temperature': 0.7,
+        'messages': [
+            {
+                'role': 'user',
+                'content': prompt
+            }
+        ]
+    }
+
+
+def generate_response_with_context(query, context_docs):
+    """
+    Generate response using Claude 3 Sonnet with retrieved context
+    """
+    try:
         # Call Claude 3 Sonnet
         response = bedrock.invoke_model(
             modelId=BEDROCK_CLAUDE_MODEL,
             contentType='application/json',
             accept='application/json',
-            body=json.dumps({
-                'anthropic_version': 'bedrock-2023-05-31',
-                'max_tokens': 1024,
-                'temperature': 0.7,
-                'messages': [
-                    {
-                        'role': 'user',
-                        'content': prompt
-                    }
-                ]
-            })
+            body=json.dumps(claude_request(query, context_docs))
         )
 
         # Parse response
@@ -301,14 +695,24 @@ Answer:"""
         raise
 
 
-def save_conversation_turn(conversation_id, user_message, assistant_message, sources):
-    """Save conversation turn to DynamoDB"""
+def conversation_writer():
+    """BatchWriter for conversation turns"""
+    return BatchWriter(dynamodb.Table(CONVERSATIONS_TABLE), ['conversation_id', 'timestamp'])
+
+
+def save_conversation_turn(conversation_id, user_message, assistant_message, sources, writer=None):
+    """
+    Save conversation turn to DynamoDB
+
+    Both messages go out in one BatchWriteItem request, or into writer
+    (flushed by the caller) when several turns are saved together.
+    """
     try:
-        table = dynamodb.Table(CONVERSATIONS_TABLE)
+        turn_writer = writer or conversation_writer()
         timestamp = datetime.now().isoformat()
 
         # Save user message
-        table.put_item(Item={
+        turn_writer.put({
             'conversation_id': conversation_id,
             'timestamp': f"{timestamp}_user",
             'role': 'user',
@@ -316,21 +720,68 @@ def save_conversation_turn(conversation_id, user_message, assistant_message, sou
         })
 
         # Save assistant message
-        table.put_item(Item={
+        turn_writer.put({
             'conversation_id': conversation_id,
             'timestamp': f"{timestamp}_assistant",
             'role': 'assistant',
             'message': assistant_message,
-            'sources': [{'document_id': s['document_id'], 'title': s['title']} for s in sources]
+            'sources': [{'document_id': s.get('source_document_id', s['document_id']), 'title': s['title']}
+                        for s in sources]
         })
 
-        print(f"✓ Conversation saved: {conversation_id}")
+        if writer is None:
+            turn_writer.flush()
+            if turn_writer.failed:
+                raise RuntimeError(turn_writer.failed[0][1])
+            print(f"✓ Conversation saved: {conversation_id}")
 
     except Exception as e:
         print(f"⚠️  Error saving conversation: {str(e)}")
         # Non-critical error, don't fail the request
 
 
+def cached_answer_response(cached, query, conversation_id, include_sources, stream=None):
+    """Serve a cached answer, still recording the turn in the caller's conversation"""
+    if conversation_id:
+        save_conversation_turn(conversation_id, query, cached['answer'], cached['sources'][:3])
+    if stream:
+        return streaming_response(replay_events(
+            sources_event(cached['sources'], conversation_id, include_sources),
+            cached['answer'], trailer_fields(cached, True)
+        ), stream)
+    return answer_response(cached, conversation_id, include_sources)
+
+
+def sources_event(sources, conversation_id, include_sources):
+    """First event of a streamed answer"""
+    event = {'type': 'sources', 'conversation_id': conversation_id}
+    if include_sources:
+        event['sources'] = sources
+    return event
+
+
+def trailer_fields(response_data, cached):
+    """Everything in a response but the answer and its sources, for the 'done' event"""
+    fields = {key: value for key, value in response_data.items() if key not in ('answer', 'sources')}
+    fields['cached'] = cached
+    return fields
+
+
+def answer_response(response_data, conversation_id, include_sources):
+    """Successful query response"""
+    response_data = dict(response_data, conversation_id=conversation_id)
+    if not include_sources:
+        response_data.pop('sources', None)
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*'
+        },
+        'body': json.dumps(response_data)
+    }
+
+
 def error_response(status_code, message):
     """Generate error response"""
     return {
@@ -7,9 +7,30 @@ Stakeholder-aware query engine with automatic filter extraction
 import json
 import boto3
 import os
+import time
 from datetime import datetime
 from decimal import Decimal
 
+from boto3.dynamodb.conditions import Attr, Key
+
+from helmstream_common.ann import ANN_ENABLED, approximate_index
+from helmstream_common.answer_cache import ANSWER_CACHE_TABLE, AnswerCache, answer_key, answer_scope
+from helmstream_common.batch import batch_items, run_bounded, total_token_usage
+from helmstream_common.context_packer import CONTEXT_TOKEN_BUDGET, pack_context
+from helmstream_common.embedding_cache import EMBEDDING_CACHE_TABLE, EmbeddingCache
+from helmstream_common.filter_index import FilterIndex
+from helmstream_common.index_cache import INDEX_CACHE_ENABLED, EmbeddingIndex
+from helmstream_common.lexical import LEXICAL_ENABLED, LEXICAL_FAST_PATH, BM25Index, is_keyword_query
+from helmstream_common.pipeline import PagePrefetch, Prefetch, await_load, cancel_load
+from helmstream_common.planner import (PLANNER_ENABLED, PLANNER_STATS_TABLE, CardinalityStats, StatsCache,
+                                       choose_plan, fallback_plan, oversampled_k)
+from helmstream_common.scan import ScanStats, batch_get_items, query_pages, scan_pages
+from helmstream_common.similarity import top_k_pages
+from helmstream_common.snapshot import SnapshotLoader
+from helmstream_common.streaming import (STREAMING_UNAVAILABLE, answer_events, replay_events, response_streaming,
+                                         stream_claude, stream_format, streaming_response)
+from helmstream_common.tombstones import TOMBSTONE_TABLE, deleted_since
+
 # AWS clients
 bedrock_runtime = boto3.client('bedrock-runtime', region_name=os.environ.get('AWS_REGION', 'us-east-1'))
 dynamodb = boto3.resource('dynamodb', region_name=os.environ.get('AWS_REGION', 'us-east-1'))
@@ -19,20 +40,48 @@ DYNAMODB_TABLE_NAME = os.environ.get('DYNAMODB_TABLE_NAME', 'helmstream-emails')
 BEDROCK_CLAUDE_MODEL_ID = os.environ.get('BEDROCK_CLAUDE_MODEL_ID', 'anthropic.claude-3-sonnet-20240229-v1:0')
 BEDROCK_TITAN_EMBED_MODEL_ID = os.environ.get('BEDROCK_TITAN_EMBED_MODEL_ID', 'amazon.titan-embed-text-v1')
 
+# Retrieval scan parallelism (DynamoDB parallel scan segments)
+SCAN_TOTAL_SEGMENTS = int(os.environ.get('SCAN_TOTAL_SEGMENTS', '4'))
+SCAN_MAX_WORKERS = int(os.environ.get('SCAN_MAX_WORKERS', '4'))
+# Route filtered scans to a Query on the filter GSIs (disable for tables without them)
+EMAIL_FILTER_INDEXES_ENABLED = os.environ.get('EMAIL_FILTER_INDEXES_ENABLED', 'true').lower() == 'true'
+# Partition keys of email-type-created-index polled on incremental index refresh
+EMAIL_TYPES = os.environ.get('EMAIL_TYPES', 'operational').split(',')
+
 # Shipyard metadata
 VESSELS = ['MV Pacific Star', 'MT Blue Horizon', 'MV Baltic Trader', 'MT Orange Grove', 'MV Nordic Wave', 'MV Sentinel']
 STAKEHOLDER_ROLES = ['Local Agent', 'Dock Scheduler', 'Port Authority', 'Tug/Mooring Lead', 'Crane Supervisor',
                      'Technical Lead', 'Safety/Compliance', 'Environmental Manager', 'IT Support', 'Cargo Owner Rep']
-
-
-def cosine_similarity(vec1, vec2):
-    """Pure Python cosine similarity"""
-    dot_product = sum(a * b for a, b in zip(vec1, vec2))
-    magnitude1 = sum(a * a for a in vec1) ** 0.5
-    magnitude2 = sum(b * b for b in vec2) ** 0.5
-    if magnitude1 == 0 or magnitude2 == 0:
-        return 0.0
-    return dot_product / (magnitude1 * magnitude2)
+EVENT_CATEGORIES = ['delay', 'weather', 'emergency', 'maintenance', 'scope_expansion',
+                    'completion', 'scheduling', 'conflict', 'environmental', 'compliance']
+
+# Phase-one scan attributes: key and vector only (bodies are fetched for winners)
+VECTOR_PROJECTION = 'email_id, embedding, embedding_norm'
+
+# Query filter name -> email item attribute
+FILTER_ATTRIBUTES = {
+    'vessel': 'vessel_involved',
+    'sender_role': 'sender_role',
+    'month': 'month',
+    'event_category': 'event_category'
+}
+
+# Query filter name -> GSI hashed on its attribute, sorted by timestamp
+FILTER_INDEXES = {
+    'vessel': 'vessel-timestamp-index',
+    'sender_role': 'sender-role-timestamp-index',
+    'event_category': 'event-category-timestamp-index'
+}
+
+# Distinct values per indexed filter; more values means a smaller expected partition
+FILTER_VOCABULARY = {
+    'vessel': VESSELS,
+    'sender_role': STAKEHOLDER_ROLES,
+    'event_category': EVENT_CATEGORIES
+}
+
+# Filters dropped first to last when a query over-constrains (staged relaxation)
+RELAXATION_ORDER = ['month', 'event_category', 'sender_role', 'vessel']
 
 
 def generate_embedding(text):
@@ -45,6 +94,51 @@ def generate_embedding(text):
     return result['embedding']
 
 
+# Repeated questions (dashboards, demos, the crisis agent's RAG tool) reuse
+# their query embedding from this container or from the shared table
+QUERY_EMBEDDINGS = EmbeddingCache(BEDROCK_TITAN_EMBED_MODEL_ID, lambda: dynamodb.Table(EMBEDDING_CACHE_TABLE))
+
+# Complete answers, retired whenever the email processor bumps the generation
+ANSWERS = AnswerCache('emails', lambda: dynamodb.Table(ANSWER_CACHE_TABLE))
+
+
+def cached_response(response_body, stream=None):
+    """A complete response, or its events when the request asked to stream"""
+    if stream:
+        return streaming_response(replay_events(sources_event(response_body), response_body['answer'],
+                                                trailer_fields(response_body)), stream)
+    return {
+        'statusCode': 200,
+        'body': json.dumps(response_body)
+    }
+
+
+def request_fields(response_body, plan, timings, explain, debug):
+    """
+    A fresh response with this request's plan and timings added
+
+    response_body itself is what the answer cache keeps, so it is copied
+    rather than extended.
+    """
+    response_body = dict(response_body, cached=False)
+    if explain:
+        response_body['plan'] = dict(plan, timings=timings)
+    if debug:
+        response_body['debug'] = {'timings': timings}
+    return response_body
+
+
+def sources_event(response_body):
+    """First event of a streamed answer"""
+    return {'type': 'sources', 'sources': response_body['sources'], 'filters_applied': response_body['filters_applied']}
+
+
+def trailer_fields(response_body):
+    """Everything in a response but the answer, sources and filters, for the 'done' event"""
+    return {key: value for key, value in response_body.items()
+            if key not in ('answer', 'sources', 'filters_applied')}
+
+
 def extract_query_filters(query):
     """Extract filters from natural language query"""
     filters = {}
@@ -87,10 +181,7 @@ def extract_query_filters(query):
             break
 
     # Extract event categories
-    categories = ['delay', 'weather', 'emergency', 'maintenance', 'scope_expansion',
-                 'completion', 'scheduling', 'conflict', 'environmental', 'compliance']
-
-    for category in categories:
+    for category in EVENT_CATEGORIES:
         if category in query_lower or category.replace('_', ' ') in query_lower:
             filters['event_category'] = category
             break
@@ -98,63 +189,312 @@ def extract_query_filters(query):
     return filters
 
 
-def retrieve_similar_emails(query_embedding, top_k=5, filters=None):
-    """Retrieve similar emails with optional metadata filtering"""
-    table = dynamodb.Table(DYNAMODB_TABLE_NAME)
+def load_all_emails():
+    """Full parallel scan of the emails table, as pages of items"""
+    stats = ScanStats(SCAN_TOTAL_SEGMENTS)
+    yield from scan_pages(dynamodb.Table(DYNAMODB_TABLE_NAME), SCAN_TOTAL_SEGMENTS, SCAN_MAX_WORKERS, stats)
+    print(f"[SCAN] {stats}")
 
-    # Build filter expression
-    filter_expression = None
-
-    if filters:
-        from boto3.dynamodb.conditions import Attr
-        conditions = []
-
-        if 'vessel' in filters:
-            conditions.append(Attr('vessel_involved').eq(filters['vessel']))
-        if 'sender_role' in filters:
-            conditions.append(Attr('sender_role').eq(filters['sender_role']))
-        if 'month' in filters:
-            conditions.append(Attr('month').eq(filters['month']))
-        if 'event_category' in filters:
-            conditions.append(Attr('event_category').eq(filters['event_category']))
-
-        # Combine conditions with AND
-        if conditions:
-            filter_expression = conditions[0]
-            for condition in conditions[1:]:
-                filter_expression = filter_expression & condition
-
-    # Scan with filters
-    scan_kwargs = {}
-    if filter_expression is not None:
-        scan_kwargs['FilterExpression'] = filter_expression
-
-    response = table.scan(**scan_kwargs)
-    emails = response['Items']
-
-    # Compute similarity scores
-    for email in emails:
-        email_embedding = [float(x) for x in email.get('embedding', [])]
-        if email_embedding:
-            email['similarity_score'] = cosine_similarity(query_embedding, email_embedding)
-        else:
-            email['similarity_score'] = 0.0
 
-    # Sort by similarity and return top_k
-    emails.sort(key=lambda x: x['similarity_score'], reverse=True)
-    return emails[:top_k]
+def load_emails_since(since):
+    """Emails created at or after since, read through email-type-created-index"""
+    table = dynamodb.Table(DYNAMODB_TABLE_NAME)
+    stats = ScanStats()
+    email_types = set(EMAIL_TYPES) | {meta['email_type'] for meta in EMAIL_INDEX.meta if meta.get('email_type')}
+    for email_type in sorted(email_types):
+        yield from query_pages(
+            table, stats,
+            IndexName='email-type-created-index',
+            KeyConditionExpression=Key('email_type').eq(email_type) & Key('created_at').gte(since)
+        )
+    print(f"[QUERY] email-type-created-index since {since}: {stats}")
+
+
+def load_email_deletions(since):
+    """(email_id, deleted_at) of emails deleted at or after since, e.g. retired legacy copies"""
+    return deleted_since(dynamodb.Table(TOMBSTONE_TABLE), 'emails', since)
+
+
+# Warm-container index, shared by every invocation of this container and
+# seeded from the published snapshot (INDEX_SNAPSHOT_URI) when one exists.
+# Metadata filters resolve against per-value row bitsets kept in step with it,
+# and subjects and bodies are BM25-indexed for hybrid and keyword retrieval
+EMAIL_INDEX = EmbeddingIndex(
+    'emails', 'email_id',
+    full_loader=load_all_emails,
+    incremental_loader=load_emails_since,
+    deletion_loader=load_email_deletions,
+    snapshot_source=SnapshotLoader(),
+    ann=approximate_index() if ANN_ENABLED else None,
+    filters=FilterIndex(FILTER_ATTRIBUTES),
+    lexical=BM25Index(('subject', 'body')) if LEXICAL_ENABLED else None
+)
+
+
+# Per-value counts maintained by the email processor at ingest
+PLANNER_STATS = StatsCache(lambda: dynamodb.Table(PLANNER_STATS_TABLE))
+
+
+def planner_statistics():
+    """Exact counts from the warm in-memory index, else the ingest-maintained stats table"""
+    if INDEX_CACHE_ENABLED and EMAIL_INDEX.loaded_at is not None:
+        return CardinalityStats.from_filter_index(EMAIL_INDEX.filters, len(EMAIL_INDEX))
+    return PLANNER_STATS.get()
+
+
+def plan_retrieval(filters, top_k, context=None):
+    """Choose how to answer one query from the statistics and the Lambda time left"""
+    filters = filters or {}
+    stats = planner_statistics() if PLANNER_ENABLED else None
+    if stats is None or not stats.total:
+        return fallback_plan(filters, INDEX_CACHE_ENABLED, filter_access_path(filters))
+    remaining_ms = context.get_remaining_time_in_millis() if hasattr(context, 'get_remaining_time_in_millis') else None
+    return choose_plan(
+        filters, stats, top_k,
+        index_enabled=INDEX_CACHE_ENABLED,
+        index_warm=EMAIL_INDEX.loaded_at is not None,
+        indexed_dimensions=set(FILTER_INDEXES) if EMAIL_FILTER_INDEXES_ENABLED else set(),
+        relaxation_order=RELAXATION_ORDER,
+        remaining_ms=remaining_ms,
+        scan_segments=SCAN_TOTAL_SEGMENTS
+    )
 
 
-def generate_response(query, relevant_emails):
-    """Generate response using Claude with email context"""
+def search_email_index(query_embedding, top_k=5, filters=None, filter_mode='bitset', match_fraction=None,
+                       query_text=None):
+    """
+    Vector (or, given query_text, hybrid vector + BM25) search over the warm-container index
+
+    filter_mode 'bitset' scores only the rows left by the filter bitsets;
+    'post' searches unfiltered for enough extra results that about top_k
+    survive the filters, and falls back to 'bitset' if too few do. Hybrid
+    search always pre-filters, so both rankings cover the same rows.
+    """
+    index = EMAIL_INDEX.get()
+    print(f"[INDEX] {index.stats()}")
+    hybrid = query_text and index.lexical is not None
+
+    if filters and filter_mode == 'post' and match_fraction and not hybrid:
+        fetch = oversampled_k(top_k, match_fraction, len(index))
+        survivors = [
+            (score, row) for score, row in index.search(query_embedding, fetch)
+            if all(index.meta[row].get(FILTER_ATTRIBUTES[name]) == value for name, value in filters.items())
+        ]
+        if len(survivors) >= top_k or fetch >= len(index):
+            return [dict(index.meta[row], similarity_score=score) for score, row in survivors[:top_k]]
+        print(f"[PLANNER] post-filter kept {len(survivors)} of {fetch}; pre-filtering instead")
+
+    rows = index.filter_rows(filters)
+    if rows is not None:
+        print(f"[FILTER] {filters} -> {len(rows)} of {len(index)} rows")
+
+    if hybrid:
+        return [
+            dict(index.meta[row], similarity_score=score, **({'fusion_score': fused} if fused is not None else {}))
+            for score, row, fused in index.hybrid_search(query_embedding, query_text, top_k, rows)
+        ]
+    return [
+        dict(index.meta[row], similarity_score=score)
+        for score, row in index.search(query_embedding, top_k, rows)
+    ]
+
+
+def lexical_fast_path(query, top_k=5, filters=None):
+    """
+    Emails for a keyword-shaped query from BM25 alone, or None to embed the query
+
+    Only taken when every query term occurs in at least one matching
+    email. similarity_score is then the BM25 score relative to the best
+    hit (1.0), since no cosine similarity exists without an embedding.
+    """
+    if not (LEXICAL_FAST_PATH and INDEX_CACHE_ENABLED and EMAIL_INDEX.lexical is not None
+            and is_keyword_query(query)):
+        return None
+    index = EMAIL_INDEX.get()
+    hits = index.lexical_search(query, top_k, index.filter_rows(filters), require_all=True)
+    if not hits:
+        return None
+    print(f"[LEXICAL] fast path: {len(hits)} emails contain every term of {query!r}")
+    best = hits[0][0] or 1.0
+    return [
+        dict(index.meta[row], similarity_score=float(score) / best, lexical_score=float(score))
+        for score, row in hits
+    ]
+
+
+def run_stage(stage, query_embedding, top_k, query_text=None, prefetched=None):
+    """Execute one planned access path (prefetched: its scan pages, already being read)"""
+    if stage['plan'] == 'vector_search':
+        return search_email_index(query_embedding, top_k, stage['filters'],
+                                  stage['filter_mode'], stage.get('match_fraction'), query_text)
+    route = stage['route'] if stage['plan'] == 'key_lookup' else None
+    return scan_similar_emails(query_embedding, top_k, stage['filters'], route=route, prefetched=prefetched)
+
+
+def start_data_load(plan):
+    """
+    Begin loading what the plan's first stage scores, before the query embedding exists
+
+    Returns a Prefetch of the index refresh for an in-memory search, or
+    (access path, PagePrefetch, ScanStats) for a scan or key lookup.
+    """
+    if not plan['stages']:
+        return None
+    stage = plan['stages'][0]
+    if stage['plan'] == 'vector_search':
+        return Prefetch(EMAIL_INDEX.get)
+    stats = ScanStats(SCAN_TOTAL_SEGMENTS)
+    route = stage['route'] if stage['plan'] == 'key_lookup' else None
+    path, pages = vector_pages(dynamodb.Table(DYNAMODB_TABLE_NAME), stage['filters'], stats, route)
+    return path, PagePrefetch(pages), stats
+
+
+def retrieve_similar_emails(query_embedding, top_k=5, filters=None, plan=None, timings=None, query_text=None,
+                            prefetched=None):
+    """
+    Retrieve similar emails with optional metadata filtering
+
+    Runs plan (from plan_retrieval, planned here when omitted) stage by
+    stage until top_k emails are found; later stages of a relaxation only
+    add emails the stricter stages missed. The plan's fallback stages run
+    only when its own stages find nothing. Per-stage timings are appended
+    to timings when given. query_text enables hybrid BM25 fusion on the
+    in-memory index. prefetched holds the first stage's scan pages when
+    start_data_load began reading them.
+    """
+    plan = plan or plan_retrieval(filters, top_k)
+    print(f"[PLANNER] {plan['plan']}: {plan['reason']}")
+
+    results = []
+    seen = set()
+    stages = plan['stages']
+    for number, stage in enumerate(stages + plan['fallback']):
+        if len(results) >= top_k or (number == len(stages) and results):
+            break
+        if number == len(stages):
+            print(f"[PLANNER] no matches for {stages[-1]['filters']}; relaxing filters")
+        started = time.perf_counter()
+        found = [email for email in run_stage(stage, query_embedding, top_k, query_text, prefetched if number == 0 else None)
+                 if email['email_id'] not in seen]
+        results.extend(found[:top_k - len(results)])
+        seen.update(email['email_id'] for email in found)
+        if timings is not None:
+            timings.append({
+                'stage': f"retrieve {number + 1}: {stage['plan']}" + (' (fallback)' if number >= len(stages) else ''),
+                'filters': stage['filters'],
+                'results': len(found),
+                'ms': round((time.perf_counter() - started) * 1000, 1)
+            })
+    return results
+
+
+def filter_access_path(filters):
+    """The filter whose GSI has the smallest expected partition, or None to scan"""
+    if not EMAIL_FILTER_INDEXES_ENABLED:
+        return None
+    indexed = [name for name in (filters or {}) if name in FILTER_INDEXES]
+    if not indexed:
+        return None
+    return max(indexed, key=lambda name: len(FILTER_VOCABULARY[name]))
+
+
+def _all_of(conditions):
+    condition = conditions[0]
+    for other in conditions[1:]:
+        condition = condition & other
+    return condition
+
+
+def vector_pages(table, filters, stats, route='auto'):
+    """
+    (access path description, pages of key + vector items) for phase one
+
+    route names the filter whose GSI is queried (the rest become a
+    FilterExpression), None to parallel-scan the table with every filter,
+    or 'auto' to pick with filter_access_path(). The GSIs project the
+    vector and the filter attributes, so neither path reads email bodies.
+    """
+    filters = filters or {}
+    routed = filter_access_path(filters) if route == 'auto' else route
+    conditions = [Attr(FILTER_ATTRIBUTES[name]).eq(value) for name, value in filters.items() if name != routed]
+    kwargs = {'ProjectionExpression': VECTOR_PROJECTION}
+    if conditions:
+        kwargs['FilterExpression'] = _all_of(conditions)
+
+    if routed is None:
+        path = f"Scan {DYNAMODB_TABLE_NAME}" + (f" (filtered on {', '.join(filters)})" if filters else '')
+        return path, scan_pages(table, SCAN_TOTAL_SEGMENTS, SCAN_MAX_WORKERS, stats, **kwargs)
+
+    index_name = FILTER_INDEXES[routed]
+    path = f"Query {index_name} ({FILTER_ATTRIBUTES[routed]} = {filters[routed]!r})"
+    if conditions:
+        path += f" filtered on {', '.join(name for name in filters if name != routed)}"
+    return path, query_pages(table, stats, IndexName=index_name,
+                             KeyConditionExpression=Key(FILTER_ATTRIBUTES[routed]).eq(filters[routed]), **kwargs)
+
+
+def scan_similar_emails(query_embedding, top_k=5, filters=None, route='auto', prefetched=None):
+    """
+    Two-phase retrieval: score key + vector items from a GSI Query (when a
+    filter is indexed) or a filtered parallel scan, then hydrate just the
+    top_k winners with BatchGetItem
+
+    prefetched is (path, pages, stats) from start_data_load, whose pages
+    were being read while the query was embedded.
+    """
+    table = dynamodb.Table(DYNAMODB_TABLE_NAME)
+
+    # Pages stream through one bounded heap: memory is a page plus top_k ids
+    if prefetched is not None:
+        path, pages, stats = prefetched
+    else:
+        stats = ScanStats(SCAN_TOTAL_SEGMENTS)
+        path, pages = vector_pages(table, filters, stats, route)
+    winners = top_k_pages(query_embedding, pages, top_k, key=lambda email: email['email_id'])
+
+    # Phase 2: full items for the winners only, best first (ties in arrival order)
+    hydrate_stats = ScanStats()
+    emails = {
+        email['email_id']: email
+        for email in batch_get_items(table, [{'email_id': email_id} for _, email_id in winners], hydrate_stats)
+    }
+    print(f"[RETRIEVAL] access path: {path} | "
+          f"phase 1: {stats.items} items, {stats.scanned} read, {stats.consumed_capacity:.1f} RCU, "
+          f"{stats.wall_time_ms:.0f} ms | "
+          f"phase 2 hydrate: {hydrate_stats.items}/{len(winners)} items, "
+          f"{hydrate_stats.consumed_capacity:.1f} RCU, {hydrate_stats.wall_time_ms:.0f} ms | "
+          f"total {stats.consumed_capacity + hydrate_stats.consumed_capacity:.1f} RCU")
+
+    return [
+        dict(emails[email_id], similarity_score=score)
+        for score, email_id in winners if email_id in emails
+    ]
+
+
+def email_header(email):
+    """Everything in an email's context block but its body"""
+    return (f"[{email.get('sender_role', 'Unknown')}] {email.get('sender', 'Unknown')} - {email.get('date', 'Unknown date')}\n"
+            f"Subject: {email.get('subject', '')}\n"
+            f"Vessel: {email.get('vessel_involved', 'N/A')}\n"
+            f"Category: {email.get('event_category', 'N/A')}\n"
+            f"Body:")
+
+
+def pack_emails(relevant_emails, context_tokens):
+    """(context passages, usage report) for the emails that fit the context budget"""
+    return pack_context([{
+        'header': email_header(email),
+        'text': email.get('body', email.get('body_preview', '')),
+        'score': email['similarity_score']
+    } for email in relevant_emails], context_tokens)
+
+
+def claude_request(query, context_emails):
+    """Claude request body for a question over email context (passages from pack_emails)"""
     # Format context
     context = "\n\n".join([
-        f"Email {i+1} [{email.get('sender_role', 'Unknown')}] {email.get('sender', 'Unknown')} - {email.get('date', 'Unknown date')}\n"
-        f"Subject: {email.get('subject', '')}\n"
-        f"Vessel: {email.get('vessel_involved', 'N/A')}\n"
-        f"Category: {email.get('event_category', 'N/A')}\n"
-        f"Body: {email.get('body', email.get('body_preview', ''))}"
-        for i, email in enumerate(relevant_emails)
+        f"Email {i+1} {email['header']} {email['text']}"
+        for i, email in enumerate(context_emails)
     ])
 
     prompt = f"""You are a helpful assistant for a shipyard operations system. Answer the user's question based on the email communications provided.
@@ -166,8 +506,7 @@ User Question: {query}
 
 Provide a clear, concise answer based on the email communications above. Cite specific emails and stakeholders when relevant."""
 
-    # Call Claude
-    request_body = {
+    return {
         "anthropic_version": "bedrock-2023-05-31",
         "max_tokens": 1000,
         "messages": [
@@ -178,9 +517,12 @@ Provide a clear, concise answer based on the email communications above. Cite sp
         ]
     }
 
+
+def generate_response(query, context_emails):
+    """Generate response using Claude with email context"""
     response = bedrock_runtime.invoke_model(
         modelId=BEDROCK_CLAUDE_MODEL_ID,
-        body=json.dumps(request_body)
+        body=json.dumps(claude_request(query, context_emails))
     )
 
     result = json.loads(response['body'].read())
@@ -189,6 +531,180 @@ Provide a clear, concise answer based on the email communications above. Cite sp
     return answer, result.get('usage', {})
 
 
+def format_sources(relevant_emails):
+    """Response sources for the retrieved emails"""
+    return [
+        {
+            'email_id': email['email_id'],
+            'sender': email.get('sender', ''),
+            'sender_role': email.get('sender_role', ''),
+            'subject': email.get('subject', ''),
+            'date': email.get('date', ''),
+            'vessel': email.get('vessel_involved', ''),
+            'event_category': email.get('event_category', ''),
+            'similarity_score': email['similarity_score'],
+            # Present when BM25 took part (hybrid fusion or the keyword fast path)
+            **{key: email[key] for key in ('fusion_score', 'lexical_score') if key in email}
+        }
+        for email in relevant_emails
+    ]
+
+
+def batch_search_email_index(items):
+    """
+    Shared in-memory retrieval for batch items planned as a vector search
+
+    Every question is scored against the whole index in one matrix-matrix
+    product; each keeps the rows its filter bitsets allow.
+    """
+    index = EMAIL_INDEX.get()
+    top_k = max(item['top_k'] for item in items)
+    embeddings = [item['embedding'] for item in items]
+    rows = [index.filter_rows(item['filters']) for item in items]
+    if index.lexical is not None:
+        ranked = index.hybrid_search_many(embeddings, [item['message'] for item in items], top_k, rows)
+    else:
+        ranked = [[(score, row, None) for score, row in hits] for hits in index.search_many(embeddings, top_k, rows)]
+    for item, hits in zip(items, ranked):
+        item['emails'] = [
+            dict(index.meta[row], similarity_score=score, **({'fusion_score': fused} if fused is not None else {}))
+            for score, row, fused in hits[:item['top_k']]
+        ]
+
+
+def answer_batch_item(item, generation):
+    """Response for one retrieved batch question (run on the generation pool)"""
+    if not item['emails']:
+        response_body = {
+            'answer': 'No relevant emails found for your query.',
+            'sources': [],
+            'filters_applied': item['filters']
+        }
+    else:
+        context_emails, context_usage = pack_emails(item['emails'], item['context_tokens'])
+        answer, token_usage = generate_response(item['message'], context_emails)
+        response_body = {
+            'answer': answer,
+            'sources': format_sources(item['emails']),
+            'filters_applied': item['filters'],
+            'token_usage': token_usage,
+            'context_usage': context_usage
+        }
+    ANSWERS.put(item['cache_key'], item['cache_scope'], generation, response_body, item.get('embedding'))
+    return dict(response_body, cached=False)
+
+
+def batch_handler(body, context):
+    """
+    Answer {"queries": [...]} with one index load and one scoring pass
+
+    Questions are embedded concurrently while the index refreshes, scored
+    together, and answered on a bounded pool of Claude calls. Questions
+    whose plan is not a plain vector search (relaxation, key lookups,
+    scans) are retrieved one by one as in a single request.
+    """
+    started_all = time.perf_counter()
+    try:
+        items = batch_items(body, {'top_k': 5, 'context_tokens': CONTEXT_TOKEN_BUDGET})
+    except ValueError as e:
+        return {'statusCode': 400, 'body': json.dumps({'error': str(e)})}
+    timings = []
+
+    # Repeated questions are answered from the cache
+    started = time.perf_counter()
+    generation = ANSWERS.generation()
+    for item in items:
+        item['top_k'] = int(item['top_k'])
+        item['filters'] = extract_query_filters(item['message'])
+        item['cache_scope'] = answer_scope('emails', item['filters'], item['top_k'],
+                                           (BEDROCK_TITAN_EMBED_MODEL_ID, BEDROCK_CLAUDE_MODEL_ID),
+                                           int(item['context_tokens']))
+        item['cache_key'] = answer_key(item['cache_scope'], item['message'])
+        item['response'] = ANSWERS.get(item['cache_key'], generation)
+    pending = [item for item in items if item['response'] is None]
+    timings.append({'stage': 'answer cache', 'hits': len(items) - len(pending),
+                    'ms': round((time.perf_counter() - started) * 1000, 1)})
+
+    def embed(batch):
+        for item, embedding in zip(batch, run_bounded(
+                lambda item: QUERY_EMBEDDINGS.get(item['message'], generate_embedding)[0], batch)):
+            if isinstance(embedding, Exception):
+                item['response'] = {'error': str(embedding)}
+            else:
+                item['embedding'] = embedding
+
+    # Embed the questions concurrently while the index refreshes
+    started = time.perf_counter()
+    load = Prefetch(EMAIL_INDEX.get) if pending and INDEX_CACHE_ENABLED else None
+    for item in pending:
+        item['keyword'] = LEXICAL_FAST_PATH and is_keyword_query(item['message'])
+    embed([item for item in pending if not item['keyword']])
+    embed_ms = round((time.perf_counter() - started) * 1000, 1)
+    timings.append({'stage': 'embed queries', 'queries': sum(1 for item in pending if 'embedding' in item),
+                    'ms': embed_ms})
+    await_load(load, timings, embed_ms, started)
+
+    # Keyword-shaped questions are answered from BM25 when every term matches, else embedded too
+    started = time.perf_counter()
+    keyword = [item for item in pending if item['keyword']]
+    for item in keyword:
+        item['emails'] = lexical_fast_path(item['message'], item['top_k'], item['filters'])
+    embed([item for item in keyword if item['emails'] is None])
+    if keyword:
+        timings.append({'stage': 'lexical fast path', 'queries': len(keyword),
+                        'hits': sum(1 for item in keyword if item['emails'] is not None),
+                        'ms': round((time.perf_counter() - started) * 1000, 1)})
+    to_embed = [item for item in pending if 'embedding' in item]
+
+    # Near-identical questions already answered, then one shared scoring pass
+    started = time.perf_counter()
+    shared, individual = [], []
+    for item in to_embed:
+        item['response'] = ANSWERS.get_similar(item['cache_scope'], item['embedding'], generation)
+        if item['response'] is not None:
+            continue
+        item['plan'] = plan_retrieval(item['filters'], item['top_k'], context)
+        stages = item['plan']['stages']
+        if INDEX_CACHE_ENABLED and len(stages) == 1 and stages[0]['plan'] == 'vector_search':
+            shared.append(item)
+        else:
+            individual.append(item)
+    if shared:
+        batch_search_email_index(shared)
+    for item in shared:
+        # A strict filter that matched nothing relaxes as it would for a single request
+        if not item['emails'] and item['plan']['fallback']:
+            individual.append(item)
+    for item in individual:
+        item['emails'] = retrieve_similar_emails(item['embedding'], top_k=item['top_k'], filters=item['filters'],
+                                                 plan=item['plan'], query_text=item['message'])
+    timings.append({'stage': 'retrieve', 'shared': len(shared), 'individual': len(individual),
+                    'ms': round((time.perf_counter() - started) * 1000, 1)})
+
+    # Claude generations on a bounded pool
+    started = time.perf_counter()
+    answering = [item for item in pending if item['response'] is None]
+    for item, response in zip(answering, run_bounded(lambda item: answer_batch_item(item, generation), answering)):
+        item['response'] = response if not isinstance(response, Exception) else {'error': str(response)}
+    timings.append({'stage': 'generate answers', 'queries': len(answering),
+                    'ms': round((time.perf_counter() - started) * 1000, 1)})
+
+    results = [dict(item['response'], query=item['message']) for item in items]
+    total_ms = round((time.perf_counter() - started_all) * 1000, 1)
+    print(f"[BATCH] {len(items)} queries ({sum(1 for result in results if result.get('cached'))} cached, "
+          f"{len(shared)} shared search, {len(individual)} individual) in {total_ms:.0f} ms")
+    return {
+        'statusCode': 200,
+        'body': json.dumps({
+            'results': results,
+            'token_usage': total_token_usage(results),
+            'failed': sum(1 for result in results if 'error' in result),
+            'timings': timings,
+            'total_ms': total_ms
+        })
+    }
+
+
 def lambda_handler(event, context):
     """Lambda handler for RAG queries"""
     try:
@@ -198,61 +714,121 @@ def lambda_handler(event, context):
         else:
             body = event
 
+        if 'queries' in body:
+            return batch_handler(body, context)
+
         query = body.get('message') or body.get('query')
         top_k = body.get('top_k', 5)
+        explain = bool(body.get('explain', False))
+        # Per-stage timings (including what overlapping embedding and data load saved)
+        debug = bool(body.get('debug', False))
+        # Prompt tokens spent on email bodies and headers
+        context_tokens = int(body.get('context_tokens', CONTEXT_TOKEN_BUDGET))
+        # "stream": true / "ndjson" / "sse" sends sources, answer deltas, then a usage trailer
+        # (only through the response-streaming function URL, see stream_server)
+        stream = stream_format(body.get('stream'))
 
         if not query:
             return {
                 'statusCode': 400,
                 'body': json.dumps({'error': 'No query provided'})
             }
+        if stream and not response_streaming():
+            return {
+                'statusCode': 400,
+                'body': json.dumps({'error': STREAMING_UNAVAILABLE})
+            }
 
-        # Extract filters from query
+        # Extract filters from query and plan the retrieval
+        timings = []
+        started = time.perf_counter()
         filters = extract_query_filters(query)
 
-        # Generate query embedding
-        query_embedding = generate_embedding(query)
-
-        # Retrieve similar emails
-        relevant_emails = retrieve_similar_emails(query_embedding, top_k=top_k, filters=filters)
+        # Repeated questions skip retrieval and generation (explain always runs the plan)
+        cache_scope = answer_scope('emails', filters, top_k, (BEDROCK_TITAN_EMBED_MODEL_ID, BEDROCK_CLAUDE_MODEL_ID),
+                                   context_tokens)
+        cache_key = answer_key(cache_scope, query)
+        generation = None if explain else ANSWERS.generation()
+        cached = ANSWERS.get(cache_key, generation)
+        if cached is not None:
+            return cached_response(cached, stream)
+
+        plan = plan_retrieval(filters, top_k, context)
+        timings.append({'stage': 'plan', 'ms': round((time.perf_counter() - started) * 1000, 1)})
+
+        # Keyword-shaped queries are answered from BM25 without a query embedding
+        started = time.perf_counter()
+        query_embedding = None
+        relevant_emails = lexical_fast_path(query, top_k, filters)
+        if relevant_emails is not None:
+            timings.append({'stage': 'lexical fast path', 'results': len(relevant_emails),
+                            'ms': round((time.perf_counter() - started) * 1000, 1)})
+        else:
+            # Load what the plan scores (index refresh or scan pages) while the query is embedded
+            started = time.perf_counter()
+            load = start_data_load(plan)
+            prefetch = load[1] if isinstance(load, tuple) else load
+            try:
+                # Generate query embedding (or reuse a cached one)
+                query_embedding, embedding_source = QUERY_EMBEDDINGS.get(query, generate_embedding)
+                embed_ms = round((time.perf_counter() - started) * 1000, 1)
+                timings.append({'stage': 'embed query', 'source': embedding_source, 'ms': embed_ms})
+
+                # A near-identical question already answered at this generation
+                cached = ANSWERS.get_similar(cache_scope, query_embedding, generation)
+                if cached is not None:
+                    return cached_response(cached, stream)
+
+                # Retrieve similar emails (vector + BM25 fusion on the in-memory index) once both are ready
+                await_load(prefetch, timings, embed_ms, started)
+                relevant_emails = retrieve_similar_emails(query_embedding, top_k=top_k, filters=filters,
+                                                          plan=plan, timings=timings, query_text=query,
+                                                          prefetched=load if isinstance(load, tuple) else None)
+            finally:
+                # Stops a scan or key-lookup reader that an error or a cache hit left unconsumed
+                cancel_load(prefetch)
 
         if not relevant_emails:
-            return {
-                'statusCode': 200,
-                'body': json.dumps({
-                    'answer': 'No relevant emails found for your query.',
-                    'sources': [],
-                    'filters_applied': filters
-                })
+            response_body = {
+                'answer': 'No relevant emails found for your query.',
+                'sources': [],
+                'filters_applied': filters
             }
+            ANSWERS.put(cache_key, cache_scope, generation, response_body, query_embedding)
+            return cached_response(request_fields(response_body, plan, timings, explain, debug), stream)
 
-        # Generate response
-        answer, token_usage = generate_response(query, relevant_emails)
+        # Format sources (sent before the answer when streaming)
+        sources = format_sources(relevant_emails)
 
-        # Format sources
-        sources = [
-            {
-                'email_id': email['email_id'],
-                'sender': email.get('sender', ''),
-                'sender_role': email.get('sender_role', ''),
-                'subject': email.get('subject', ''),
-                'date': email.get('date', ''),
-                'vessel': email.get('vessel_involved', ''),
-                'event_category': email.get('event_category', ''),
-                'similarity_score': email['similarity_score']
-            }
-            for email in relevant_emails
-        ]
-
-        return {
-            'statusCode': 200,
-            'body': json.dumps({
+        def finish(answer, token_usage, timing):
+            """Cache the complete response; timing is the generate answer stage"""
+            timings.append(dict(timing, stage='generate answer'))
+            response_body = {
                 'answer': answer,
                 'sources': sources,
                 'filters_applied': filters,
-                'token_usage': token_usage
-            })
-        }
+                'token_usage': token_usage,
+                'context_usage': context_usage
+            }
+            ANSWERS.put(cache_key, cache_scope, generation, response_body, query_embedding)
+            return request_fields(response_body, plan, timings, explain, debug)
+
+        # Fill the context budget by marginal relevance, then generate the response
+        context_emails, context_usage = pack_emails(relevant_emails, context_tokens)
+        if stream:
+            deltas = stream_claude(bedrock_runtime, BEDROCK_CLAUDE_MODEL_ID, claude_request(query, context_emails))
+            return streaming_response(answer_events(
+                sources_event({'sources': sources, 'filters_applied': filters}), deltas,
+                lambda answer, timing: trailer_fields(finish(answer, timing['token_usage'], {
+                    'ms': timing['generation_ms'], 'ttft_ms': timing['ttft_ms']
+                }))
+            ), stream)
+
+        started = time.perf_counter()
+        answer, token_usage = generate_response(query, context_emails)
+        response_body = finish(answer, token_usage, {'ms': round((time.perf_counter() - started) * 1000, 1)})
+
+        return cached_response(response_body)
 
     except Exception as e:
         print(f"Error: {str(e)}")
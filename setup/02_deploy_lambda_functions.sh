@@ -40,7 +40,7 @@ deploy_lambda() {
         "helmstream-email-processor")
             DIR_NAME="email_processor"
             ;;
-        "helmstream-rag-engine-emails")
+        "helmstream-rag-engine-emails"|"helmstream-rag-engine-emails-stream")
             DIR_NAME="rag_engine_emails"
             ;;
         *)
@@ -62,8 +62,10 @@ deploy_lambda() {
         echo "  → Dependencies installed"
     fi
 
-    # Copy function code
-    cp handler.py package/
+    # Copy function code and the shared helmstream_common package
+    cp *.py package/
+    cp -r "$SCRIPT_DIR/../lambda/helmstream_common" package/
+    find package/helmstream_common -name '__pycache__' -prune -exec rm -rf {} +
 
     # Create zip file
     cd package
@@ -132,19 +134,142 @@ deploy_lambda() {
 # Create emails DynamoDB table if it doesn't exist
 echo "📊 Creating emails DynamoDB table..."
 EMAILS_TABLE_NAME="helmstream-emails"
+
+# Filter GSIs (hash: filter attribute, range: timestamp); each projects the
+# vector and the other filter attributes so retrieval never reads bodies
+email_filter_index() {
+    local INDEX_NAME=$1
+    local HASH_KEY=$2
+    local OTHERS=$3
+    echo "IndexName=$INDEX_NAME,KeySchema=[{AttributeName=$HASH_KEY,KeyType=HASH},{AttributeName=timestamp,KeyType=RANGE}],Projection={ProjectionType=INCLUDE,NonKeyAttributes=[embedding,embedding_norm,month,$OTHERS]}"
+}
+VESSEL_INDEX=$(email_filter_index vessel-timestamp-index vessel_involved "sender_role,event_category")
+ROLE_INDEX=$(email_filter_index sender-role-timestamp-index sender_role "vessel_involved,event_category")
+CATEGORY_INDEX=$(email_filter_index event-category-timestamp-index event_category "vessel_involved,sender_role")
+# Incremental index refreshes query this one per email type for items past the created_at high-water mark
+CREATED_INDEX="IndexName=email-type-created-index,KeySchema=[{AttributeName=email_type,KeyType=HASH},{AttributeName=created_at,KeyType=RANGE}],Projection={ProjectionType=ALL}"
+EMAIL_ATTRIBUTE_DEFINITIONS="AttributeName=email_id,AttributeType=S AttributeName=timestamp,AttributeType=S AttributeName=vessel_involved,AttributeType=S AttributeName=sender_role,AttributeType=S AttributeName=event_category,AttributeType=S AttributeName=email_type,AttributeType=S AttributeName=created_at,AttributeType=S"
+
 if ! aws dynamodb describe-table --table-name "$EMAILS_TABLE_NAME" --region "$AWS_REGION" &> /dev/null; then
     aws dynamodb create-table \
         --table-name "$EMAILS_TABLE_NAME" \
-        --attribute-definitions \
-            AttributeName=email_id,AttributeType=S \
+        --attribute-definitions $EMAIL_ATTRIBUTE_DEFINITIONS \
         --key-schema \
             AttributeName=email_id,KeyType=HASH \
+        --global-secondary-indexes "$VESSEL_INDEX" "$ROLE_INDEX" "$CATEGORY_INDEX" "$CREATED_INDEX" \
         --billing-mode PAY_PER_REQUEST \
         --region "$AWS_REGION" > /dev/null
 
     echo "✓ Emails table created"
 else
     echo "⚠️  Emails table already exists"
+    # Add any missing index; DynamoDB builds one GSI at a time
+    for SPEC in "$VESSEL_INDEX" "$ROLE_INDEX" "$CATEGORY_INDEX" "$CREATED_INDEX"; do
+        INDEX_NAME=$(echo "$SPEC" | sed 's/^IndexName=\([^,]*\),.*/\1/')
+        EXISTING=$(aws dynamodb describe-table --table-name "$EMAILS_TABLE_NAME" --region "$AWS_REGION" \
+            --query "Table.GlobalSecondaryIndexes[?IndexName=='$INDEX_NAME'].IndexName" --output text)
+        if [ -z "$EXISTING" ] || [ "$EXISTING" == "None" ]; then
+            echo "   Adding $INDEX_NAME (backfills from existing items)..."
+            aws dynamodb update-table \
+                --table-name "$EMAILS_TABLE_NAME" \
+                --attribute-definitions $EMAIL_ATTRIBUTE_DEFINITIONS \
+                --global-secondary-index-updates "Create={$SPEC}" \
+                --region "$AWS_REGION" > /dev/null
+            until [ "$(aws dynamodb describe-table --table-name "$EMAILS_TABLE_NAME" --region "$AWS_REGION" \
+                --query "Table.GlobalSecondaryIndexes[?IndexName=='$INDEX_NAME'].IndexStatus" --output text)" == "ACTIVE" ]; do
+                sleep 10
+            done
+            echo "   ✓ $INDEX_NAME active"
+        fi
+    done
+fi
+echo ""
+
+# Create the planner statistics table if it doesn't exist
+echo "📊 Creating email statistics table..."
+STATS_TABLE_NAME="helmstream-email-stats"
+if ! aws dynamodb describe-table --table-name "$STATS_TABLE_NAME" --region "$AWS_REGION" &> /dev/null; then
+    aws dynamodb create-table \
+        --table-name "$STATS_TABLE_NAME" \
+        --attribute-definitions \
+            AttributeName=dimension,AttributeType=S \
+            AttributeName=value,AttributeType=S \
+        --key-schema \
+            AttributeName=dimension,KeyType=HASH \
+            AttributeName=value,KeyType=RANGE \
+        --billing-mode PAY_PER_REQUEST \
+        --region "$AWS_REGION" > /dev/null
+
+    echo "✓ Statistics table created (counts start with the next ingest)"
+else
+    echo "⚠️  Statistics table already exists"
+fi
+echo ""
+
+# Query embedding cache shared by the RAG engines (entries expire via TTL)
+echo "🧠 Creating query embedding cache table..."
+EMBEDDING_CACHE_TABLE_NAME="helmstream-embedding-cache"
+if ! aws dynamodb describe-table --table-name "$EMBEDDING_CACHE_TABLE_NAME" --region "$AWS_REGION" &> /dev/null; then
+    aws dynamodb create-table \
+        --table-name "$EMBEDDING_CACHE_TABLE_NAME" \
+        --attribute-definitions AttributeName=query_hash,AttributeType=S \
+        --key-schema AttributeName=query_hash,KeyType=HASH \
+        --billing-mode PAY_PER_REQUEST \
+        --region "$AWS_REGION" > /dev/null
+    aws dynamodb wait table-exists --table-name "$EMBEDDING_CACHE_TABLE_NAME" --region "$AWS_REGION"
+    aws dynamodb update-time-to-live \
+        --table-name "$EMBEDDING_CACHE_TABLE_NAME" \
+        --time-to-live-specification "Enabled=true,AttributeName=expires_at" \
+        --region "$AWS_REGION" > /dev/null
+
+    echo "✓ Embedding cache table created (TTL on expires_at)"
+else
+    echo "⚠️  Embedding cache table already exists"
+fi
+echo ""
+
+# RAG answer cache; the processors bump a per-corpus generation item on ingest
+echo "💬 Creating answer cache table..."
+ANSWER_CACHE_TABLE_NAME="helmstream-answer-cache"
+if ! aws dynamodb describe-table --table-name "$ANSWER_CACHE_TABLE_NAME" --region "$AWS_REGION" &> /dev/null; then
+    aws dynamodb create-table \
+        --table-name "$ANSWER_CACHE_TABLE_NAME" \
+        --attribute-definitions AttributeName=cache_key,AttributeType=S \
+        --key-schema AttributeName=cache_key,KeyType=HASH \
+        --billing-mode PAY_PER_REQUEST \
+        --region "$AWS_REGION" > /dev/null
+    aws dynamodb wait table-exists --table-name "$ANSWER_CACHE_TABLE_NAME" --region "$AWS_REGION"
+    aws dynamodb update-time-to-live \
+        --table-name "$ANSWER_CACHE_TABLE_NAME" \
+        --time-to-live-specification "Enabled=true,AttributeName=expires_at" \
+        --region "$AWS_REGION" > /dev/null
+
+    echo "✓ Answer cache table created (TTL on expires_at)"
+else
+    echo "⚠️  Answer cache table already exists"
+fi
+echo ""
+
+# Deletion tombstones; the email processor writes one per retired item so
+# warm RAG indexes drop it on their next refresh
+echo "🪦 Creating tombstone table..."
+TOMBSTONE_TABLE_NAME="helmstream-tombstones"
+if ! aws dynamodb describe-table --table-name "$TOMBSTONE_TABLE_NAME" --region "$AWS_REGION" &> /dev/null; then
+    aws dynamodb create-table \
+        --table-name "$TOMBSTONE_TABLE_NAME" \
+        --attribute-definitions AttributeName=corpus,AttributeType=S AttributeName=deletion,AttributeType=S \
+        --key-schema AttributeName=corpus,KeyType=HASH AttributeName=deletion,KeyType=RANGE \
+        --billing-mode PAY_PER_REQUEST \
+        --region "$AWS_REGION" > /dev/null
+    aws dynamodb wait table-exists --table-name "$TOMBSTONE_TABLE_NAME" --region "$AWS_REGION"
+    aws dynamodb update-time-to-live \
+        --table-name "$TOMBSTONE_TABLE_NAME" \
+        --time-to-live-specification "Enabled=true,AttributeName=expires_at" \
+        --region "$AWS_REGION" > /dev/null
+
+    echo "✓ Tombstone table created (TTL on expires_at)"
+else
+    echo "⚠️  Tombstone table already exists"
 fi
 echo ""
 
@@ -168,6 +293,51 @@ deploy_lambda \
     60 \
     "Stakeholder-aware RAG query engine"
 
+# 3. Streaming RAG engine: the same package served by the Lambda Web Adapter
+# (helmstream_common/stream_server.py) behind a RESPONSE_STREAM function URL,
+# so "stream" requests reach the client event by event
+STREAM_FUNCTION_NAME="helmstream-rag-engine-emails-stream"
+LWA_LAYER_ARN="${LWA_LAYER_ARN:-arn:aws:lambda:$AWS_REGION:753240598075:layer:LambdaAdapterLayerX86:25}"
+deploy_lambda \
+    "$STREAM_FUNCTION_NAME" \
+    "helmstream_common/stream_server.sh" \
+    1024 \
+    60 \
+    "Stakeholder-aware RAG query engine (streamed answers)"
+
+echo "🌊 Configuring response streaming for $STREAM_FUNCTION_NAME..."
+aws lambda wait function-updated --function-name "$STREAM_FUNCTION_NAME" --region "$AWS_REGION"
+aws lambda update-function-configuration \
+    --function-name "$STREAM_FUNCTION_NAME" \
+    --layers "$LWA_LAYER_ARN" \
+    --environment "Variables={
+        DYNAMODB_TABLE_NAME=helmstream-emails,
+        S3_BUCKET_NAME=$S3_BUCKET_NAME,
+        BEDROCK_CLAUDE_MODEL_ID=$BEDROCK_CLAUDE_MODEL_ID,
+        BEDROCK_TITAN_EMBED_MODEL_ID=$BEDROCK_TITAN_EMBED_MODEL_ID,
+        AWS_LAMBDA_EXEC_WRAPPER=/opt/bootstrap,
+        AWS_LWA_INVOKE_MODE=response_stream,
+        AWS_LWA_PORT=8080
+    }" \
+    --region "$AWS_REGION" > /dev/null
+
+if aws lambda get-function-url-config --function-name "$STREAM_FUNCTION_NAME" --region "$AWS_REGION" &> /dev/null; then
+    aws lambda update-function-url-config \
+        --function-name "$STREAM_FUNCTION_NAME" \
+        --invoke-mode RESPONSE_STREAM \
+        --region "$AWS_REGION" > /dev/null
+else
+    aws lambda create-function-url-config \
+        --function-name "$STREAM_FUNCTION_NAME" \
+        --auth-type AWS_IAM \
+        --invoke-mode RESPONSE_STREAM \
+        --region "$AWS_REGION" > /dev/null
+fi
+STREAM_URL=$(aws lambda get-function-url-config --function-name "$STREAM_FUNCTION_NAME" \
+    --region "$AWS_REGION" --query 'FunctionUrl' --output text)
+echo "✓ Streaming URL (IAM auth): $STREAM_URL"
+echo ""
+
 # Test Lambda functions
 echo "🧪 Testing Lambda functions..."
 echo ""
@@ -203,6 +373,7 @@ echo "============================================"
 echo "Lambda functions deployed:"
 echo "  • helmstream-email-processor (1024MB, 300s timeout)"
 echo "  • helmstream-rag-engine-emails (1024MB, 60s timeout)"
+echo "  • $STREAM_FUNCTION_NAME (1024MB, 60s timeout, streaming URL: $STREAM_URL)"
 echo ""
 echo "DynamoDB table created:"
 echo "  • $EMAILS_TABLE_NAME"
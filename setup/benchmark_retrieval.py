@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+HelmStream - Retrieval Benchmark
+Recall@k versus latency of the approximate indexes (IVF and int8/1-bit
+quantized) against exact search, plus quantized memory and throughput
+
+Runs offline against a synthetic clustered corpus, or against the rows of a
+published index snapshot (see build_index_snapshot.py). Requires NumPy.
+
+Usage:
+    python3 benchmark_retrieval.py                          # 100k x 768 synthetic rows
+    python3 benchmark_retrieval.py --rows 20000 --nprobe 4,8,16
+    python3 benchmark_retrieval.py --snapshot /tmp/helmstream-index/20250101T000000Z.hsix --corpus emails
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+from helmstream_common.ann import IVFIndex  # noqa: E402
+from helmstream_common.quantized import QuantizedIndex  # noqa: E402
+from helmstream_common.scan import TopK  # noqa: E402
+from helmstream_common.similarity import build_matrix_from_rows  # noqa: E402
+from helmstream_common.snapshot import Snapshot  # noqa: E402
+
+
+def synthetic_corpus(rows, dim, clusters, spread, queries, seed):
+    """Gaussian topic clusters; spread sets how much neighbours cross cluster boundaries"""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, rows + queries)
+    vectors = centres[labels] + spread * rng.standard_normal((rows + queries, dim)).astype(np.float32)
+    return vectors[:rows], vectors[rows:]
+
+
+def snapshot_corpus(path, corpus, queries, seed):
+    """Snapshot rows as the corpus; queries are perturbed copies of random rows"""
+    snapshot = Snapshot(path)
+    vectors = np.array(snapshot.matrix(corpus), dtype=np.float32).reshape(-1, snapshot.dim)
+    rng = np.random.default_rng(seed)
+    picks = vectors[rng.integers(0, len(vectors), queries)]
+    noise = rng.standard_normal(picks.shape).astype(np.float32) * picks.std() * 0.3
+    return vectors, picks + noise
+
+
+def exact_search(matrix, query, top_k):
+    top = TopK(top_k)
+    top.extend(matrix.scores(query), range(len(matrix)))
+    return top.results()
+
+
+def timed(fn, queries):
+    """Per-query results and latencies in ms"""
+    results, latencies = [], []
+    for query in queries:
+        started = time.perf_counter()
+        results.append(fn(query))
+        latencies.append((time.perf_counter() - started) * 1000)
+    return results, latencies
+
+
+def recall(results, truth):
+    hits = sum(len({row for _, row in got} & {row for _, row in want}) for got, want in zip(results, truth))
+    return hits / max(1, sum(len(want) for want in truth))
+
+
+def report(label, latencies, recall_at_k, extra=''):
+    latencies = sorted(latencies)
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    print(f"{label:<28} {recall_at_k:>9.3f} {statistics.median(latencies):>9.2f} {p95:>9.2f}  {extra}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark approximate retrieval against exact search')
+    parser.add_argument('--rows', type=int, default=100000, help='Synthetic corpus size')
+    parser.add_argument('--dim', type=int, default=768, help='Synthetic embedding dimension (Titan v1 is 768)')
+    parser.add_argument('--clusters', type=int, default=500, help='Synthetic topic clusters')
+    parser.add_argument('--spread', type=float, default=2.0, help='Within-cluster noise (higher is harder)')
+    parser.add_argument('--snapshot', help='Benchmark the rows of this snapshot file instead')
+    parser.add_argument('--corpus', default='emails', help='Corpus inside --snapshot')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--top-k', type=int, default=5)
+    parser.add_argument('--nprobe', default='4,8,16,32', help='Comma-separated IVF nprobe values')
+    parser.add_argument('--nlist', type=int, default=0, help='IVF lists (0 = sqrt(rows))')
+    parser.add_argument('--shortlist', default='500,2000,8000',
+                        help='Comma-separated sign-bit shortlist sizes for the quantized index')
+    parser.add_argument('--rescore', type=int, default=100, help='Rows re-scored exactly after int8 re-ranking')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    if args.snapshot:
+        corpus, queries = snapshot_corpus(args.snapshot, args.corpus, args.queries, args.seed)
+        source = f"{args.snapshot} [{args.corpus}]"
+    else:
+        corpus, queries = synthetic_corpus(args.rows, args.dim, args.clusters, args.spread, args.queries, args.seed)
+        source = f"synthetic, {args.clusters} clusters, spread {args.spread}"
+    queries = [q.tolist() for q in queries]
+    matrix = build_matrix_from_rows(corpus, len(corpus), corpus.shape[1], backend='numpy')
+
+    print("=" * 72)
+    print("HelmStream - Retrieval Benchmark")
+    print("=" * 72)
+    print(f"Corpus: {len(corpus):,} x {corpus.shape[1]} ({source})")
+    print(f"Queries: {len(queries)}, top_k={args.top_k}")
+
+    truth, exact_latencies = timed(lambda q: exact_search(matrix, q, args.top_k), queries)
+
+    ann = IVFIndex(nlist=args.nlist, min_rows=0, seed=args.seed)
+    started = time.perf_counter()
+    ann.build(matrix)
+    print(f"IVF build: {len(ann.lists)} lists in {time.perf_counter() - started:.1f}s\n")
+
+    print(f"{'method':<28} {'recall@k':>9} {'p50 ms':>9} {'p95 ms':>9}  candidates")
+    print("-" * 72)
+    report('exact', exact_latencies, 1.0, f"{len(corpus):,}")
+    for nprobe in [int(n) for n in args.nprobe.split(',')]:
+        ann.nprobe = nprobe
+        ann.counters.update(ann_searches=0, candidates_total=0)
+        results, latencies = timed(lambda q: ann.search(matrix, q, args.top_k) or [], queries)
+        report(f"ivf nprobe={nprobe}", latencies, recall(results, truth),
+               f"{ann.stats()['mean_candidates']:,.0f}")
+
+    quantized = QuantizedIndex(rescore_candidates=args.rescore, min_rows=0)
+    quantized.build(matrix)
+    for shortlist in [int(n) for n in args.shortlist.split(',')]:
+        quantized.binary_candidates = shortlist
+        results, latencies = timed(lambda q: quantized.search(matrix, q, args.top_k) or [], queries)
+        report(f"int8+1bit shortlist={shortlist}", latencies, recall(results, truth),
+               f"{shortlist:,} -> {args.rescore}")
+
+    # Candidate generation alone: the sign-bit Hamming scan over every row
+    started = time.perf_counter()
+    for query in queries:
+        quantized.shortlist(query)
+    scan_seconds = time.perf_counter() - started
+    float_bytes = corpus.shape[1] * 4
+    code_bytes = quantized.bytes_per_vector()
+    print(f"\nMemory per vector: float32 {float_bytes:,} B, int8 {corpus.shape[1]:,} B, "
+          f"1-bit {(corpus.shape[1] + 7) // 8} B (quantized index holds {code_bytes:,} B, "
+          f"{float_bytes / code_bytes:.1f}x smaller)")
+    print(f"Hamming prefilter: {len(corpus) * len(queries) / scan_seconds / 1e6:,.1f}M vectors/s")
+    print(f"Vectors per 512 MB of codes: {512 * 2**20 // code_bytes:,} (float32: {512 * 2**20 // float_bytes:,})")
+    print()
+
+
+if __name__ == '__main__':
+    main()
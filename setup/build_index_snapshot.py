@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+HelmStream - Index Snapshot Build
+Scans the embedding tables once, writes a memory-mappable snapshot and
+publishes it behind the manifest that the RAG Lambdas read on cold start
+
+Usage:
+    python3 build_index_snapshot.py                          # s3://$S3_BUCKET_NAME/index
+    python3 build_index_snapshot.py --uri /var/lib/helmstream/index
+    python3 build_index_snapshot.py --corpus emails
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import boto3
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+from helmstream_common.embedding_codec import decode_embedding  # noqa: E402
+from helmstream_common.lexical import build_postings, item_terms  # noqa: E402
+from helmstream_common.scan import ScanStats, scan_pages  # noqa: E402
+from helmstream_common.snapshot import open_store, publish_snapshot, write_snapshot  # noqa: E402
+
+# Corpus name (as used by the RAG handlers) -> (table, key attribute, BM25 text fields)
+CORPORA = {
+    'documents': ('helmstream-documents', 'document_id', ('title', 'text_preview')),
+    'emails': ('helmstream-emails', 'email_id', ('subject', 'body'))
+}
+
+
+# Load configuration
+def load_config():
+    """Load configuration from .env file"""
+    config = {}
+    env_file = os.path.join(os.path.dirname(__file__), '..', '.env')
+
+    if not os.path.exists(env_file):
+        print("❌ Configuration file not found. Run ./01_setup_aws_resources.sh first")
+        sys.exit(1)
+
+    with open(env_file, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#') and '=' in line:
+                key, value = line.split('=', 1)
+                config[key] = value
+
+    return config
+
+
+def collect_corpus(table, key, fields, segments):
+    """
+    Every item in a table as (id, vector, metadata) rows, plus the
+    created_at high-water mark and BM25 postings over the text fields
+    """
+    stats = ScanStats(segments)
+    rows = []
+    terms = {}
+    high_water_mark = None
+    for page in scan_pages(table, segments, segments, stats):
+        for item in page:
+            vector = decode_embedding(item.get('embedding'))
+            terms[item[key]] = item_terms(item, fields)
+            metadata = {k: v for k, v in item.items() if k not in ('embedding', 'lexical_terms')}
+            rows.append((item[key], vector, metadata))
+            created_at = item.get('created_at')
+            if created_at and (high_water_mark is None or created_at > high_water_mark):
+                high_water_mark = created_at
+
+    # Stable row order makes successive snapshots easy to diff
+    rows.sort(key=lambda row: str(row[0]))
+    lexical = build_postings([terms[row[0]][0] for row in rows], [terms[row[0]][1] for row in rows])
+    return {'key': key, 'rows': rows, 'high_water_mark': high_water_mark, 'lexical': lexical}, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build and publish an embedding index snapshot')
+    parser.add_argument('--uri', help='Snapshot location: s3://bucket/prefix or a local directory '
+                                      '(default s3://$S3_BUCKET_NAME/index)')
+    parser.add_argument('--corpus', action='append', choices=sorted(CORPORA), help='Corpus to include (repeatable)')
+    parser.add_argument('--segments', type=int, default=4, help='Parallel scan segments')
+    args = parser.parse_args()
+
+    config = load_config()
+    region = config.get('AWS_REGION', 'us-east-1')
+    uri = args.uri or f"s3://{config['S3_BUCKET_NAME']}/index"
+    dynamodb = boto3.resource('dynamodb', region_name=region)
+
+    print("=" * 60)
+    print("HelmStream - Index Snapshot Build")
+    print("=" * 60)
+    print(f"Region: {region}")
+    print(f"Target: {uri}")
+
+    corpora = {}
+    for name in args.corpus or sorted(CORPORA):
+        table_name, key, fields = CORPORA[name]
+        print(f"\n📦 Scanning {table_name}...")
+        corpora[name], stats = collect_corpus(dynamodb.Table(table_name), key, fields, args.segments)
+        print(f"   ✓ {len(corpora[name]['rows'])} rows, high-water mark {corpora[name]['high_water_mark']}")
+        print(f"   ✓ {len(corpora[name]['lexical']['terms'])} distinct terms")
+        print(f"   ✓ Scan: {stats}")
+
+    fd, path = tempfile.mkstemp(suffix='.hsix')
+    os.close(fd)
+    try:
+        started = time.time()
+        directory = write_snapshot(path, corpora)
+        print(f"\n💾 Wrote snapshot {directory['snapshot_version']}: {directory['count']} rows x "
+              f"{directory['dim']} dims, {os.path.getsize(path):,} bytes ({time.time() - started:.1f}s)")
+
+        manifest = publish_snapshot(open_store(uri, boto3.client('s3', region_name=region)), path, directory)
+        print(f"   ✓ Published {manifest['key']} (sha256 {manifest['sha256'][:12]}...)")
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+    print(f"\n{'='*60}")
+    print("✅ SNAPSHOT PUBLISHED")
+    print(f"{'='*60}\n")
+
+
+if __name__ == '__main__':
+    main()
@@ -71,6 +71,7 @@ def ingest_csv_emails(csv_path, lambda_client, function_name):
     # Process emails in batches to reduce Lambda invocations
     batch_size = 10
     processed = 0
+    unchanged = 0
     failed = 0
 
     for i in range(0, len(emails), batch_size):
@@ -93,8 +94,10 @@ def ingest_csv_emails(csv_path, lambda_client, function_name):
             if result['statusCode'] == 200:
                 body = json.loads(result['body'])
                 batch_processed = body.get('emails_processed', 0)
+                batch_unchanged = body.get('emails_unchanged', 0)
                 processed += batch_processed
-                print(f"   ✓ Batch processed: {batch_processed} emails")
+                unchanged += batch_unchanged
+                print(f"   ✓ Batch processed: {batch_processed} emails ({batch_unchanged} unchanged, skipped)")
 
                 # Show sample email IDs
                 if 'results' in body and body['results']:
@@ -113,6 +116,7 @@ def ingest_csv_emails(csv_path, lambda_client, function_name):
     print(f"{'='*60}")
     print(f"Total emails: {len(emails)}")
     print(f"Processed: {processed}")
+    print(f"Unchanged (not re-embedded): {unchanged}")
     print(f"Failed: {failed}")
     print(f"{'='*60}\n")
 
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+HelmStream - Embedding Storage Migration
+Rewrites legacy List-of-Decimal embeddings in place as packed Binary blobs,
+and with --normalize backfills unit-length vectors plus embedding_norm
+
+Usage:
+    python3 migrate_embeddings.py                      # both tables, float32
+    python3 migrate_embeddings.py --table helmstream-emails --format float16
+    python3 migrate_embeddings.py --normalize          # also normalize packed rows
+    python3 migrate_embeddings.py --dry-run
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import boto3
+from botocore.exceptions import ClientError
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+from helmstream_common.embedding_codec import (  # noqa: E402
+    decode_embedding, embedding_attributes, embedding_size_bytes, is_normalized, is_packed
+)
+from helmstream_common.scan import ScanStats, scan_pages  # noqa: E402
+
+DEFAULT_TABLES = ['helmstream-documents', 'helmstream-emails']
+
+
+# Load configuration
+def load_config():
+    """Load configuration from .env file"""
+    config = {}
+    env_file = os.path.join(os.path.dirname(__file__), '..', '.env')
+
+    if not os.path.exists(env_file):
+        print("❌ Configuration file not found. Run ./01_setup_aws_resources.sh first")
+        sys.exit(1)
+
+    with open(env_file, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#') and '=' in line:
+                key, value = line.split('=', 1)
+                config[key] = value
+
+    return config
+
+
+def migrate_table(table, storage_format, segments, dry_run, normalize=False):
+    """Rewrite every legacy (or, with normalize, un-normalized) embedding in one table"""
+    key_names = [k['AttributeName'] for k in table.key_schema]
+    projection = ', '.join(f'#k{i}' for i in range(len(key_names))) + ', embedding, embedding_norm'
+    names = {f'#k{i}': name for i, name in enumerate(key_names)}
+
+    stats = ScanStats(segments)
+    migrated = skipped = failed = 0
+    bytes_before = bytes_after = 0
+
+    for page in scan_pages(table, segments, segments, stats,
+                           ProjectionExpression=projection, ExpressionAttributeNames=names):
+        for item in page:
+            embedding = item.get('embedding')
+            legacy = embedding is not None and not is_packed(embedding)
+            if not legacy and not (normalize and embedding is not None and not is_normalized(item)):
+                skipped += 1
+                continue
+
+            attributes = embedding_attributes(list(decode_embedding(embedding)), storage_format, normalize)
+            bytes_before += embedding_size_bytes(embedding)
+            bytes_after += embedding_size_bytes(attributes['embedding'])
+            if dry_run:
+                migrated += 1
+                continue
+
+            try:
+                # Only overwrite rows still in the state we read, so a
+                # concurrent re-ingest is never clobbered
+                if 'embedding_norm' in attributes:
+                    update = 'SET embedding = :packed, embedding_norm = :norm'
+                    condition = 'attribute_not_exists(embedding_norm)'
+                    values = {':packed': attributes['embedding'], ':norm': attributes['embedding_norm']}
+                else:
+                    update = 'SET embedding = :packed'
+                    condition = 'attribute_type(embedding, :list)'
+                    values = {':packed': attributes['embedding'], ':list': 'L'}
+                table.update_item(
+                    Key={name: item[name] for name in key_names},
+                    UpdateExpression=update,
+                    ConditionExpression=condition,
+                    ExpressionAttributeValues=values
+                )
+                migrated += 1
+            except ClientError as e:
+                if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                    skipped += 1
+                else:
+                    print(f"   ❌ {item.get(key_names[0])}: {str(e)}")
+                    failed += 1
+
+    return {
+        'migrated': migrated,
+        'skipped': skipped,
+        'failed': failed,
+        'bytes_before': bytes_before,
+        'bytes_after': bytes_after,
+        'scan': stats.as_dict()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pack legacy embeddings into Binary attributes')
+    parser.add_argument('--table', action='append', help='Table to migrate (repeatable)')
+    parser.add_argument('--format', default='float32', choices=['float32', 'float16'])
+    parser.add_argument('--segments', type=int, default=4, help='Parallel scan segments')
+    parser.add_argument('--normalize', action='store_true',
+                        help='Also store unit-length vectors plus embedding_norm (backfills packed rows too)')
+    parser.add_argument('--dry-run', action='store_true', help='Report savings without writing')
+    args = parser.parse_args()
+
+    config = load_config()
+    region = config.get('AWS_REGION', 'us-east-1')
+    dynamodb = boto3.resource('dynamodb', region_name=region)
+
+    print("=" * 60)
+    print("HelmStream - Embedding Storage Migration")
+    print("=" * 60)
+    print(f"Region: {region}")
+    print(f"Format: {args.format}{', normalized' if args.normalize else ''}{' (dry run)' if args.dry_run else ''}")
+
+    for table_name in args.table or DEFAULT_TABLES:
+        print(f"\n📦 Migrating {table_name}...")
+        started = time.time()
+        result = migrate_table(dynamodb.Table(table_name), args.format, args.segments, args.dry_run, args.normalize)
+        saved = result['bytes_before'] - result['bytes_after']
+        print(f"   ✓ Migrated: {result['migrated']}  Skipped: {result['skipped']}  Failed: {result['failed']}")
+        print(f"   ✓ Embedding bytes: {result['bytes_before']:,} → {result['bytes_after']:,} (saved {saved:,})")
+        print(f"   ✓ Scan: {result['scan']['pages']} pages, {result['scan']['consumed_capacity']} RCU, "
+              f"{time.time() - started:.1f}s")
+
+    print(f"\n{'='*60}")
+    print("✅ MIGRATION COMPLETE")
+    print(f"{'='*60}\n")
+
+
+if __name__ == '__main__':
+    main()
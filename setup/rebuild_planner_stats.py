@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+HelmStream - Planner Statistics Rebuild
+Recounts emails per filter value and rewrites the statistics table read by
+the email RAG engine's query planner. The email processor keeps the counts
+current from then on; run this once after creating the table, or again if
+the counts drift (e.g. after deleting emails by hand). Pause ingestion
+while it runs, since rewritten counts would overwrite concurrent updates.
+
+Usage:
+    python3 rebuild_planner_stats.py
+    python3 rebuild_planner_stats.py --dry-run
+"""
+
+import argparse
+import os
+import sys
+
+import boto3
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+from helmstream_common.planner import TOTAL_DIMENSION, stat_deltas  # noqa: E402
+from helmstream_common.scan import ScanStats, scan_pages  # noqa: E402
+
+EMAILS_TABLE_NAME = 'helmstream-emails'
+STATS_TABLE_NAME = 'helmstream-email-stats'
+
+# Must match STAT_DIMENSIONS in lambda/email_processor/handler.py
+STAT_DIMENSIONS = {
+    'vessel': 'vessel_involved',
+    'sender_role': 'sender_role',
+    'month': 'month',
+    'event_category': 'event_category'
+}
+
+
+# Load configuration
+def load_config():
+    """Load configuration from .env file"""
+    config = {}
+    env_file = os.path.join(os.path.dirname(__file__), '..', '.env')
+
+    if not os.path.exists(env_file):
+        print("❌ Configuration file not found. Run ./01_setup_aws_resources.sh first")
+        sys.exit(1)
+
+    with open(env_file, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#') and '=' in line:
+                key, value = line.split('=', 1)
+                config[key] = value
+
+    return config
+
+
+def count_values(table, segments):
+    """{(dimension, value): emails} over the whole table, plus the scan stats"""
+    stats = ScanStats(segments)
+    counts = {}
+    projection = ', '.join(f"#a{i}" for i in range(len(STAT_DIMENSIONS)))
+    names = {f"#a{i}": attribute for i, attribute in enumerate(STAT_DIMENSIONS.values())}
+    for page in scan_pages(table, segments, segments, stats,
+                           ProjectionExpression=projection, ExpressionAttributeNames=names):
+        for item in page:
+            for key, change in stat_deltas(None, item, STAT_DIMENSIONS).items():
+                counts[key] = counts.get(key, 0) + change
+    return counts, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rebuild the email query planner statistics')
+    parser.add_argument('--segments', type=int, default=4, help='Parallel scan segments')
+    parser.add_argument('--dry-run', action='store_true', help='Print the counts without writing them')
+    args = parser.parse_args()
+
+    config = load_config()
+    region = config.get('AWS_REGION', 'us-east-1')
+    dynamodb = boto3.resource('dynamodb', region_name=region)
+
+    print("=" * 60)
+    print("HelmStream - Planner Statistics Rebuild")
+    print("=" * 60)
+    print(f"Region: {region}")
+
+    print(f"\n📊 Counting {EMAILS_TABLE_NAME}...")
+    counts, stats = count_values(dynamodb.Table(EMAILS_TABLE_NAME), args.segments)
+    print(f"   ✓ Scan: {stats}")
+    print(f"   ✓ {counts.get((TOTAL_DIMENSION, TOTAL_DIMENSION), 0)} emails, {len(counts) - 1} distinct values")
+    for (dimension, value), count in sorted(counts.items()):
+        if dimension != TOTAL_DIMENSION:
+            print(f"     {dimension:15} {value:30} {count}")
+
+    if args.dry_run:
+        print("\n(dry run, nothing written)")
+        return
+
+    stats_table = dynamodb.Table(STATS_TABLE_NAME)
+    existing = []
+    kwargs = {'ProjectionExpression': '#d, #v', 'ExpressionAttributeNames': {'#d': 'dimension', '#v': 'value'}}
+    while True:
+        response = stats_table.scan(**kwargs)
+        existing.extend((item['dimension'], item['value']) for item in response.get('Items', []))
+        if 'LastEvaluatedKey' not in response:
+            break
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    with stats_table.batch_writer() as batch:
+        for (dimension, value), count in counts.items():
+            batch.put_item(Item={'dimension': dimension, 'value': value, 'item_count': count})
+        stale = [key for key in existing if key not in counts]
+        for dimension, value in stale:
+            batch.delete_item(Key={'dimension': dimension, 'value': value})
+
+    print(f"\n💾 Wrote {len(counts)} counts to {STATS_TABLE_NAME}, removed {len(stale)} stale rows")
+    print(f"\n{'='*60}")
+    print("✅ PLANNER STATISTICS REBUILT")
+    print(f"{'='*60}\n")
+
+
+if __name__ == '__main__':
+    main()
@@ -4,6 +4,7 @@ HelmStream - Shipyard Query Test Script
 Tests RAG system with realistic shipyard operation queries from rag-query-reference.md
 """
 
+import argparse
 import json
 import boto3
 import sys
@@ -181,8 +182,48 @@ def test_query(lambda_client, function_name, query_data):
         return False
 
 
+def test_batch(lambda_client, function_name):
+    """Send every query in one batch request and print each answer"""
+    print(f"\n{'='*60}")
+    print(f"📦 Batch of {len(TEST_QUERIES)} queries")
+    print('='*60)
+
+    response = lambda_client.invoke(
+        FunctionName=function_name,
+        InvocationType='RequestResponse',
+        Payload=json.dumps({
+            'queries': [query_data['query'] for query_data in TEST_QUERIES],
+            'top_k': 5
+        })
+    )
+    result = json.loads(response['Payload'].read())
+    if result['statusCode'] != 200:
+        print(f"\n❌ Error: {result.get('body', 'Unknown error')}")
+        return 0, len(TEST_QUERIES)
+
+    body = json.loads(result['body'])
+    for query_data, answer in zip(TEST_QUERIES, body['results']):
+        print(f"\n🔍 [{query_data['category']}] {answer['query']}")
+        if 'error' in answer:
+            print(f"❌ Error: {answer['error']}")
+            continue
+        cached = ' (cached)' if answer.get('cached') else ''
+        print(f"💬 {answer['answer'][:300]}{cached}")
+        print(f"📚 {len(answer.get('sources', []))} sources")
+
+    tokens = body['token_usage']
+    cost_estimate = (tokens['input_tokens'] / 1000000 * 3) + (tokens['output_tokens'] / 1000000 * 15)
+    print(f"\n💰 Tokens: {tokens['input_tokens']} in, {tokens['output_tokens']} out (≈${cost_estimate:.4f})")
+    print(f"⏱  {body['total_ms']:.0f} ms: " + ', '.join(f"{t['stage']} {t.get('ms', 0):.0f} ms" for t in body['timings']))
+    return len(TEST_QUERIES) - body['failed'], body['failed']
+
+
 def main():
     """Main test function"""
+    parser = argparse.ArgumentParser(description='Run the shipyard test queries against the email RAG engine')
+    parser.add_argument('--batch', action='store_true', help='Send all queries in one batch request')
+    args = parser.parse_args()
+
     print("="*60)
     print("HelmStream - Shipyard Query Test Suite")
     print("="*60)
@@ -206,7 +247,10 @@ def main():
     passed = 0
     failed = 0
 
-    for i, query_data in enumerate(TEST_QUERIES, 1):
+    if args.batch:
+        passed, failed = test_batch(lambda_client, rag_engine)
+
+    for i, query_data in enumerate([] if args.batch else TEST_QUERIES, 1):
         print(f"\n\n{'#'*60}")
         print(f"Query {i}/{len(TEST_QUERIES)}")
         print(f"{'#'*60}")